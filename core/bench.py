@@ -0,0 +1,357 @@
+# === File: core/bench.py ===
+"""
+YCSB-style benchmark harness for ShardManager.
+
+    python3 -m core.bench --workload b --records 1000000 --operations 200000 --threads 8 --output b.json
+    python3 -m core.bench --workload b --baseline b.json          # exit 1 on regression
+    python3 -m core.bench --index-memory 1000000                  # index bytes per key
+
+Runs a load phase (put_many) and a timed run phase, and prints a JSON
+report with throughput and p50/p99/p999 latency per operation type.
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from core.metrics import LatencyHistogram
+
+# Proporsi operasi per workload (YCSB core workloads + write-heavy)
+WORKLOADS = {
+    "a": {"read": 0.5, "update": 0.5},                  # update heavy
+    "b": {"read": 0.95, "update": 0.05},                # read mostly
+    "c": {"read": 1.0},                                 # read only
+    "d": {"read": 0.95, "insert": 0.05},                # read latest
+    "e": {"scan": 0.95, "insert": 0.05},                # short ranges
+    "f": {"read": 0.5, "read_modify_write": 0.5},
+    "w": {"read": 0.05, "update": 0.95},                # write heavy
+}
+DEFAULT_DISTRIBUTION = {"d": "latest"}
+DISTRIBUTIONS = ("zipfian", "uniform", "latest")
+MAX_SCAN_LENGTH = 100
+LOAD_BATCH = 1000
+
+_FNV_OFFSET = 0xCBF29CE484222325
+_FNV_PRIME = 0x100000001B3
+_M64 = (1 << 64) - 1
+
+
+def fnv64(n):
+    """FNV-1a 64-bit atas 8 byte angka, untuk mengacak rank zipfian ke seluruh keyspace."""
+    h = _FNV_OFFSET
+    for _ in range(8):
+        h = ((h ^ (n & 0xFF)) * _FNV_PRIME) & _M64
+        n >>= 8
+    return h
+
+
+class ZipfianGenerator:
+    """
+    Zipfian ranks in [0, items) (Gray et al., as used by YCSB): rank 0 is the
+    most popular. zeta(items) is computed once, O(items).
+    """
+
+    def __init__(self, items, theta=0.99):
+        self.items = items
+        self.theta = theta
+        self.zetan = sum(i ** -theta for i in range(1, items + 1))
+        zeta2 = 1 + 2 ** -theta
+        self.alpha = 1 / (1 - theta)
+        self.eta = (1 - (2 / items) ** (1 - theta)) / (1 - zeta2 / self.zetan)
+
+    def next(self, rnd):
+        u = rnd.random()
+        uz = u * self.zetan
+        if uz < 1:
+            return 0
+        if uz < 1 + 0.5 ** self.theta:
+            return 1
+        return min(self.items - 1, int(self.items * (self.eta * u - self.eta + 1) ** self.alpha))
+
+
+def record_key(n):
+    return f"user{n:012d}"
+
+
+def make_value(n, value_size, rnd):
+    return {"name": "".join(rnd.choices("abcdefghijklmnopqrstuvwxyz", k=value_size)), "age": n % 100}
+
+
+class Workload:
+    """Operasi dan key berikutnya untuk satu thread; key baru (insert) dibagi lewat counter bersama."""
+
+    def __init__(self, mix, distribution, records, inserted, zipf):
+        self.ops = list(mix)
+        self.weights = [mix[op] for op in self.ops]
+        self.distribution = distribution
+        self.records = records
+        self.inserted = inserted  # [jumlah record saat ini], dinaikkan oleh insert
+        self.zipf = zipf
+        self._next_insert = itertools.count(records)
+        self._lock = threading.Lock()
+
+    def next_op(self, rnd):
+        return rnd.choices(self.ops, self.weights)[0]
+
+    def next_key(self, rnd):
+        count = self.inserted[0]
+        if self.distribution == "uniform":
+            return record_key(rnd.randrange(count))
+        if self.distribution == "latest":
+            # Record terbaru paling populer
+            return record_key(max(0, count - 1 - self.zipf.next(rnd)))
+        return record_key(fnv64(self.zipf.next(rnd)) % self.records)
+
+    def insert_key(self):
+        with self._lock:
+            n = next(self._next_insert)
+            self.inserted[0] = max(self.inserted[0], n + 1)
+        return n
+
+
+def load(store, records, value_size, seed):
+    rnd = random.Random(seed)
+    started = time.perf_counter()
+    for start in range(0, records, LOAD_BATCH):
+        store.put_many([(record_key(n), make_value(n, value_size, rnd))
+                        for n in range(start, min(records, start + LOAD_BATCH))])
+    elapsed = time.perf_counter() - started
+    return {"records": records, "seconds": elapsed, "throughput": records / elapsed if elapsed else None}
+
+
+def run(store, workload, operations, threads, value_size, seed, duration=None):
+    """Jalankan `operations` operasi (atau selama `duration` detik) terbagi ke `threads` thread."""
+    histograms = [{} for _ in range(threads)]
+    errors = []
+    remaining = itertools.count()
+    deadline = None if duration is None else time.monotonic() + duration
+
+    def worker(tid):
+        rnd = random.Random(seed * 1000 + tid)
+        local = histograms[tid]
+        while True:
+            if deadline is not None:
+                if time.monotonic() >= deadline:
+                    return
+            elif next(remaining) >= operations:
+                return
+            op = workload.next_op(rnd)
+            start = time.perf_counter()
+            try:
+                if op == "read":
+                    store.get(workload.next_key(rnd))
+                elif op == "update":
+                    key = workload.next_key(rnd)
+                    store.put(key, make_value(0, value_size, rnd))
+                elif op == "insert":
+                    n = workload.insert_key()
+                    store.put(record_key(n), make_value(n, value_size, rnd))
+                elif op == "scan":
+                    for _ in store.scan(workload.next_key(rnd), limit=rnd.randint(1, MAX_SCAN_LENGTH)):
+                        pass
+                elif op == "read_modify_write":
+                    key = workload.next_key(rnd)
+                    value = store.get(key) or make_value(0, value_size, rnd)
+                    value["age"] = (value.get("age", 0) + 1) % 100
+                    store.put(key, value)
+            except Exception as e:
+                errors.append(f"{op}: {e}")
+                continue
+            histogram = local.get(op)
+            if histogram is None:
+                histogram = local[op] = LatencyHistogram()
+            histogram.record(time.perf_counter() - start)
+
+    pool = [threading.Thread(target=worker, args=(tid,)) for tid in range(threads)]
+    started = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    merged = {}
+    for local in histograms:
+        for op, histogram in local.items():
+            merged.setdefault(op, LatencyHistogram()).merge(histogram)
+    total = sum(histogram.count for histogram in merged.values())
+    return {
+        "operations": total,
+        "seconds": elapsed,
+        "throughput": total / elapsed if elapsed else None,
+        "errors": len(errors),
+        "latency": {op: histogram.snapshot() for op, histogram in sorted(merged.items())},
+    }
+
+
+def benchmark(store, workload="b", records=10_000, operations=100_000, threads=4, value_size=100,
+              distribution=None, seed=1, duration=None, skip_load=False):
+    """
+    Load `records` keys into `store` and run a YCSB workload against it.
+
+    Returns:
+        dict: JSON-serialisable report with "config", "load" and "run".
+    """
+    if workload not in WORKLOADS:
+        raise ValueError(f"Unknown workload: {workload}")
+    distribution = distribution or DEFAULT_DISTRIBUTION.get(workload, "zipfian")
+    if distribution not in DISTRIBUTIONS:
+        raise ValueError(f"Unknown distribution: {distribution}")
+    config = {"workload": workload, "mix": WORKLOADS[workload], "distribution": distribution, "records": records,
+              "operations": operations, "duration": duration, "threads": threads, "value_size": value_size,
+              "seed": seed}
+    loaded = None if skip_load else load(store, records, value_size, seed)
+    mix = Workload(WORKLOADS[workload], distribution, records, [records], ZipfianGenerator(records))
+    return {"config": config, "load": loaded,
+            "run": run(store, mix, operations, threads, value_size, seed, duration)}
+
+
+def index_memory(keys=1_000_000, lookups=100_000, seed=1, record_size=150):
+    """
+    Heap bytes per key and get() latency of the log-tier index representations
+    for `keys` keys: the plain dict Storage used to keep, a PackedIndex (the
+    delta since the last checkpoint) and a LogIndex over a memory-mapped
+    index.bin snapshot. Heap is measured with tracemalloc, so mmapped pages are
+    not counted; the snapshot's file size is reported separately.
+    """
+    from core.index_file import IndexFile, LogIndex, PackedIndex, write_index
+    base_version = 1_700_000_000_000_000
+
+    def entry(n):
+        return n * record_size, record_size, base_version + n
+
+    def key_at(offset, length):
+        # Pengganti pembacaan key dari data.bin
+        return record_key(offset // record_size).encode("utf-8")
+
+    def measure(build):
+        tracemalloc.start()
+        try:
+            index = build()
+            heap = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+        return index, heap
+
+    def lookup_ns(index):
+        rnd = random.Random(seed)
+        sample = [record_key(rnd.randrange(keys)) for _ in range(lookups)]
+        start = time.perf_counter()
+        for key in sample:
+            index.get(key)
+        return (time.perf_counter() - start) / lookups * 1e9
+
+    def build_packed():
+        index = PackedIndex(key_at)
+        for n in range(keys):
+            index.put(record_key(n), entry(n))
+        return index
+
+    report = {"keys": keys}
+    plain, heap = measure(lambda: {record_key(n): entry(n) for n in range(keys)})
+    report["dict"] = {"bytes_per_key": heap / keys, "get_ns": lookup_ns(plain)}
+    packed, heap = measure(build_packed)
+    report["packed"] = {"bytes_per_key": heap / keys, "get_ns": lookup_ns(packed)}
+    del packed
+    fd, path = tempfile.mkstemp(prefix="kv_index_", suffix=".bin")
+    os.close(fd)
+    try:
+        write_index(path, plain, 0, {})
+        del plain
+        mapped, heap = measure(lambda: LogIndex(IndexFile(path), key_at))
+        report["mmap"] = {"bytes_per_key": heap / keys, "file_bytes_per_key": os.path.getsize(path) / keys,
+                          "get_ns": lookup_ns(mapped)}
+        mapped.close()
+    finally:
+        os.remove(path)
+    return report
+
+
+def compare(report, baseline, max_regression=0.1):
+    """Daftar regresi: throughput turun atau p99 naik lebih dari `max_regression` dibanding baseline."""
+    regressions = []
+    old, new = baseline["run"], report["run"]
+    if old.get("throughput") and new["throughput"] < old["throughput"] * (1 - max_regression):
+        regressions.append(f"throughput {new['throughput']:.0f} < {old['throughput']:.0f} ops/s")
+    for op, stats in new["latency"].items():
+        before = old["latency"].get(op, {}).get("p99_ms")
+        if before and stats["p99_ms"] > before * (1 + max_regression):
+            regressions.append(f"{op} p99 {stats['p99_ms']:.3f} > {before:.3f} ms")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="YCSB-style benchmark for ShardManager")
+    parser.add_argument("--workload", choices=sorted(WORKLOADS), default="b")
+    parser.add_argument("--distribution", choices=DISTRIBUTIONS, default=None,
+                        help="Key popularity (default: zipfian, latest for workload d)")
+    parser.add_argument("--records", type=int, default=100_000)
+    parser.add_argument("--operations", type=int, default=100_000)
+    parser.add_argument("--duration", type=float, default=None, help="Run for N seconds instead of --operations")
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--value-size", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--shards", type=int, default=2)
+    parser.add_argument("--replicas", type=int, default=2)
+    parser.add_argument("--processes", type=int, default=0, help="Shard worker processes (0: all in-process)")
+    parser.add_argument("--hot-budget", type=int, default=64 << 20, help="Hot tier bytes per replica")
+    parser.add_argument("--durability", choices=("none", "flush", "fsync", "group"), default="flush")
+    parser.add_argument("--read-policy", choices=("primary", "round_robin", "least_outstanding", "hedged"),
+                        default="primary")
+    parser.add_argument("--data", default=None, help="Data directory (default: temporary, removed afterwards)")
+    parser.add_argument("--output", default=None, help="Also write the JSON report to this file")
+    parser.add_argument("--baseline", default=None, help="Compare with an earlier report; exit 1 on regression")
+    parser.add_argument("--max-regression", type=float, default=0.1)
+    parser.add_argument("--index-memory", type=int, default=None, metavar="KEYS",
+                        help="Only measure index bytes per key for KEYS keys (dict vs packed vs mmap)")
+    args = parser.parse_args(argv)
+
+    if args.index_memory is not None:
+        text = json.dumps(index_memory(args.index_memory, seed=args.seed), indent=2)
+        print(text)
+        if args.output:
+            with open(args.output, "w") as f:
+                f.write(text + "\n")
+        return 0
+
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s - %(levelname)s - %(message)s")
+    from core.shard_manager import ShardManager
+    data_dir = args.data or tempfile.mkdtemp(prefix="kv_bench_")
+    try:
+        store = ShardManager(num_shards=args.shards, replica_count=args.replicas, base_path=data_dir,
+                             read_policy=args.read_policy, processes=args.processes, hot_budget=args.hot_budget,
+                             durability=args.durability)
+        try:
+            report = benchmark(store, args.workload, args.records, args.operations, args.threads, args.value_size,
+                               args.distribution, args.seed, args.duration)
+        finally:
+            store.close()
+        report["config"].update(shards=args.shards, replicas=args.replicas, processes=args.processes,
+                                hot_budget=args.hot_budget, durability=args.durability, read_policy=args.read_policy)
+    finally:
+        if args.data is None:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.max_regression)
+        for line in regressions:
+            print(f"REGRESSION: {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+# === File: core/bloom.py ===
+import math
+import os
+import struct
+import zlib
+
+# Format bloom.bin: [magic:4B][hashes:4B][bits:8B][capacity:8B][count:8B][crc32:4B][bit array]
+_HEADER = struct.Struct("!4sIQQQI")
+_MAGIC = b"BLM1"
+_M32 = 0xFFFFFFFF
+
+
+class BloomError(Exception):
+    """Raised when a persisted filter is truncated or corrupt."""
+    pass
+
+
+class BloomFilter:
+    """
+    Bloom filter over string keys, sized for `capacity` keys at `bits_per_key`.
+
+    Positions come from double hashing on crc32 of the key and a murmur3
+    finalizer of it, so a lookup hashes the key once (crc32 is far cheaper
+    than a cryptographic hash in CPython). A negative answer is exact; a
+    positive one is wrong with probability ~expected_fpr().
+    """
+
+    def __init__(self, capacity=1024, bits_per_key=10):
+        self.capacity = max(1, capacity)
+        self.bits_per_key = bits_per_key
+        self.num_bits = max(64, self.capacity * bits_per_key)
+        self.num_hashes = max(1, round(bits_per_key * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.num_bits + 7) // 8)
+
+    @staticmethod
+    def key_hashes(key):
+        """(h1, h2) of `key`; the same for every filter, so one key can be checked against many."""
+        h1 = zlib.crc32(key.encode("utf-8"))
+        h2 = h1 ^ (h1 >> 16)
+        h2 = (h2 * 0x85EBCA6B) & _M32
+        h2 ^= h2 >> 13
+        h2 = (h2 * 0xC2B2AE35) & _M32
+        return h1, (h2 ^ (h2 >> 16)) | 1
+
+    def add(self, key):
+        h1, h2 = self.key_hashes(key)
+        bits, m = self._bits, self.num_bits
+        for i in range(self.num_hashes):
+            pos = (h1 + i * h2) % m
+            bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return self.contains_hashes(self.key_hashes(key))
+
+    def contains_hashes(self, hashes):
+        """`key in self` for hashes = key_hashes(key)."""
+        h1, h2 = hashes
+        bits, m = self._bits, self.num_bits
+        for i in range(self.num_hashes):
+            pos = (h1 + i * h2) % m
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+    def expected_fpr(self):
+        """Perkiraan false positive rate untuk jumlah key yang sudah ditambahkan."""
+        k, m = self.num_hashes, self.num_bits
+        return (1 - math.exp(-k * self.count / m)) ** k
+
+    def memory_bytes(self):
+        return len(self._bits)
+
+    @classmethod
+    def build(cls, keys, bits_per_key=10, min_capacity=1024):
+        """Filter baru berisi `keys`, dengan ruang untuk dua kali jumlahnya agar tidak cepat penuh."""
+        keys = list(keys)
+        bloom = cls(max(min_capacity, 2 * len(keys)), bits_per_key)
+        for key in keys:
+            bloom.add(key)
+        return bloom
+
+    def to_bytes(self):
+        return _HEADER.pack(_MAGIC, self.num_hashes, self.num_bits, self.capacity, self.count,
+                            zlib.crc32(self._bits)) + bytes(self._bits)
+
+    @classmethod
+    def from_bytes(cls, data, bits_per_key=10):
+        if len(data) < _HEADER.size:
+            raise BloomError("Truncated bloom filter")
+        magic, num_hashes, num_bits, capacity, count, crc = _HEADER.unpack_from(data)
+        bits = bytearray(data[_HEADER.size:])
+        if magic != _MAGIC or len(bits) != (num_bits + 7) // 8 or zlib.crc32(bits) != crc:
+            raise BloomError("Corrupt bloom filter")
+        bloom = cls.__new__(cls)
+        bloom.capacity = capacity
+        bloom.bits_per_key = bits_per_key
+        bloom.num_bits = num_bits
+        bloom.num_hashes = num_hashes
+        bloom.count = count
+        bloom._bits = bits
+        return bloom
+
+    def save(self, path, fsync=False):
+        tmp_file = path + ".tmp"
+        with open(tmp_file, "wb") as f:
+            f.write(self.to_bytes())
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_file, path)
+
+    @classmethod
+    def load(cls, path, bits_per_key=10):
+        with open(path, "rb") as f:
+            data = f.read()
+        try:
+            return cls.from_bytes(data, bits_per_key)
+        except BloomError as e:
+            raise BloomError(f"{e}: {path}")
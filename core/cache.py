@@ -0,0 +1,342 @@
+import sys
+import threading
+from collections import OrderedDict
+
+
+def approx_size(obj):
+    """Perkiraan kasar ukuran objek (byte) beserta isinya, cukup untuk budget hot tier."""
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            size += approx_size(k) + approx_size(v)
+    elif isinstance(obj, (list, tuple, set)):
+        for item in obj:
+            size += approx_size(item)
+    return size
+
+
+class LRUPolicy:
+    """Evict the least recently used key."""
+
+    def __init__(self):
+        self._order = OrderedDict()
+
+    def record_insert(self, key):
+        self._order[key] = None
+
+    def record_access(self, key):
+        self._order.move_to_end(key)
+
+    def remove(self, key):
+        self._order.pop(key, None)
+
+    def victim(self):
+        return next(iter(self._order))
+
+    def clear(self):
+        self._order.clear()
+
+
+class LFUPolicy:
+    """Evict the least frequently used key, oldest first among equal counts (O(1) buckets)."""
+
+    def __init__(self):
+        self._freq = {}
+        self._buckets = {}  # freq -> OrderedDict of keys
+        self._min_freq = 0
+
+    def record_insert(self, key):
+        self._freq[key] = 1
+        self._buckets.setdefault(1, OrderedDict())[key] = None
+        self._min_freq = 1
+
+    def record_access(self, key):
+        freq = self._freq[key]
+        bucket = self._buckets[freq]
+        del bucket[key]
+        if not bucket:
+            del self._buckets[freq]
+            if self._min_freq == freq:
+                self._min_freq = freq + 1
+        self._freq[key] = freq + 1
+        self._buckets.setdefault(freq + 1, OrderedDict())[key] = None
+
+    def remove(self, key):
+        freq = self._freq.pop(key, None)
+        if freq is None:
+            return
+        bucket = self._buckets[freq]
+        del bucket[key]
+        if not bucket:
+            del self._buckets[freq]
+            if self._min_freq == freq:
+                self._min_freq = min(self._buckets, default=0)
+
+    def victim(self):
+        if self._min_freq not in self._buckets:
+            self._min_freq = min(self._buckets)
+        return next(iter(self._buckets[self._min_freq]))
+
+    def clear(self):
+        self._freq.clear()
+        self._buckets.clear()
+        self._min_freq = 0
+
+
+class CountMinSketch:
+    """4-row count-min sketch with 4-bit style saturation and periodic halving (aging)."""
+
+    def __init__(self, width=4096, depth=4, max_count=15):
+        self.width = width
+        self.depth = depth
+        self.max_count = max_count
+        self.rows = [bytearray(width) for _ in range(depth)]
+        self.additions = 0
+        self.sample_size = width * 10
+
+    def _slots(self, key):
+        h = hash(key)
+        for i in range(self.depth):
+            yield (h ^ (h >> (i * 7 + 3)) ^ (i * 0x9E3779B1)) % self.width
+
+    def add(self, key):
+        for row, slot in zip(self.rows, self._slots(key)):
+            if row[slot] < self.max_count:
+                row[slot] += 1
+        self.additions += 1
+        if self.additions >= self.sample_size:
+            self._age()
+
+    def estimate(self, key):
+        return min(row[slot] for row, slot in zip(self.rows, self._slots(key)))
+
+    def _age(self):
+        for row in self.rows:
+            for i, count in enumerate(row):
+                if count:
+                    row[i] = count >> 1
+        self.additions //= 2
+
+    def clear(self):
+        for row in self.rows:
+            row[:] = bytes(self.width)
+        self.additions = 0
+
+
+class TinyLFUPolicy:
+    """
+    W-TinyLFU: a small LRU admission window in front of a segmented LRU main area.
+
+    When something must go, the window's oldest entry competes against the
+    probation segment's oldest entry and the one with the lower sketch
+    frequency is evicted.
+    """
+
+    def __init__(self, window_ratio=0.01, protected_ratio=0.8):
+        self.window_ratio = window_ratio
+        self.protected_ratio = protected_ratio
+        self.sketch = CountMinSketch()
+        self._window = OrderedDict()
+        self._probation = OrderedDict()
+        self._protected = OrderedDict()
+
+    def _size(self):
+        return len(self._window) + len(self._probation) + len(self._protected)
+
+    def record_insert(self, key):
+        self.sketch.add(key)
+        self._window[key] = None
+
+    def record_access(self, key):
+        self.sketch.add(key)
+        if key in self._window:
+            self._window.move_to_end(key)
+        elif key in self._probation:
+            del self._probation[key]
+            self._protected[key] = None
+            limit = max(1, int(self._size() * self.protected_ratio))
+            while len(self._protected) > limit:
+                demoted, _ = self._protected.popitem(last=False)
+                self._probation[demoted] = None
+        elif key in self._protected:
+            self._protected.move_to_end(key)
+
+    def remove(self, key):
+        self._window.pop(key, None)
+        self._probation.pop(key, None)
+        self._protected.pop(key, None)
+
+    def victim(self):
+        window_limit = max(1, int(self._size() * self.window_ratio))
+        if not (self._probation or self._protected):
+            # Area utama masih kosong: isi dari kelebihan window tanpa filter
+            while len(self._window) > window_limit:
+                key, _ = self._window.popitem(last=False)
+                self._probation[key] = None
+            if not self._probation:
+                return next(iter(self._window))
+        if len(self._window) > window_limit:
+            if not self._probation:
+                demoted, _ = self._protected.popitem(last=False)
+                self._probation[demoted] = None
+            candidate = next(iter(self._window))
+            rival = next(iter(self._probation))
+            if self.sketch.estimate(candidate) > self.sketch.estimate(rival):
+                # Kandidat window lolos admission, pindah ke probation
+                del self._window[candidate]
+                self._probation[candidate] = None
+                return rival
+            return candidate
+        if self._probation:
+            return next(iter(self._probation))
+        return next(iter(self._protected))
+
+    def clear(self):
+        self.sketch.clear()
+        self._window.clear()
+        self._probation.clear()
+        self._protected.clear()
+
+
+POLICIES = {
+    "lru": LRUPolicy,
+    "lfu": LFUPolicy,
+    "tinylfu": TinyLFUPolicy,
+}
+
+
+class HotCache:
+    """
+    Byte-budgeted hot tier with a pluggable eviction policy.
+
+    Behaves like a read-only mapping for inspection (`in`, `[]`, `items()`,
+    `len()`); mutations go through `put`/`pop` so the byte budget is enforced
+    on every insertion path.
+    """
+
+    def __init__(self, budget_bytes, policy="lru"):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown eviction policy: {policy}")
+        self.budget_bytes = budget_bytes
+        self.policy_name = policy
+        self.policy = POLICIES[policy]()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = {}
+        self._sizes = {}
+        self._dirty = set()
+        # Hit di hot tetap mengubah urutan policy, jadi tiap operasi diserialisasi di sini
+        self._mutex = threading.RLock()
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __len__(self):
+        return len(self._data)
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def keys(self):
+        with self._mutex:
+            return list(self._data)
+
+    def items(self):
+        with self._mutex:
+            return list(self._data.items())
+
+    def is_dirty(self, key):
+        return key in self._dirty
+
+    def get(self, key):
+        with self._mutex:
+            if key in self._data:
+                self.hits += 1
+                self.policy.record_access(key)
+                return self._data[key]
+            self.misses += 1
+            return None
+
+    def get_many(self, keys):
+        """{key: value} of the given keys that are in the hot tier, under one lock."""
+        found = {}
+        with self._mutex:
+            data = self._data
+            for key in keys:
+                if key in data:
+                    self.policy.record_access(key)
+                    found[key] = data[key]
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put(self, key, value, dirty=True):
+        """
+        Insert or replace `key`, evicting until the budget is met.
+
+        Returns:
+            list: Evicted (key, value, dirty) tuples; dirty ones must be written to cold.
+        """
+        size = approx_size(key) + approx_size(value)
+        with self._mutex:
+            if key in self._data:
+                self.bytes -= self._sizes[key]
+                self.policy.record_access(key)
+            else:
+                self.policy.record_insert(key)
+            self._data[key] = value
+            self._sizes[key] = size
+            self.bytes += size
+            if dirty:
+                self._dirty.add(key)
+            else:
+                self._dirty.discard(key)
+
+            evicted = []
+            while self.bytes > self.budget_bytes and len(self._data) > 1:
+                victim = self.policy.victim()
+                if victim == key:
+                    # Jangan buang entry yang baru saja ditulis
+                    self.policy.record_access(key)
+                    victim = self.policy.victim()
+                    if victim == key:
+                        break
+                was_dirty = victim in self._dirty
+                evicted.append((victim, self.pop(victim), was_dirty))
+                self.evictions += 1
+            return evicted
+
+    def pop(self, key, default=None):
+        with self._mutex:
+            if key not in self._data:
+                return default
+            self.policy.remove(key)
+            self.bytes -= self._sizes.pop(key)
+            self._dirty.discard(key)
+            return self._data.pop(key)
+
+    def clear(self):
+        with self._mutex:
+            self.policy.clear()
+            self._data.clear()
+            self._sizes.clear()
+            self._dirty.clear()
+            self.bytes = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "policy": self.policy_name,
+            "entries": len(self._data),
+            "bytes": self.bytes,
+            "budget_bytes": self.budget_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
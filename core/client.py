@@ -0,0 +1,230 @@
+# === File: core/client.py ===
+"""
+Blocking client for core/server.py with a small connection pool.
+
+    client = KVClient("127.0.0.1", 7070, pool_size=4)
+    client.put("k1", {"name": "a", "age": 1})
+    client.get("k1")
+    client.pipeline([("get", "k1"), ("put", "k2", {...})])
+"""
+import queue
+import socket
+import threading
+from contextlib import contextmanager
+
+from core import protocol as proto
+from core.protocol import Reader, ProtocolError
+
+
+class ClientError(Exception):
+    """Raised when the server answers a request with an error."""
+    pass
+
+
+class _Connection:
+    def __init__(self, host, port, timeout):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.next_id = 0
+
+    def send(self, frames):
+        self.sock.sendall(b"".join(frames))
+
+    def _recv_exact(self, n):
+        buf = bytearray()
+        while len(buf) < n:
+            chunk = self.sock.recv(n - len(buf))
+            if not chunk:
+                raise ConnectionError("Server closed the connection")
+            buf += chunk
+        return bytes(buf)
+
+    def recv(self):
+        length, req_id, status = proto.HEADER.unpack(self._recv_exact(proto.HEADER.size))
+        return req_id, status, self._recv_exact(length - 5)
+
+    def close(self):
+        self.sock.close()
+
+
+class KVClient:
+    def __init__(self, host="127.0.0.1", port=7070, pool_size=4, timeout=10.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self._pool = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _connection(self):
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                create = self._created < self.pool_size
+                if create:
+                    self._created += 1
+            if create:
+                try:
+                    conn = _Connection(self.host, self.port, self.timeout)
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                conn = self._pool.get()
+        try:
+            yield conn
+        except Exception:
+            # Koneksi dalam keadaan tidak jelas, jangan dikembalikan ke pool
+            conn.close()
+            with self._lock:
+                self._created -= 1
+            raise
+        else:
+            self._pool.put(conn)
+
+    def _roundtrip(self, requests):
+        """Send (op, payload) requests on one connection without waiting, then collect responses in order."""
+        with self._connection() as conn:
+            ids = []
+            frames = []
+            for op, payload in requests:
+                conn.next_id = (conn.next_id + 1) & 0xFFFFFFFF
+                ids.append(conn.next_id)
+                frames.append(proto.pack_frame(conn.next_id, op, payload))
+            conn.send(frames)
+            responses = {}
+            while len(responses) < len(ids):
+                req_id, status, body = conn.recv()
+                responses[req_id] = (status, body)
+        return [responses[i] for i in ids]
+
+    @staticmethod
+    def _check(status, body):
+        if status == proto.STATUS_ERROR:
+            raise ClientError(body.decode("utf-8", "replace"))
+        return status
+
+    @staticmethod
+    def _put_flags(write_to_cold, async_replication, schema_version):
+        flags = (proto.FLAG_WRITE_TO_COLD if write_to_cold else 0) | (proto.FLAG_ASYNC if async_replication else 0)
+        return bytes((flags, schema_version))
+
+    @staticmethod
+    def _items(body):
+        r = Reader(body)
+        return {r.key(): r.value() for _ in range(r.count())}
+
+    # --- request builders -------------------------------------------------
+
+    def _build(self, op_name, *args, **kwargs):
+        if op_name == "ping":
+            return proto.OP_PING, b""
+        if op_name == "get":
+            return proto.OP_GET, proto.pack_key(args[0])
+        if op_name == "put":
+            key, value = args
+            return proto.OP_PUT, (self._put_flags(kwargs.get("write_to_cold", True),
+                                                  kwargs.get("async_replication", False),
+                                                  kwargs.get("schema_version", 1))
+                                  + proto.pack_key(key) + proto.pack_value(value))
+        if op_name == "delete":
+            return proto.OP_DELETE, proto.pack_key(args[0])
+        if op_name == "get_many":
+            keys = list(args[0])
+            return proto.OP_GET_MANY, proto.pack_count(len(keys)) + b"".join(proto.pack_key(k) for k in keys)
+        if op_name == "put_many":
+            items = list(args[0].items()) if isinstance(args[0], dict) else list(args[0])
+            body = [self._put_flags(kwargs.get("write_to_cold", True), kwargs.get("async_replication", False),
+                                    kwargs.get("schema_version", 1)), proto.pack_count(len(items))]
+            body.extend(proto.pack_key(k) + proto.pack_value(v) for k, v in items)
+            return proto.OP_PUT_MANY, b"".join(body)
+        if op_name == "delete_many":
+            keys = list(args[0])
+            return proto.OP_DELETE_MANY, proto.pack_count(len(keys)) + b"".join(proto.pack_key(k) for k in keys)
+        if op_name == "scan":
+            start, end, limit = (list(args) + [None, None, None])[:3]
+            return proto.OP_SCAN, proto.pack_key(start or "") + proto.pack_key(end or "") + proto.pack_count(limit or 0)
+        if op_name == "stats":
+            return proto.OP_STATS, b""
+        raise ProtocolError(f"Unknown operation {op_name}")
+
+    def _parse(self, op_name, status, body):
+        self._check(status, body)
+        if op_name == "get":
+            return Reader(body).value() if status == proto.STATUS_OK else None
+        if op_name == "delete":
+            return status == proto.STATUS_OK
+        if op_name == "get_many":
+            return self._items(body)
+        if op_name in ("put_many", "delete_many"):
+            return Reader(body).count()
+        if op_name == "scan":
+            r = Reader(body)
+            return [(r.key(), r.value()) for _ in range(r.count())]
+        if op_name == "stats":
+            return Reader(body).value()
+        return None
+
+    def _call(self, op_name, *args, **kwargs):
+        ((status, body),) = self._roundtrip([self._build(op_name, *args, **kwargs)])
+        return self._parse(op_name, status, body)
+
+    # --- public API -------------------------------------------------------
+
+    def ping(self):
+        self._call("ping")
+        return True
+
+    def get(self, key):
+        return self._call("get", key)
+
+    def put(self, key, value, write_to_cold=True, async_replication=False, schema_version=1):
+        self._call("put", key, value, write_to_cold=write_to_cold,
+                   async_replication=async_replication, schema_version=schema_version)
+
+    def delete(self, key):
+        return self._call("delete", key)
+
+    def get_many(self, keys):
+        return self._call("get_many", keys)
+
+    def put_many(self, items, write_to_cold=True, async_replication=False, schema_version=1):
+        return self._call("put_many", items, write_to_cold=write_to_cold,
+                          async_replication=async_replication, schema_version=schema_version)
+
+    def delete_many(self, keys):
+        return self._call("delete_many", keys)
+
+    def scan(self, start=None, end=None, limit=None):
+        return self._call("scan", start, end, limit)
+
+    def stats(self):
+        """Metrics snapshot of the server's ShardManager (see ShardManager.stats)."""
+        return self._call("stats")
+
+    def pipeline(self, requests):
+        """
+        Send many requests back-to-back on one connection.
+
+        Args:
+            requests (list): Tuples like ("get", key) or ("put", key, value).
+
+        Returns:
+            list: One result per request, in request order.
+        """
+        built = [self._build(req[0], *req[1:]) for req in requests]
+        responses = self._roundtrip(built)
+        return [self._parse(req[0], status, body) for req, (status, body) in zip(requests, responses)]
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._lock:
+            self._created = 0
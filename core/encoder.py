@@ -1,16 +1,145 @@
 import struct
+import threading
 import zlib
 import json
 import logging
-from datetime import datetime
+from core import schemas
+from core.serializer import pack_value, unpack_value, SerializerError
+
+try:
+    import zstandard
+except ImportError:  # codec zstd opsional
+    zstandard = None
+try:
+    import lz4.block
+except ImportError:  # codec lz4 opsional
+    lz4 = None
+
+# Batas ukuran satu record, dipakai saat scan untuk menolak header yang rusak
+MAX_RECORD = 64 * 1024 * 1024
+
+# Bit tertinggi byte pertama menandai layout ber-checksum:
+# [CHECKSUM_FLAG | schema:1B][crc32:4B][key_len:4B][value_len:4B][extra_len:4B][key][value][extra]
+# crc32 dihitung atas semua byte setelah field crc.
+CHECKSUM_FLAG = 0x80
+# Bersama CHECKSUM_FLAG: satu byte id codec mengikuti crc32 (tercakup checksum).
+# Record tanpa flag ini selalu zlib.
+CODEC_FLAG = 0x40
+# Bersama CHECKSUM_FLAG: value diserialisasi biner menurut field skema (core/serializer.py), bukan JSON
+SCHEMA_VALUE_FLAG = 0x20
+# Bersama CHECKSUM_FLAG: versi MVCC (mikrodetik epoch, 8 byte) mengikuti byte codec
+VERSION_FLAG = 0x10
+_CRC_PREFIX = struct.Struct("!BI")
+_LENGTHS = struct.Struct("!III")
+_VERSION = struct.Struct("!Q")
+_FLAGS = CHECKSUM_FLAG | CODEC_FLAG | SCHEMA_VALUE_FLAG | VERSION_FLAG
 
 class EncoderError(Exception):
     """Exception raised for errors in encoding/decoding operations."""
     pass
 
+class Codec:
+    """
+    A value compressor registered under a one-byte id stored in each record.
+
+    compress(data, dictionary) and decompress(data, dictionaries) work on the
+    JSON bytes of the value; `dictionary` is the writer's current trained
+    dictionary and `dictionaries` maps dictionary id -> dictionary for reads.
+    """
+
+    def __init__(self, codec_id, name, compress, decompress, available=True):
+        self.codec_id = codec_id
+        self.name = name
+        self.compress = compress
+        self.decompress = decompress
+        self.available = available
+
+CODECS = {}
+_CODECS_BY_ID = {}
+
+def register_codec(codec):
+    CODECS[codec.name] = codec
+    _CODECS_BY_ID[codec.codec_id] = codec
+
+def get_codec(name):
+    codec = CODECS.get(name)
+    if codec is None:
+        raise EncoderError(f"Unknown codec: {name}")
+    if not codec.available:
+        raise EncoderError(f"Codec {name} needs a package that is not installed")
+    return codec
+
+def codec_by_id(codec_id):
+    return _CODECS_BY_ID.get(codec_id)
+
+# Compressor/decompressor zstd tidak thread-safe, jadi di-cache per thread
+_zstd_local = threading.local()
+
+def _zstd(kind, dictionary=None):
+    cache = _zstd_local.__dict__.setdefault(kind, {})
+    key = dictionary.dict_id() if dictionary is not None else 0
+    if key not in cache:
+        if kind == "c":
+            cache[key] = zstandard.ZstdCompressor(level=3, dict_data=dictionary, write_checksum=False)
+        else:
+            cache[key] = zstandard.ZstdDecompressor(dict_data=dictionary)
+    return cache[key]
+
+def _zstd_dict_compress(data, dictionary):
+    if dictionary is None:
+        raise EncoderError("zstd-dict needs a trained dictionary")
+    return _zstd("c", dictionary).compress(data)
+
+def _zstd_dict_decompress(data, dictionaries):
+    dict_id = zstandard.get_frame_parameters(data).dict_id
+    dictionary = (dictionaries or {}).get(dict_id)
+    if dictionary is None:
+        raise EncoderError(f"Missing zstd dictionary {dict_id}")
+    return _zstd("d", dictionary).decompress(data)
+
+register_codec(Codec(0, "raw", lambda data, dictionary: data, lambda data, dictionaries: bytes(data)))
+register_codec(Codec(1, "zlib", lambda data, dictionary: zlib.compress(data),
+                     lambda data, dictionaries: zlib.decompress(data)))
+register_codec(Codec(2, "lz4", lambda data, dictionary: lz4.block.compress(data),
+                     lambda data, dictionaries: lz4.block.decompress(bytes(data)), available=lz4 is not None))
+register_codec(Codec(3, "zstd", lambda data, dictionary: _zstd("c").compress(data),
+                     lambda data, dictionaries: _zstd("d").decompress(data), available=zstandard is not None))
+register_codec(Codec(4, "zstd-dict", _zstd_dict_compress, _zstd_dict_decompress, available=zstandard is not None))
+
+def serialize_value(value, schema_version, binary=True):
+    """
+    Serialize a value the way Encoder.encode does before compression.
+
+    Returns:
+        tuple: (bytes, True if schema-binary else False for JSON)
+    """
+    if binary:
+        try:
+            return pack_value(value, schemas.fields(schema_version)), True
+        except SerializerError:
+            # Value non-dict atau bertipe di luar JSON dasar: tetap JSON
+            pass
+    return json.dumps(value).encode("utf-8"), False
+
+def train_dictionary(samples, dict_size=16 * 1024, binary=True):
+    """Train a zstd dictionary on (value, schema_version) samples; returns a ZstdCompressionDict."""
+    if zstandard is None:
+        raise EncoderError("Dictionary training needs the zstandard package")
+    data = [serialize_value(value, schema_version, binary)[0] for value, schema_version in samples]
+    try:
+        return zstandard.train_dictionary(dict_size, data)
+    except zstandard.ZstdError as e:
+        raise EncoderError(f"Dictionary training failed on {len(data)} samples: {e}")
+
+def load_dictionary(data):
+    if zstandard is None:
+        raise EncoderError("zstd dictionaries need the zstandard package")
+    return zstandard.ZstdCompressionDict(data)
+
 class Encoder:
     @staticmethod
-    def encode(key, value, schema_version=1, extra_field=None):
+    def encode(key, value, schema_version=1, extra_field=None, checksum=True, codec="zlib", dictionary=None,
+               binary=True, version=None):
         """
         Encode a key-value pair into a binary format.
 
@@ -19,6 +148,11 @@ class Encoder:
             value (dict): The value to encode (JSON-serializable).
             schema_version (int): Schema version (1–4).
             extra_field (str, optional): Additional field for extended schema.
+            checksum (bool): Write the checksummed layout (CHECKSUM_FLAG | schema, crc32, lengths).
+            codec (str): Name of a registered value codec; needs the checksummed layout unless "zlib".
+            dictionary (optional): Trained dictionary for codecs that use one (zstd-dict).
+            binary (bool): Serialize dict values by schema fields instead of JSON (checksummed layout only).
+            version (int, optional): MVCC version stored in the header (checksummed layout only).
 
         Returns:
             bytes: Encoded binary data.
@@ -26,64 +160,192 @@ class Encoder:
         try:
             key_bytes = key.encode("utf-8")
             key_len = len(key_bytes)
-            value_json = json.dumps(value)
-            value_compressed = zlib.compress(value_json.encode("utf-8"))
+            serialized, is_binary = serialize_value(value, schema_version, checksum and binary)
+            flags = _FLAGS if is_binary else _FLAGS & ~SCHEMA_VALUE_FLAG
+            if version is None:
+                flags &= ~VERSION_FLAG
+            value_codec = get_codec(codec)
+            value_compressed = value_codec.compress(serialized, dictionary)
             value_len = len(value_compressed)
             extra_bytes = extra_field.encode("utf-8") if extra_field else b""
             extra_len = len(extra_bytes)
 
+            if schema_version not in (1, 2, 3, 4):
+                raise EncoderError(f"Unsupported schema version: {schema_version}")
+
+            if checksum:
+                body = (bytes((value_codec.codec_id,)) + (_VERSION.pack(version) if version is not None else b"")
+                        + _LENGTHS.pack(key_len, value_len, extra_len) + key_bytes + value_compressed + extra_bytes)
+                return _CRC_PREFIX.pack(flags | schema_version, zlib.crc32(body)) + body
+
+            if codec != "zlib" or version is not None:
+                raise EncoderError(f"Codec {codec} and versions need the checksummed layout")
+
             if schema_version in (1,):
                 return struct.pack("!BII", 1, key_len, value_len) + key_bytes + value_compressed
 
-            elif schema_version in (2, 3, 4):
-                return struct.pack("!BIII", schema_version, key_len, value_len, extra_len) + key_bytes + value_compressed + extra_bytes
-
             else:
-                raise EncoderError(f"Unsupported schema version: {schema_version}")
+                return struct.pack("!BIII", schema_version, key_len, value_len, extra_len) + key_bytes + value_compressed + extra_bytes
 
         except Exception as e:
             raise EncoderError(f"Failed to encode {key}: {e}")
 
     @staticmethod
-    def decode(data):
+    def parse_header(data, pos=0):
+        """
+        Parse the record header at `pos`.
+
+        Returns:
+            tuple | None: (schema_version, checksummed, header_len, key_len, value_len, extra_len, codec_id,
+            version), or None if `data` ends inside the header. version is None for unversioned records.
+        """
+        if len(data) - pos < 1:
+            return None
+        first = data[pos]
+        schema_version = first & ~_FLAGS
+        if schema_version not in (1, 2, 3, 4) or (first & _FLAGS and not first & CHECKSUM_FLAG):
+            raise EncoderError(f"Unsupported schema version: {first}")
+        if first & CHECKSUM_FLAG:
+            has_codec = 1 if first & CODEC_FLAG else 0
+            has_version = _VERSION.size if first & VERSION_FLAG else 0
+            header = _CRC_PREFIX.size + has_codec + has_version + _LENGTHS.size
+            if len(data) - pos < header:
+                return None
+            pos += _CRC_PREFIX.size
+            codec_id = data[pos] if has_codec else 1
+            version = _VERSION.unpack_from(data, pos + has_codec)[0] if has_version else None
+            key_len, value_len, extra_len = _LENGTHS.unpack_from(data, pos + has_codec + has_version)
+            return schema_version, True, header, key_len, value_len, extra_len, codec_id, version
+        if schema_version == 1:
+            if len(data) - pos < 9:
+                return None
+            key_len, value_len = struct.unpack_from("!II", data, pos + 1)
+            return schema_version, False, 9, key_len, value_len, 0, 1, None
+        if len(data) - pos < 13:
+            return None
+        key_len, value_len, extra_len = struct.unpack_from("!III", data, pos + 1)
+        return schema_version, False, 13, key_len, value_len, extra_len, 1, None
+
+    @staticmethod
+    def _verify(data, pos, length):
+        (crc,) = struct.unpack_from("!I", data, pos + 1)
+        if zlib.crc32(data[pos + _CRC_PREFIX.size:pos + length]) != crc:
+            raise EncoderError(f"Checksum mismatch at {pos}")
+
+    @staticmethod
+    def record_size(data, offset=0):
+        """
+        Compute the total length of the record starting at `offset` from its header.
+
+        Args:
+            data (bytes-like): Buffer holding at least the record header.
+            offset (int): Position of the record in `data`.
+
+        Returns:
+            int: Record length in bytes (header + key + value + extra).
+        """
+        header = Encoder.parse_header(data, offset)
+        if header is None:
+            raise EncoderError(f"Truncated record header at {offset}")
+        _, _, header_len, key_len, value_len, extra_len, _, _ = header
+        return header_len + key_len + value_len + extra_len
+
+    @staticmethod
+    def record_version(data, offset=0):
+        """MVCC version stored in the record header at `offset`, or None for unversioned records."""
+        header = Encoder.parse_header(data, offset)
+        if header is None:
+            raise EncoderError(f"Truncated record header at {offset}")
+        return header[7]
+
+    @staticmethod
+    def record_key(data, offset=0):
+        """Raw key bytes of the record at `offset`, without decoding the value."""
+        header = Encoder.parse_header(data, offset)
+        if header is None:
+            raise EncoderError(f"Truncated record header at {offset}")
+        start = offset + header[2]
+        return bytes(data[start:start + header[3]])
+
+    @staticmethod
+    def scan_record(data, pos=0, max_record=MAX_RECORD):
+        """
+        Validate the record at `pos` without decoding the value.
+
+        Args:
+            data (bytes-like): Buffer holding the record (possibly a partial chunk).
+            pos (int): Offset of the record in `data`.
+
+        Returns:
+            tuple | None: (key, record_length, version), or None if `data` ends before the record does.
+
+        Raises:
+            EncoderError: If the bytes at `pos` are not a plausible record.
+        """
+        header = Encoder.parse_header(data, pos)
+        if header is None:
+            return None
+        _, checksummed, header_len, key_len, value_len, extra_len, codec_id, version = header
+        length = header_len + key_len + value_len + extra_len
+        if key_len == 0 or value_len < 1 or length > max_record:
+            raise EncoderError(f"Implausible lengths at {pos}")
+        if len(data) - pos < length:
+            return None
+        value_start = pos + header_len + key_len
+        if checksummed:
+            Encoder._verify(data, pos, length)
+            if codec_id not in _CODECS_BY_ID:
+                raise EncoderError(f"Unknown codec id {codec_id} at {pos}")
+        else:
+            # Tanpa checksum: minimal header zlib harus valid (CM=8, CMF*256+FLG kelipatan 31)
+            if value_len < 2:
+                raise EncoderError(f"Implausible lengths at {pos}")
+            cmf, flg = data[value_start], data[value_start + 1]
+            if cmf & 0x0F != 8 or (cmf * 256 + flg) % 31:
+                raise EncoderError(f"Corrupt value stream at {pos}")
+        try:
+            key = bytes(data[pos + header_len:value_start]).decode("utf-8")
+        except UnicodeDecodeError as e:
+            raise EncoderError(f"Corrupt key at {pos}: {e}")
+        return key, length, version
+
+    @staticmethod
+    def decode(data, dictionaries=None, as_version=None):
         """
         Decode a binary record into a key-value pair and schema version.
 
+        Checksummed records are verified first, so silent corruption raises
+        EncoderError instead of returning garbage.
+
         Args:
-            data (bytes): Binary data to decode.
+            data (bytes-like): Binary data to decode (bytes or memoryview).
+            dictionaries (dict, optional): dictionary id -> trained dictionary, for zstd-dict records.
+            as_version (int, optional): Upgrade/downgrade the value to this schema version.
 
         Returns:
             tuple: (key, value, schema_version, extra_field)
         """
         try:
-            schema_version = struct.unpack("!B", data[:1])[0]
-
-            if schema_version == 1:
-                key_len, value_len = struct.unpack("!II", data[1:9])
-                key = data[9:9+key_len].decode("utf-8")
-                value_compressed = data[9+key_len:9+key_len+value_len]
-                value = json.loads(zlib.decompress(value_compressed).decode("utf-8"))
-                return key, value, schema_version, None
-
-            elif schema_version in (2, 3, 4):
-                key_len, value_len, extra_len = struct.unpack("!III", data[1:13])
-                key = data[13:13+key_len].decode("utf-8")
-                value_compressed = data[13+key_len:13+key_len+value_len]
-                value = json.loads(zlib.decompress(value_compressed).decode("utf-8"))
-                extra_field = (
-                    data[13+key_len+value_len:13+key_len+value_len+extra_len].decode("utf-8")
-                    if extra_len > 0 else None
-                )
-                return key, value, schema_version, extra_field
-
+            schema_version, checksummed, h, key_len, value_len, extra_len, codec_id, _ = Encoder.parse_header(data)
+            if checksummed:
+                Encoder._verify(data, 0, h + key_len + value_len + extra_len)
+            key = bytes(data[h:h+key_len]).decode("utf-8")
+            value_compressed = data[h+key_len:h+key_len+value_len]
+            codec = _CODECS_BY_ID.get(codec_id)
+            if codec is None or not codec.available:
+                raise EncoderError(f"Codec id {codec_id} is not available")
+            serialized = codec.decompress(value_compressed, dictionaries)
+            if data[0] & SCHEMA_VALUE_FLAG:
+                value = unpack_value(serialized, schemas.fields(schema_version))
             else:
-                raise EncoderError(f"Unsupported schema version: {schema_version}")
+                value = json.loads(serialized)
+            if as_version is not None and as_version != schema_version:
+                value = schemas.convert(value, as_version)
+            extra_field = (
+                bytes(data[h+key_len+value_len:h+key_len+value_len+extra_len]).decode("utf-8")
+                if extra_len > 0 else None
+            )
+            return key, value, schema_version, extra_field
 
         except Exception as e:
             raise EncoderError(f"Failed to decode: {e}")
-
-    @staticmethod
-    def add_version_to_key(key):
-        """Tambahkan timestamp ke key untuk menyimpan versi histori."""
-        timestamp = datetime.now().strftime("%Y%m%dT%H%M%S%f")
-        return f"{key}::{timestamp}"
@@ -0,0 +1,477 @@
+# === File: core/index_file.py ===
+"""
+Binary index.bin snapshot of the data.bin log tier.
+
+    [header][hashes: count * 8, sorted][slots: count * SLOT][key bytes][history]
+
+Slot i belongs to hash i and is [offset:8][version:8][length:4][key_off:4][key_len:4];
+all integers are little-endian. The file is memory-mapped and looked up
+in place: the sorted 64-bit key hashes are viewed as an array and
+bisected in C, and the key bytes are compared to rule out hash
+collisions. Nothing is deserialised at open except the header and the
+version chains (history), which flush_segment keeps small.
+"""
+import bisect
+import hashlib
+import heapq
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+from collections.abc import MutableMapping
+from itertools import compress
+
+MAGIC = b"KIX3"
+# magic, count, data_end, live_bytes, max_version, keys_off, history_off, history_len
+HEADER = struct.Struct("<4sQQQQQQQ")
+SLOT = struct.Struct("<QQIII")
+_SLOT_ENTRY = struct.Struct("<QQI")
+_SLOT_KEY = struct.Struct("<II")
+# History: [key_len:4][key][count:4] lalu count * [offset:8][length:4][version:8]; offset NO_OFFSET = tombstone
+_CHAIN_HEAD = struct.Struct("<I")
+_CHAIN_ENTRY = struct.Struct("<QIQ")
+NO_OFFSET = (1 << 64) - 1
+# Penanda slot PackedIndex
+_EMPTY = 0
+_DELETED = 1
+_MASK64 = (1 << 64) - 1
+
+
+class IndexFileError(Exception):
+    """Raised when index.bin is not a valid binary snapshot."""
+
+
+def key_hash(key_bytes):
+    return int.from_bytes(hashlib.blake2b(key_bytes, digest_size=8).digest(), "big")
+
+
+def is_index_file(path):
+    """True untuk index.bin biner (versi apa pun); False untuk index pickle lama."""
+    with open(path, "rb") as f:
+        return f.read(3) == MAGIC[:3]
+
+
+def write_index(path, index, data_end, history, fsync=False):
+    """
+    Write `index` (key -> (offset, length, version)) and `history` to `path`.
+
+    A LogIndex reuses the sorted hashes of its base file, so only keys
+    written since the last snapshot are hashed and sorted again.
+    """
+    if isinstance(index, LogIndex):
+        rows = index.hashed_items()
+    else:
+        rows = sorted((key_hash(key.encode("utf-8")), key.encode("utf-8"), entry) for key, entry in index.items())
+    hashes = array("Q")
+    slots = bytearray()
+    keys = bytearray()
+    live_bytes = max_version = 0
+    for h, key_bytes, (offset, length, version) in rows:
+        hashes.append(h)
+        slots += SLOT.pack(offset, version, length, len(keys), len(key_bytes))
+        keys += key_bytes
+        live_bytes += length
+        max_version = max(max_version, version)
+    if sys.byteorder != "little":
+        hashes.byteswap()
+    chains = bytearray()
+    for key, chain in history.items():
+        key_bytes = key.encode("utf-8")
+        chains += _CHAIN_HEAD.pack(len(key_bytes)) + key_bytes + _CHAIN_HEAD.pack(len(chain))
+        for offset, length, version in chain:
+            chains += _CHAIN_ENTRY.pack(NO_OFFSET if offset is None else offset, length, version)
+            live_bytes += length
+        if chain:
+            max_version = max(max_version, chain[-1][2])
+    keys_off = HEADER.size + len(hashes) * 8 + len(slots)
+    header = HEADER.pack(MAGIC, len(hashes), data_end, live_bytes, max_version, keys_off, keys_off + len(keys),
+                         len(chains))
+    with open(path, "wb") as f:
+        f.write(header)
+        f.write(hashes.tobytes())
+        f.write(slots)
+        f.write(keys)
+        f.write(chains)
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+
+
+class IndexFile:
+    """Read-only view of a binary index.bin; get() searches the mmap without loading it."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < HEADER.size:
+                raise IndexFileError(f"{path} is truncated")
+            self._buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, self.count, self.data_end, self.live_bytes, self.max_version,
+         self._keys_off, self._history_off, self._history_len) = HEADER.unpack_from(self._buf, 0)
+        self._slots_off = HEADER.size + self.count * 8
+        if (magic != MAGIC or self._keys_off != self._slots_off + self.count * SLOT.size
+                or self._history_off + self._history_len != size):
+            self._buf.close()
+            raise IndexFileError(f"{path} is not a valid index snapshot")
+        hashes = memoryview(self._buf)[HEADER.size:self._slots_off]
+        if sys.byteorder == "little":
+            self._hashes = hashes.cast("Q")
+        else:
+            self._hashes = array("Q", hashes)
+            self._hashes.byteswap()
+            hashes.release()
+
+    def __len__(self):
+        return self.count
+
+    def _key_at(self, key_off, key_len):
+        start = self._keys_off + key_off
+        return self._buf[start:start + key_len]
+
+    def _find(self, h):
+        """Indeks slot pertama dengan hash `h`, atau -1."""
+        i = bisect.bisect_left(self._hashes, h)
+        return i if i < self.count and self._hashes[i] == h else -1
+
+    def lookup(self, key_bytes):
+        """(slot, (offset, length, version)) of `key_bytes`, or (-1, None)."""
+        h = key_hash(key_bytes)
+        i = self._find(h)
+        if i < 0:
+            return -1, None
+        while i < self.count and self._hashes[i] == h:
+            pos = self._slots_off + i * SLOT.size
+            key_off, key_len = _SLOT_KEY.unpack_from(self._buf, pos + _SLOT_ENTRY.size)
+            if key_len == len(key_bytes) and self._key_at(key_off, key_len) == key_bytes:
+                offset, version, length = _SLOT_ENTRY.unpack_from(self._buf, pos)
+                return i, (offset, length, version)
+            i += 1
+        return -1, None
+
+    def get(self, key):
+        """(offset, length, version) of `key`, or None."""
+        return self.lookup(key.encode("utf-8"))[1]
+
+    def hashed_items(self):
+        """(hash, key_bytes, entry) in slot order, i.e. sorted by hash."""
+        with memoryview(self._buf) as buf:
+            keys = buf[self._keys_off:self._history_off]
+            for h, (offset, version, length, key_off, key_len) in zip(
+                    self._hashes, SLOT.iter_unpack(buf[self._slots_off:self._keys_off])):
+                yield h, bytes(keys[key_off:key_off + key_len]), (offset, length, version)
+
+    def items(self):
+        for _, key_bytes, entry in self.hashed_items():
+            yield key_bytes.decode("utf-8"), entry
+
+    def history(self):
+        """Rantai versi {key: [(offset|None, length, version), ...]}, didekode penuh."""
+        history = {}
+        pos, end = self._history_off, self._history_off + self._history_len
+        buf = self._buf
+        while pos < end:
+            (key_len,) = _CHAIN_HEAD.unpack_from(buf, pos)
+            pos += _CHAIN_HEAD.size
+            key = buf[pos:pos + key_len].decode("utf-8")
+            pos += key_len
+            (count,) = _CHAIN_HEAD.unpack_from(buf, pos)
+            pos += _CHAIN_HEAD.size
+            chain = []
+            for _ in range(count):
+                offset, length, version = _CHAIN_ENTRY.unpack_from(buf, pos)
+                pos += _CHAIN_ENTRY.size
+                chain.append((None if offset == NO_OFFSET else offset, length, version))
+            history[key] = chain
+        return history
+
+    def close(self):
+        try:
+            if isinstance(self._hashes, memoryview):
+                self._hashes.release()
+            self._buf.close()
+        except BufferError:
+            pass
+
+
+class PackedIndex:
+    """
+    key -> (offset, length, version) in packed arrays with open addressing.
+
+    A slot costs 32 bytes (hash, offset, length, version, key crc32)
+    and no key string is kept. Every slot was written by put() since the
+    last checkpoint, so its key is confirmed at write time: a lookup
+    matches a slot when both the 64-bit str hash and the 32-bit crc32 of
+    the key agree, without reading data.bin. `key_at(offset, length)`
+    returns a record's key bytes (or None if it cannot be read) and is
+    only used to list the keys for the next snapshot. The table is never
+    written to disk, so it uses the built-in (cached) str hash.
+    """
+
+    def __init__(self, key_at, capacity=8):
+        self._key_at = key_at
+        self._table = self._alloc(capacity)
+        self._used = 0  # slot terisi, termasuk yang ditandai dihapus
+        self._len = 0
+        # Hasil probe terakhir (key, slot, slot bebas, generasi); generasi naik tiap tabel berubah bentuk
+        self._generation = 0
+        self._last = (None, -1, -1, -1)
+
+    @staticmethod
+    def _alloc(capacity):
+        return (array("Q", bytes(8 * capacity)), array("Q", bytes(8 * capacity)),
+                array("I", bytes(4 * capacity)), array("Q", bytes(8 * capacity)),
+                array("I", bytes(4 * capacity)))
+
+    def _probe(self, key):
+        """(tabel, slot key atau -1, slot bebas pertama untuk menyisipkan key ini)."""
+        # Generasi dibaca sebelum tabel; put/pop/resize mengubah tabel sebelum menaikkan generasi
+        generation = self._generation
+        table = self._table
+        last = self._last
+        if last[0] == key and last[3] == generation:
+            # _set_entry memanggil get, set lalu get lagi untuk key yang sama: cukup satu probe
+            return table, last[1], last[2]
+        # Hash 0 = slot kosong, 1 = slot dihapus
+        h = hash(key) & _MASK64
+        if h <= _DELETED:
+            h += 2
+        hashes, checks = table[0], table[4]
+        mask = len(hashes) - 1
+        i = h & mask
+        perturb = h
+        free = -1
+        check = None
+        while True:
+            slot_h = hashes[i]
+            if slot_h == _EMPTY:
+                found = -1
+                if free < 0:
+                    free = i
+                break
+            if slot_h == _DELETED:
+                if free < 0:
+                    free = i
+            elif slot_h == h:
+                # Hash 64-bit dan crc32 harus sama-sama cocok (~n / 2^96 peluang salah per lookup)
+                if check is None:
+                    check = zlib.crc32(key.encode("utf-8"))
+                if checks[i] == check:
+                    found = i
+                    break
+            perturb >>= 5
+            i = (5 * i + perturb + 1) & mask
+        self._last = (key, found, free, generation)
+        return table, found, free
+
+    def __len__(self):
+        return self._len
+
+    def get(self, key, default=None):
+        table, i, _ = self._probe(key)
+        if i < 0:
+            return default
+        return table[1][i], table[2][i], table[3][i]
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def put(self, key, entry):
+        """Set `key`; returns True if it was not present."""
+        table, i, free = self._probe(key)
+        if i >= 0:
+            table[1][i], table[2][i], table[3][i] = entry
+            return False
+        if (self._used + 1) * 3 > len(table[0]) * 2:
+            self._resize()
+            table, i, free = self._probe(key)
+        hashes, offsets, lengths, versions, checks = table
+        offsets[free], lengths[free], versions[free] = entry
+        if hashes[free] == _EMPTY:
+            self._used += 1
+        checks[free] = zlib.crc32(key.encode("utf-8"))
+        h = hash(key) & _MASK64
+        hashes[free] = h if h > _DELETED else h + 2
+        self._len += 1
+        self._generation += 1
+        self._last = (key, free, -1, self._generation)
+        return True
+
+    def pop(self, key, default=None):
+        table, i, _ = self._probe(key)
+        if i < 0:
+            return default
+        table[0][i] = _DELETED
+        self._generation += 1
+        self._len -= 1
+        return table[1][i], table[2][i], table[3][i]
+
+    def _resize(self):
+        # Setelah resize terisi paling banyak sepertiga, resize berikutnya saat dua pertiga
+        capacity = 8
+        while capacity < (self._len + 1) * 3:
+            capacity *= 2
+        table = self._alloc(capacity)
+        hashes, offsets, lengths, versions, checks = table
+        mask = capacity - 1
+        for h, offset, length, version, check in zip(*self._table):
+            if h <= _DELETED:
+                continue
+            i = h & mask
+            perturb = h
+            while hashes[i] != _EMPTY:
+                perturb >>= 5
+                i = (5 * i + perturb + 1) & mask
+            offsets[i], lengths[i], versions[i], checks[i], hashes[i] = offset, length, version, check, h
+        self._table = table
+        self._generation += 1
+        self._used = self._len
+
+    def raw_items(self):
+        """(key_bytes, entry) untuk semua key; key dibaca ulang lewat key_at."""
+        for h, offset, length, version, _ in zip(*self._table):
+            if h > _DELETED:
+                key_bytes = self._key_at(offset, length)
+                # Record yang tidak terbaca lagi (data.bin terpotong) ikut hilang di snapshot berikutnya
+                if key_bytes is not None:
+                    yield key_bytes, (offset, length, version)
+
+    def items(self):
+        return [(key_bytes.decode("utf-8"), entry) for key_bytes, entry in self.raw_items()]
+
+    def memory_bytes(self):
+        return sum(column.itemsize * len(column) for column in self._table)
+
+
+class LogIndex(MutableMapping):
+    """
+    key -> (offset, length, version) of the log tier.
+
+    Entries changed since the last snapshot live in a PackedIndex, the
+    rest are read from the memory-mapped IndexFile; a bitmap marks base
+    slots that were deleted or overridden since. Opening a replica
+    allocates neither a dict nor a string per key.
+    """
+
+    def __init__(self, base, key_at):
+        self.base = base
+        self._changed = PackedIndex(key_at)
+        count = len(base) if base is not None else 0
+        self._shadowed = bytearray((count + 7) // 8)
+        self._len = count
+        # (key, slot, entry) pencarian base terakhir: _set_entry memanggil get lalu set untuk key yang sama
+        self._probe = (None, -1, None)
+        # (key, entry atau None) hasil get/set terakhir; _trim_history dan _promote membaca key yang baru ditulis
+        self._last = (None, None)
+
+    def _base_lookup(self, key):
+        probe = self._probe
+        if probe[0] == key:
+            return probe[1], probe[2]
+        slot, entry = self.base.lookup(key.encode("utf-8")) if self.base is not None else (-1, None)
+        self._probe = (key, slot, entry)
+        return slot, entry
+
+    def _base_slot(self, key):
+        return self._base_lookup(key)[0]
+
+    def _is_shadowed(self, slot):
+        return self._shadowed[slot >> 3] & (1 << (slot & 7))
+
+    def _shadow(self, slot):
+        self._shadowed[slot >> 3] |= 1 << (slot & 7)
+
+    def get(self, key, default=None):
+        last = self._last
+        if last[0] == key:
+            entry = last[1]
+        else:
+            entry = self._changed.get(key) if len(self._changed) else None
+            if entry is None:
+                slot, entry = self._base_lookup(key)
+                if slot < 0 or self._is_shadowed(slot):
+                    entry = None
+            self._last = (key, entry)
+        return default if entry is None else entry
+
+    def __getitem__(self, key):
+        entry = self.get(key)
+        if entry is None:
+            raise KeyError(key)
+        return entry
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __setitem__(self, key, entry):
+        if self._changed.put(key, entry):
+            slot = self._base_slot(key)
+            if slot < 0 or self._is_shadowed(slot):
+                # Key baru, atau key base yang sudah dihapus
+                self._len += 1
+            else:
+                self._shadow(slot)
+        self._last = (key, entry)
+
+    def __delitem__(self, key):
+        if self._changed.pop(key) is None:
+            slot = self._base_slot(key)
+            if slot < 0 or self._is_shadowed(slot):
+                raise KeyError(key)
+            self._shadow(slot)
+        self._len -= 1
+        self._last = (key, None)
+
+    def pop(self, key, *default):
+        entry = self.get(key)
+        if entry is None:
+            if default:
+                return default[0]
+            raise KeyError(key)
+        del self[key]
+        return entry
+
+    def __len__(self):
+        return self._len
+
+    def _base_items(self):
+        if self.base is None:
+            return iter(())
+        live = (not self._is_shadowed(slot) for slot in range(len(self.base)))
+        return compress(self.base.hashed_items(), live)
+
+    def __iter__(self):
+        for _, key_bytes, _ in self._base_items():
+            yield key_bytes.decode("utf-8")
+        for key_bytes, _ in list(self._changed.raw_items()):
+            yield key_bytes.decode("utf-8")
+
+    def items(self):
+        return ([(key_bytes.decode("utf-8"), entry) for _, key_bytes, entry in self._base_items()]
+                + self._changed.items())
+
+    def values(self):
+        return [entry for _, entry in self.items()]
+
+    def clear(self):
+        self.base = None
+        self._changed = PackedIndex(self._changed._key_at)
+        self._shadowed = bytearray()
+        self._len = 0
+        self._probe = (None, -1, None)
+        self._last = (None, None)
+
+    def hashed_items(self):
+        """Semua entry sebagai (hash, key_bytes, entry) terurut hash; hanya key yang berubah di-hash ulang."""
+        changed = sorted((key_hash(key_bytes), key_bytes, entry) for key_bytes, entry in self._changed.raw_items())
+        return heapq.merge(self._base_items(), changed)
+
+    def memory_bytes(self):
+        """Heap yang dipakai index ini (tanpa page cache mmap)."""
+        return self._changed.memory_bytes() + len(self._shadowed)
+
+    def close(self):
+        if self.base is not None:
+            self.base.close()
@@ -1,93 +1,241 @@
 # ===== File: core/measure.py =====
 import time
 import os
-import matplotlib.pyplot as plt
+import shutil
+import tempfile
 
-def measure_performance(store):
-    put_latencies = []
-    get_latencies_hot = []
-    get_latencies_cold = []
-    keys = [f"perf{i}" for i in range(100)]
+def measure_performance(store, workloads=("c", "b", "a"), records=2_000, operations=20_000, threads=4):
+    """
+    Ringkasan performa singkat untuk perintah `perf`: beberapa workload YCSB
+    (core/bench.py) dijalankan terhadap `store`, lalu key uji dihapus lagi.
+    Untuk benchmark skala besar gunakan `python3 -m core.bench`.
 
-    # Measure PUT
-    start_total = time.perf_counter()
-    for k in keys:
+    Returns:
+        dict: {workload: laporan benchmark()}
+    """
+    from core.bench import benchmark, record_key
+
+    results = {}
+    try:
+        for i, workload in enumerate(workloads):
+            results[workload] = benchmark(store, workload, records, operations, threads, skip_load=i > 0)
+    finally:
+        store.delete_many([record_key(n) for n in range(records)])
+    print("\n--- Evaluasi Performa ---")
+    for workload, report in results.items():
+        run = report["run"]
+        print(f"Workload {workload} {report['config']['mix']}: {run['throughput']:,.0f} ops/s")
+        for op, stats in run["latency"].items():
+            print(f"  {op:18s} p50 {stats['p50_ms']:.3f} ms, p99 {stats['p99_ms']:.3f} ms, "
+                  f"p999 {stats['p999_ms']:.3f} ms")
+    return results
+
+
+def measure_put_scaling(sizes=(1_000, 10_000, 100_000), window=1_000, batch=1_000):
+    """
+    Ukur throughput PUT cold pada beberapa ukuran shard.
+
+    Untuk tiap ukuran N, shard diisi sampai N key (put_many per `batch`) lalu
+    `window` put terakhir diukur lewat `Storage.put()`, sehingga terlihat
+    apakah biaya write ikut naik seiring N.
+
+    Returns:
+        list: [(N, ops/sec)] untuk tiap ukuran.
+    """
+    from core.storage import Storage
+
+    results = []
+    tmp_dir = tempfile.mkdtemp(prefix="kv_bench_")
+    store = None
+    try:
+        store = Storage(os.path.join(tmp_dir, "shard"))
+        filled = 0
+        for size in sorted(sizes):
+            while filled < size - window:
+                count = min(batch, size - window - filled)
+                store.put_many([(f"k{n}", {"value": n}) for n in range(filled, filled + count)])
+                filled += count
+            start = time.perf_counter()
+            while filled < size:
+                store.put(f"k{filled}", {"value": filled}, write_to_cold=True)
+                filled += 1
+            throughput = window / (time.perf_counter() - start)
+            results.append((size, throughput))
+            print(f"N={size:>9}: {throughput:,.0f} put/sec")
+    finally:
+        # Tutup dulu: flush segmen di background masih memakai file shard
+        if store is not None:
+            store.close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return results
+
+
+def measure_durability(modes=("flush", "fsync", "group"), num_threads=8, puts_per_thread=200, group_commit_ms=5):
+    """
+    Bandingkan throughput PUT antar mode durability dengan banyak writer paralel.
+
+    Returns:
+        dict: {mode: ops/sec}
+    """
+    import threading
+    from core.storage import Storage
+
+    results = {}
+    tmp_dir = tempfile.mkdtemp(prefix="kv_bench_")
+    try:
+        for mode in modes:
+            store = Storage(os.path.join(tmp_dir, mode), hot_budget=64 * 1024,
+                            durability=mode, group_commit_ms=group_commit_ms)
+
+            def writer(thread_id):
+                for i in range(puts_per_thread):
+                    store.put(f"t{thread_id}_{i}", {"value": i})
+
+            threads = [threading.Thread(target=writer, args=(n,)) for n in range(num_threads)]
+            start = time.perf_counter()
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            results[mode] = num_threads * puts_per_thread / (time.perf_counter() - start)
+            store.close()
+            print(f"{mode:>6}: {results[mode]:,.0f} put/sec ({num_threads} threads)")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return results
+
+
+def measure_codecs(num_records=5_000, dict_size=16 * 1024, binary=True):
+    """
+    Bandingkan codec value: byte di disk serta throughput encode/decode.
+
+    Record contoh meniru value kecil {"name", "age", "jurusan"}; codec yang
+    paketnya tidak terpasang dilewati. binary=False memakai serialisasi JSON
+    lama untuk perbandingan dengan serialisasi biner per skema.
+
+    Returns:
+        dict: {codec: {"bytes", "encode_ops", "decode_ops"}}
+    """
+    from core.encoder import Encoder, CODECS, train_dictionary
+
+    samples = [(f"user{i}", {"name": f"mahasiswa{i}", "age": 18 + i % 10, "jurusan": ("sisfor", "informatika")[i % 2]})
+               for i in range(num_records)]
+    dictionary = None
+    dictionaries = {}
+    if CODECS["zstd-dict"].available:
+        dictionary = train_dictionary([(value, 2) for _, value in samples[:2000]], dict_size, binary)
+        dictionaries = {dictionary.dict_id(): dictionary}
+
+    results = {}
+    for name, codec in CODECS.items():
+        if not codec.available:
+            print(f"{name:>10}: dilewati (paket tidak terpasang)")
+            continue
         start = time.perf_counter()
-        store.put(k, {"value": k}, write_to_cold=False)
-        put_latencies.append((time.perf_counter() - start) * 1000)
-    put_time = time.perf_counter() - start_total
-    put_throughput = len(keys) / put_time
-
-    # Measure GET (Hot)
-    start_total = time.perf_counter()
-    for k in keys:
+        records = [Encoder.encode(key, value, 2, codec=name, dictionary=dictionary, binary=binary)
+                   for key, value in samples]
+        encode_time = time.perf_counter() - start
         start = time.perf_counter()
-        store.get(k)
-        get_latencies_hot.append((time.perf_counter() - start) * 1000)
-    get_hot_time = time.perf_counter() - start_total
-    get_hot_throughput = len(keys) / get_hot_time
-
-    # Simulasi day change → pindahkan ke cold
-    store.day_change()
-    for shard in store.shards:
-        for replica in shard:
-            replica.hot.clear()
-
-    # Measure GET (Cold)
-    start_total = time.perf_counter()
-    for k in keys:
+        for record in records:
+            Encoder.decode(record, dictionaries)
+        decode_time = time.perf_counter() - start
+        results[name] = {
+            "bytes": sum(len(record) for record in records),
+            "encode_ops": num_records / encode_time,
+            "decode_ops": num_records / decode_time,
+        }
+        print(f"{name:>10}: {results[name]['bytes']:>9,} byte, encode {results[name]['encode_ops']:>9,.0f}/s, "
+              f"decode {results[name]['decode_ops']:>9,.0f}/s")
+    return results
+
+
+def measure_negative_lookups(num_keys=50_000, lookups=50_000):
+    """
+    Latensi get() untuk key yang tidak ada: dijawab Bloom filter vs jalur index.
+
+    Returns:
+        dict: {"bloom_ns", "index_ns", "stats"} dengan stats dari Storage.bloom_stats().
+    """
+    from core.storage import Storage
+
+    tmp_dir = tempfile.mkdtemp(prefix="kv_bench_")
+    try:
+        store = Storage(os.path.join(tmp_dir, "bloom"), hot_budget=64 * 1024, compact_threshold=None)
+        store.put_many([(f"key{i}", {"value": i}) for i in range(num_keys)])
+        store.hot.clear()
+        absent = [f"absent{i}" for i in range(lookups)]
+
         start = time.perf_counter()
-        store.get(k)
-        get_latencies_cold.append((time.perf_counter() - start) * 1000)
-    get_cold_time = time.perf_counter() - start_total
-    get_cold_throughput = len(keys) / get_cold_time
-
-    # Hitung rata-rata latency
-    avg_put = sum(put_latencies) / len(put_latencies)
-    avg_get_hot = sum(get_latencies_hot) / len(get_latencies_hot)
-    avg_get_cold = sum(get_latencies_cold) / len(get_latencies_cold)
-
-    # Simulasi fault tolerance (hapus sementara cold file)
-    success = True
-    target_file = "data/cold_store/shard0_rep0/data.bin"
-    temp_file = target_file + ".bak"
-    if os.path.exists(target_file):
-        os.rename(target_file, temp_file)
-        try:
-            val = store.get("perf0")
-            if not val:
-                success = False
-        except:
-            success = False
-        os.rename(temp_file, target_file)
-
-    # Tampilkan hasil evaluasi
-    print("\n--- Evaluasi Performa ---")
-    print(f"Rata-rata PUT latency     : {avg_put:.2f} ms")
-    print(f"Throughput PUT            : {put_throughput:.2f} ops/sec")
-    print(f"Rata-rata GET dari HOT    : {avg_get_hot:.2f} ms")
-    print(f"Throughput GET (Hot)      : {get_hot_throughput:.2f} ops/sec")
-    print(f"Rata-rata GET dari COLD   : {avg_get_cold:.2f} ms")
-    print(f"Throughput GET (Cold)     : {get_cold_throughput:.2f} ops/sec")
-    check_icon = "✅ Berhasil" if success else "❌ Gagal"
-    print(f"Fault tolerance           : {check_icon}")
-
-    # Buat grafik perbandingan
-    fig, ax1 = plt.subplots()
-    ax1.bar(['Put', 'Get (Hot)', 'Get (Cold)'],
-            [avg_put, avg_get_hot, avg_get_cold],
-            color='b', alpha=0.5)
-    ax1.set_ylabel("Latency (ms)", color='b')
-    ax1.tick_params(axis='y', labelcolor='b')
-
-    ax2 = ax1.twinx()
-    ax2.plot(['Put', 'Get (Hot)', 'Get (Cold)'],
-             [put_throughput, get_hot_throughput, get_cold_throughput],
-             color='r', marker='o')
-    ax2.set_ylabel("Throughput (ops/sec)", color='r')
-    ax2.tick_params(axis='y', labelcolor='r')
-
-    plt.title("Perbandingan Latency dan Throughput")
-    fig.tight_layout()
-    plt.savefig("performance_eval.png")
-    print("✓ Grafik disimpan sebagai performance_eval.png")
+        for key in absent:
+            store.get(key)
+        bloom_ns = (time.perf_counter() - start) / lookups * 1e9
+        stats = store.bloom_stats()
+
+        # Tanpa filter: tiap miss mengambil read lock dan mencari di index
+        bloom, store.bloom = store.bloom, type("AlwaysMaybe", (), {"__contains__": lambda self, key: True})()
+        start = time.perf_counter()
+        for key in absent:
+            store.get(key)
+        index_ns = (time.perf_counter() - start) / lookups * 1e9
+        store.bloom = bloom
+        store.close()
+        print(f"Miss lewat bloom: {bloom_ns:,.0f} ns, lewat index: {index_ns:,.0f} ns, "
+              f"FPR terukur {stats['measured_fpr']:.4f} (perkiraan {stats['expected_fpr']:.4f}), "
+              f"filter {stats['memory_bytes']:,} byte untuk {stats['keys']:,} key")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return {"bloom_ns": bloom_ns, "index_ns": index_ns, "stats": stats}
+
+
+def measure_read_policies(policies=("primary", "round_robin", "least_outstanding", "hedged"), num_keys=2_000,
+                          reads=2_000, num_threads=4, slow_ms=20, slow_every=50):
+    """
+    Latensi baca ShardManager per read policy saat replika 0 sesekali lambat
+    (tiap `slow_every` baca tertunda `slow_ms`), untuk melihat efek hedging
+    dan penyebaran beban pada tail latency.
+
+    Returns:
+        dict: {policy: {"p50_ms", "p99_ms", "per_replica"}}
+    """
+    import itertools
+    import threading
+    from core.metrics import LatencyHistogram
+    from core.shard_manager import ShardManager
+
+    results = {}
+    tmp_dir = tempfile.mkdtemp(prefix="kv_bench_")
+    try:
+        store = ShardManager(num_shards=2, replica_count=2, base_path=tmp_dir, hot_budget=1 << 20)
+        store.put_many({f"key{i}": {"value": i} for i in range(num_keys)})
+        counter = itertools.count()
+        for shard in store.shards.values():
+            primary = shard[0]
+
+            def slow_get(*args, _get=primary.get, **kwargs):
+                if next(counter) % slow_every == 0:
+                    time.sleep(slow_ms / 1000)
+                return _get(*args, **kwargs)
+            primary.get = slow_get
+
+        for policy in policies:
+            store.set_read_policy(policy)
+            latency = LatencyHistogram()
+
+            def reader(tid):
+                for i in range(tid, reads, num_threads):
+                    start = time.perf_counter()
+                    store.get(f"key{i % num_keys}")
+                    latency.record(time.perf_counter() - start)
+            threads = [threading.Thread(target=reader, args=(t,)) for t in range(num_threads)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            stats = latency.snapshot()
+            per_replica = [sum(loads[r]["count"] for loads in store.read_stats().values()) for r in range(2)]
+            results[policy] = {"p50_ms": stats["p50_ms"], "p99_ms": stats["p99_ms"], "per_replica": per_replica}
+            print(f"{policy:18s}: p50 {stats['p50_ms']:.3f} ms, p99 {stats['p99_ms']:.3f} ms, "
+                  f"baca kumulatif per replika {per_replica}")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return results
@@ -0,0 +1,82 @@
+# === File: core/merkle.py ===
+import hashlib
+from core.ring import ring_hash
+
+MERKLE_DEPTH = 10
+
+
+def key_digest(key, version):
+    """Digest 64-bit dari key dan versi MVCC terbarunya; value tidak perlu dibaca."""
+    data = key.encode("utf-8") + version.to_bytes(8, "big")
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "big")
+
+
+def _node_hash(left, right):
+    data = left.to_bytes(8, "big") + right.to_bytes(8, "big")
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "big")
+
+
+class MerkleTree:
+    """
+    Merkle tree over a replica's keyspace, split by ring hash into 2**depth leaves.
+
+    A leaf is the XOR of the digests of its (key, version) pairs, so it does
+    not depend on iteration order; inner nodes hash their two children.
+    Two replicas holding the same keys at the same versions have the same
+    root, and diff() only descends into subtrees whose hashes differ.
+    """
+
+    def __init__(self, depth=MERKLE_DEPTH):
+        self.depth = depth
+        self.leaves = [0] * (1 << depth)
+        self._levels = None
+
+    def leaf(self, key):
+        return ring_hash(key) >> (32 - self.depth)
+
+    def add(self, key, version):
+        self.leaves[self.leaf(key)] ^= key_digest(key, version)
+        self._levels = None
+
+    @classmethod
+    def build(cls, versions, depth=MERKLE_DEPTH):
+        """Tree dari pasangan (key, version)."""
+        tree = cls(depth)
+        for key, version in versions:
+            tree.add(key, version)
+        return tree
+
+    def levels(self):
+        """[root], [2 node], ..., leaves."""
+        if self._levels is None:
+            levels = [self.leaves]
+            while len(levels[0]) > 1:
+                below = levels[0]
+                levels.insert(0, [_node_hash(below[i], below[i + 1]) for i in range(0, len(below), 2)])
+            self._levels = levels
+        return self._levels
+
+    def root(self):
+        return self.levels()[0][0]
+
+    def diff(self, other):
+        """Leaf ids whose hashes differ between the two trees, visiting only differing subtrees."""
+        if other.depth != self.depth:
+            raise ValueError("Merkle trees of different depth")
+        mine, theirs = self.levels(), other.levels()
+        nodes = [0] if mine[0][0] != theirs[0][0] else []
+        for level in range(1, self.depth + 1):
+            nodes = [child for node in nodes for child in (2 * node, 2 * node + 1)
+                     if mine[level][child] != theirs[level][child]]
+        return nodes
+
+
+class LeafFilter:
+    """Predicate key -> bool: key jatuh di salah satu `leaves`. Bisa di-pickle, jadi juga jalan di proses shard."""
+
+    def __init__(self, depth, leaves):
+        self.depth = depth
+        self.leaves = frozenset(leaves)
+
+    def __call__(self, key):
+        return ring_hash(key) >> (32 - self.depth) in self.leaves
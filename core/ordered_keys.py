@@ -0,0 +1,106 @@
+# === File: core/ordered_keys.py ===
+import bisect
+from itertools import islice
+
+
+def prefix_end(prefix):
+    """Smallest string greater than every string starting with `prefix` (None = unbounded)."""
+    while prefix:
+        last = ord(prefix[-1])
+        if last < 0x10FFFF:
+            return prefix[:-1] + chr(last + 1)
+        prefix = prefix[:-1]
+    return None
+
+
+class OrderedKeys:
+    """
+    Sorted set of string keys kept as a list of sorted chunks.
+
+    Insert and delete cost O(log N + chunk size); range iteration starts
+    with a bisect over the chunk maxima, so a prefix or range lookup costs
+    O(log N + results) instead of a scan over every key.
+    """
+
+    def __init__(self, keys=(), load=512):
+        self._load = load
+        keys = sorted(set(keys))
+        self._chunks = [keys[i:i + load] for i in range(0, len(keys), load)]
+        self._maxes = [chunk[-1] for chunk in self._chunks]
+        self._len = len(keys)
+
+    def __len__(self):
+        return self._len
+
+    def __contains__(self, key):
+        i = bisect.bisect_left(self._maxes, key)
+        if i == len(self._maxes):
+            return False
+        chunk = self._chunks[i]
+        j = bisect.bisect_left(chunk, key)
+        return j < len(chunk) and chunk[j] == key
+
+    def add(self, key):
+        if not self._chunks:
+            self._chunks.append([key])
+            self._maxes.append(key)
+            self._len = 1
+            return
+        i = bisect.bisect_left(self._maxes, key)
+        if i == len(self._maxes):
+            i -= 1
+            chunk = self._chunks[i]
+            chunk.append(key)
+            self._maxes[i] = key
+        else:
+            chunk = self._chunks[i]
+            j = bisect.bisect_left(chunk, key)
+            if j < len(chunk) and chunk[j] == key:
+                return
+            chunk.insert(j, key)
+        self._len += 1
+        if len(chunk) > 2 * self._load:
+            # Pecah chunk yang terlalu besar agar insert tetap murah
+            self._chunks[i:i + 1] = [chunk[:self._load], chunk[self._load:]]
+            self._maxes[i:i + 1] = [chunk[self._load - 1], chunk[-1]]
+
+    def discard(self, key):
+        i = bisect.bisect_left(self._maxes, key)
+        if i == len(self._maxes):
+            return
+        chunk = self._chunks[i]
+        j = bisect.bisect_left(chunk, key)
+        if j == len(chunk) or chunk[j] != key:
+            return
+        del chunk[j]
+        self._len -= 1
+        if not chunk:
+            del self._chunks[i]
+            del self._maxes[i]
+        elif j == len(chunk):
+            self._maxes[i] = chunk[-1]
+
+    def clear(self):
+        self._chunks = []
+        self._maxes = []
+        self._len = 0
+
+    def irange(self, start=None, end=None):
+        """Yield keys with start <= key < end in order; the set must not change while iterating."""
+        i = 0 if start is None else bisect.bisect_left(self._maxes, start)
+        j = 0 if start is None or i == len(self._chunks) else bisect.bisect_left(self._chunks[i], start)
+        for chunk in islice(self._chunks, i, None):
+            if end is not None and chunk[-1] >= end:
+                for key in islice(chunk, j, None):
+                    if key >= end:
+                        return
+                    yield key
+                return
+            yield from islice(chunk, j, None)
+            j = 0
+
+    def range(self, start=None, end=None, limit=None):
+        return list(islice(self.irange(start, end), limit))
+
+    def prefix(self, prefix, limit=None):
+        return self.range(prefix, prefix_end(prefix), limit)
@@ -0,0 +1,93 @@
+# === File: core/protocol.py ===
+"""
+Binary wire protocol shared by core/server.py and core/client.py.
+
+Every frame is length-prefixed so requests can be pipelined:
+
+    request : [length:4B][req_id:4B][op:1B][payload]
+    response: [length:4B][req_id:4B][status:1B][payload]
+
+`length` counts the bytes after the length field itself. Keys are encoded
+as [len:2B][utf-8], values as [len:4B][json utf-8].
+"""
+import json
+import struct
+
+HEADER = struct.Struct("!IIB")
+MAX_FRAME = 64 * 1024 * 1024
+
+OP_PING = 0
+OP_GET = 1
+OP_PUT = 2
+OP_DELETE = 3
+OP_GET_MANY = 4
+OP_PUT_MANY = 5
+OP_DELETE_MANY = 6
+OP_SCAN = 7
+OP_STATS = 8
+
+STATUS_OK = 0
+STATUS_NOT_FOUND = 1
+STATUS_ERROR = 2
+
+FLAG_WRITE_TO_COLD = 0x01
+FLAG_ASYNC = 0x02
+
+_U16 = struct.Struct("!H")
+_U32 = struct.Struct("!I")
+
+
+class ProtocolError(Exception):
+    """Raised for malformed frames."""
+    pass
+
+
+def pack_frame(req_id, code, payload=b""):
+    return HEADER.pack(len(payload) + 5, req_id, code) + payload
+
+
+def pack_key(key):
+    data = key.encode("utf-8")
+    return _U16.pack(len(data)) + data
+
+
+def pack_value(value):
+    data = json.dumps(value, separators=(",", ":")).encode("utf-8")
+    return _U32.pack(len(data)) + data
+
+
+def pack_count(count):
+    return _U32.pack(count)
+
+
+class Reader:
+    """Cursor over a frame payload."""
+
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def _take(self, n):
+        if self.pos + n > len(self.data):
+            raise ProtocolError("Truncated payload")
+        chunk = self.data[self.pos:self.pos + n]
+        self.pos += n
+        return chunk
+
+    def u8(self):
+        return self._take(1)[0]
+
+    def count(self):
+        return _U32.unpack(self._take(4))[0]
+
+    def key(self):
+        (n,) = _U16.unpack(self._take(2))
+        return bytes(self._take(n)).decode("utf-8")
+
+    def value(self):
+        (n,) = _U32.unpack(self._take(4))
+        return json.loads(bytes(self._take(n)))
+
+    def optional_key(self):
+        (n,) = _U16.unpack(self._take(2))
+        return bytes(self._take(n)).decode("utf-8") if n else None
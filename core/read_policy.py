@@ -0,0 +1,61 @@
+# === File: core/read_policy.py ===
+import threading
+import time
+from core.metrics import LatencyHistogram
+
+# primary           : selalu replika 0 dulu (perilaku lama)
+# round_robin       : bergiliran antar replika yang memenuhi consistency
+# least_outstanding : replika dengan baca berjalan paling sedikit, seri dipecah oleh latency rata-rata
+# hedged            : seperti least_outstanding, tapi jika jawaban belum datang setelah ambang
+#                     latency, baca yang sama dikirim ke replika kedua dan jawaban pertama dipakai
+READ_POLICIES = ("primary", "round_robin", "least_outstanding", "hedged")
+
+# strong           : hanya replika yang tidak tertinggal (primary, follower jika antrean replikasi kosong)
+# read_your_writes : follower boleh, kecuali key masih punya write async yang belum diterapkan
+# eventual         : replika mana pun, follower mungkin tertinggal
+CONSISTENCY_LEVELS = ("strong", "read_your_writes", "eventual")
+
+
+class ReplicaLoad:
+    """Baca yang sedang berjalan dan histogram latency baca satu replika."""
+
+    def __init__(self):
+        self.outstanding = 0
+        self.latency = LatencyHistogram()
+        self._lock = threading.Lock()
+
+    def call(self, fn, *args, **kwargs):
+        with self._lock:
+            self.outstanding += 1
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.latency.record(time.perf_counter() - start)
+            with self._lock:
+                self.outstanding -= 1
+
+    def stats(self):
+        return dict(self.latency.snapshot(), outstanding=self.outstanding)
+
+
+def order_replicas(policy, candidates, loads, turn):
+    """
+    Order replica ids to try for one read.
+
+    Args:
+        candidates (list): Replica ids allowed by the consistency level, primary first.
+        loads (list): ReplicaLoad per replica id.
+        turn (int): Monotonic counter, used by round_robin.
+
+    Returns:
+        list: The same ids, preferred replica first; the rest are failover order.
+    """
+    if policy == "primary" or len(candidates) < 2:
+        return list(candidates)
+    if policy == "round_robin":
+        i = turn % len(candidates)
+        return candidates[i:] + candidates[:i]
+    # least_outstanding / hedged: urutan stabil agar seri jatuh ke primary
+    return sorted(candidates, key=lambda replica_id: (loads[replica_id].outstanding,
+                                                      loads[replica_id].latency.mean() or 0.0))
@@ -0,0 +1,268 @@
+import json
+import logging
+import os
+import pickle
+import struct
+import threading
+import time
+import zlib
+from collections import deque
+
+from core.storage import deferred_sync
+
+# Format entry log replikasi: [seq:8B][waktu_us:8B][len:4B][crc32:4B][pickle (method, args)]
+_ENTRY = struct.Struct("!QQII")
+# Log dipotong ke 0 saat semua follower sudah menyusul dan ukurannya melewati batas ini
+LOG_TRUNCATE_BYTES = 4 << 20
+READ_CHUNK = 1 << 20
+RETRY_SECONDS = 1.0
+
+
+class _Follower:
+    """Posisi satu follower di log: seq terakhir yang diterapkan dan offset byte entry berikutnya."""
+
+    def __init__(self, replica):
+        self.replica = replica
+        self.offset_file = os.path.join(replica.cold_path, "replication.json")
+        self.applied = 0
+        self.pos = 0
+        self.offline = False
+        self.retry_at = 0.0
+        if os.path.exists(self.offset_file):
+            try:
+                with open(self.offset_file) as f:
+                    self.applied = json.load(f)["seq"]
+            except (OSError, ValueError, KeyError) as e:
+                logging.warning(f"Cannot read {self.offset_file}, replaying the whole log: {e}")
+
+    def save(self):
+        tmp_file = self.offset_file + ".tmp"
+        with open(tmp_file, "w") as f:
+            json.dump({"seq": self.applied}, f)
+        os.replace(tmp_file, self.offset_file)
+
+
+def _parse_entries(data, pos=0):
+    """Yield (seq, timestamp_us, payload, end) of the complete, valid entries in `data` from `pos`."""
+    while pos + _ENTRY.size <= len(data):
+        seq, timestamp, length, crc = _ENTRY.unpack_from(data, pos)
+        start = pos + _ENTRY.size
+        end = start + length
+        if end > len(data) or zlib.crc32(data[start:end]) != crc:
+            return
+        yield seq, timestamp, data[start:end], end
+        pos = end
+
+
+class ReplicationWorker:
+    """
+    Durable replication pipeline for one shard.
+
+    Writes that cannot be applied to the followers directly are appended
+    once, with a sequence number, to the shard's replication log on disk.
+    A dedicated thread streams the log to each follower in batches and
+    records the follower's applied sequence next to its data
+    (replication.json), so after a crash or an outage every follower
+    catches up from its own offset. Batches are applied under the shard's
+    write lock so followers see writes in the same order as the primary.
+    A follower that fails is retried from the same offset; writers only
+    wait for the followers that are online.
+    """
+
+    def __init__(self, shard_id, followers, shard_lock, log_path, batch_size=256, fsync=False):
+        self.shard_id = shard_id
+        self.followers = [_Follower(replica) for replica in followers]
+        self.shard_lock = shard_lock
+        self.log_path = log_path
+        self.batch_size = batch_size
+        self.fsync = fsync
+        self.enqueued_seq = 0
+        self._pending = deque()  # (seq, waktu enqueue) yang belum diterapkan semua follower
+        self._cond = threading.Condition()
+        self._closed = False
+        self._recover()
+        self._log = open(log_path, "ab")
+        self.thread = threading.Thread(target=self._run, name=f"replication-shard{shard_id}", daemon=True)
+        self.thread.start()
+
+    def _recover(self):
+        """Baca log yang tersisa: potong ekor yang terpotong crash, tentukan posisi tiap follower."""
+        data = b""
+        if os.path.exists(self.log_path):
+            with open(self.log_path, "rb") as f:
+                data = f.read()
+        entries = [(seq, timestamp, end) for seq, timestamp, _, end in _parse_entries(data)]
+        valid_end = entries[-1][2] if entries else 0
+        if valid_end < len(data):
+            logging.warning(f"Truncating torn tail of {self.log_path} at {valid_end}")
+            with open(self.log_path, "r+b") as f:
+                f.truncate(valid_end)
+        first = entries[0][0] if entries else None
+        self.enqueued_seq = max([entries[-1][0] if entries else 0] + [f.applied for f in self.followers])
+        for follower in self.followers:
+            if first is None or follower.applied < first - 1:
+                # Log sudah dipotong melewati offset ini: offset basi, follower dianggap sudah menyusul
+                follower.applied = max(follower.applied, first - 1 if first is not None else self.enqueued_seq)
+            start = 0
+            for seq, _, end in entries:
+                if seq > follower.applied:
+                    break
+                start = end
+            follower.pos = start
+        floor = self.applied_seq
+        self._pending.extend((seq, timestamp / 1_000_000) for seq, timestamp, _ in entries if seq > floor)
+        if self._pending:
+            logging.info(f"Replication log of shard{self.shard_id}: {len(self._pending)} writes to catch up")
+
+    @property
+    def applied_seq(self):
+        """Seq terbesar yang sudah diterapkan di semua follower."""
+        return min((f.applied for f in self.followers), default=self.enqueued_seq)
+
+    def enqueue(self, method, *args, applied=()):
+        """
+        Append a write to the log and wake the worker.
+
+        Args:
+            applied: Followers that already applied it directly (they are caught up to it).
+        """
+        payload = pickle.dumps((method, args), protocol=pickle.HIGHEST_PROTOCOL)
+        with self._cond:
+            self.enqueued_seq += 1
+            seq = self.enqueued_seq
+            now = time.time()
+            self._log.write(_ENTRY.pack(seq, int(now * 1_000_000), len(payload), zlib.crc32(payload)) + payload)
+            self._log.flush()
+            if self.fsync:
+                os.fsync(self._log.fileno())
+            for follower in applied:
+                follower.applied = seq
+                follower.pos = self._log.tell()
+            self._pending.append((seq, now))
+            self._cond.notify_all()
+        return seq
+
+    def replicate(self, method, *args):
+        """
+        Apply a write to the followers directly (caller holds the shard lock
+        and nothing is pending). A follower that fails gets the write through
+        the log instead and is retried from there.
+        """
+        applied = []
+        for follower in self.followers:
+            try:
+                getattr(follower.replica, method)(*args)
+                applied.append(follower)
+            except Exception as e:
+                logging.error(f"Replication of {method} to {follower.replica.cold_path} failed: {e}")
+                follower.offline = True
+                follower.retry_at = time.monotonic() + RETRY_SECONDS
+        if len(applied) < len(self.followers):
+            return self.enqueue(method, *args, applied=applied)
+        return None
+
+    def pending(self):
+        return self.enqueued_seq != self.applied_seq
+
+    def _due(self, now):
+        return [f for f in self.followers if f.applied < self.enqueued_seq and f.retry_at <= now]
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed:
+                    now = time.monotonic()
+                    due = self._due(now)
+                    if due:
+                        break
+                    retry = [f.retry_at - now for f in self.followers if f.applied < self.enqueued_seq]
+                    self._cond.wait(max(0.0, min(retry)) if retry else None)
+                if self._closed:
+                    return
+            for follower in due:
+                self._catch_up(follower)
+            with self._cond:
+                floor = self.applied_seq
+                while self._pending and self._pending[0][0] <= floor:
+                    self._pending.popleft()
+                if floor == self.enqueued_seq and self._log.tell() >= LOG_TRUNCATE_BYTES:
+                    self._log.truncate(0)
+                    for follower in self.followers:
+                        follower.pos = 0
+                self._cond.notify_all()
+
+    def _read_batch(self, follower):
+        with open(self.log_path, "rb") as f:
+            f.seek(follower.pos)
+            data = f.read(READ_CHUNK)
+        batch = []
+        for seq, _, payload, end in _parse_entries(data):
+            if seq > follower.applied:
+                method, args = pickle.loads(payload)
+                batch.append((seq, method, args, follower.pos + end))
+                if len(batch) >= self.batch_size:
+                    break
+        if not batch and data:
+            # Satu entry lebih besar dari READ_CHUNK
+            with open(self.log_path, "rb") as f:
+                f.seek(follower.pos)
+                data = f.read()
+            batch = [(seq, *pickle.loads(payload), follower.pos + end)
+                     for seq, _, payload, end in _parse_entries(data) if seq > follower.applied][:self.batch_size]
+        return batch
+
+    def _catch_up(self, follower):
+        """Terapkan satu batch dari log ke follower mulai dari offset-nya sendiri."""
+        batch = self._read_batch(follower)
+        if not batch:
+            return
+        # fsync group commit ditunggu setelah shard lock dilepas, sebelum batch dianggap applied
+        with deferred_sync():
+            with self.shard_lock:
+                for seq, method, args, end in batch:
+                    try:
+                        getattr(follower.replica, method)(*args)
+                    except Exception as e:
+                        logging.error(f"Replication of {method} #{seq} to {follower.replica.cold_path} failed, "
+                                      f"retrying in {RETRY_SECONDS}s: {e}")
+                        follower.offline = True
+                        follower.retry_at = time.monotonic() + RETRY_SECONDS
+                        break
+                    with self._cond:
+                        follower.applied, follower.pos = seq, end
+                else:
+                    follower.offline = False
+        follower.save()
+        logging.debug(f"Replicated up to #{follower.applied} to {follower.replica.cold_path}")
+
+    def _caught_up(self, seq):
+        return all(f.applied >= seq or f.offline for f in self.followers)
+
+    def wait(self, seq, timeout=None):
+        """Block until write `seq` has been applied to every follower that is online."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._caught_up(seq), timeout)
+
+    def flush(self, timeout=None):
+        return self.wait(self.enqueued_seq, timeout)
+
+    def lag(self):
+        with self._cond:
+            oldest = self._pending[0][1] if self._pending else None
+            return {
+                "depth": self.enqueued_seq - self.applied_seq,
+                "oldest_pending_age": time.time() - oldest if oldest is not None else 0.0,
+                "followers": [{"applied": f.applied, "offline": f.offline} for f in self.followers],
+            }
+
+    def close(self, remove=False):
+        """Hentikan thread; remove=True juga menghapus log dan offset follower (shard dikeluarkan)."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self.thread.join()
+        self._log.close()
+        if remove:
+            for path in [self.log_path] + [f.offset_file for f in self.followers]:
+                if os.path.exists(path):
+                    os.remove(path)
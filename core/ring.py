@@ -0,0 +1,59 @@
+# === File: core/ring.py ===
+import bisect
+import zlib
+
+
+def ring_hash(key):
+    """Hash non-kriptografis 32-bit: crc32 + finalizer murmur3 agar sebaran merata."""
+    h = zlib.crc32(key.encode("utf-8"))
+    h ^= h >> 16
+    h = (h * 0x85EBCA6B) & 0xFFFFFFFF
+    h ^= h >> 13
+    h = (h * 0xC2B2AE35) & 0xFFFFFFFF
+    h ^= h >> 16
+    return h
+
+
+class HashRing:
+    """
+    Consistent-hash ring with virtual nodes.
+
+    Each shard owns `vnodes` points on a 32-bit ring; a key belongs to the
+    first point clockwise from its hash. Adding or removing a shard only
+    moves the keys in the arcs next to that shard's points (~1/N of the data).
+    """
+
+    def __init__(self, shard_ids=(), vnodes=128):
+        self.vnodes = vnodes
+        self.shard_ids = set()
+        self._points = []
+        self._owners = []
+        for shard_id in shard_ids:
+            self.add(shard_id)
+
+    def _rebuild(self):
+        ring = sorted((ring_hash(f"shard{shard_id}#{i}"), shard_id)
+                      for shard_id in self.shard_ids for i in range(self.vnodes))
+        self._points = [point for point, _ in ring]
+        self._owners = [owner for _, owner in ring]
+
+    def add(self, shard_id):
+        self.shard_ids.add(shard_id)
+        self._rebuild()
+
+    def remove(self, shard_id):
+        self.shard_ids.discard(shard_id)
+        self._rebuild()
+
+    def copy(self):
+        ring = HashRing(vnodes=self.vnodes)
+        ring.shard_ids = set(self.shard_ids)
+        ring._points = list(self._points)
+        ring._owners = list(self._owners)
+        return ring
+
+    def get(self, key):
+        if not self._points:
+            raise LookupError("Hash ring is empty")
+        i = bisect.bisect_right(self._points, ring_hash(key))
+        return self._owners[i % len(self._owners)]
@@ -0,0 +1,84 @@
+import threading
+from contextlib import contextmanager
+
+
+class RWLock:
+    """
+    Writer-preferring readers/writer lock.
+
+    Any number of readers may hold the lock together; a writer gets it
+    exclusively. The write side is reentrant, and a thread that holds the
+    write lock may also take the read side (it just nests the write hold).
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = None
+        self._write_depth = 0
+        self._writers_waiting = 0
+
+    def acquire_read(self):
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer == me:
+                self._write_depth += 1
+                return
+            while self._writer is not None or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+
+    def release_read(self):
+        with self._cond:
+            if self._writer == threading.get_ident():
+                self._release_write_locked()
+                return
+            self._readers -= 1
+            if self._readers == 0:
+                self._cond.notify_all()
+
+    def acquire_write(self, blocking=True):
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer == me:
+                self._write_depth += 1
+                return True
+            if not blocking:
+                if self._writer is not None or self._readers:
+                    return False
+            else:
+                self._writers_waiting += 1
+                try:
+                    while self._writer is not None or self._readers:
+                        self._cond.wait()
+                finally:
+                    self._writers_waiting -= 1
+            self._writer = me
+            self._write_depth = 1
+            return True
+
+    def release_write(self):
+        with self._cond:
+            self._release_write_locked()
+
+    def _release_write_locked(self):
+        self._write_depth -= 1
+        if self._write_depth == 0:
+            self._writer = None
+            self._cond.notify_all()
+
+    @contextmanager
+    def read(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
@@ -5,3 +5,31 @@ schemas = {
     3: ["jurusan", "hobi"],
     4: ["jurusan", "hobi", "alamat"]
 }
+
+# Field yang dimiliki semua versi skema
+BASE_FIELDS = ["name", "age"]
+
+_FIELDS = {version: BASE_FIELDS + extra for version, extra in schemas.items()}
+_ALL_FIELDS = {field for fields in _FIELDS.values() for field in fields}
+
+
+def fields(version):
+    """Ordered field list of a schema version, as written positionally by core/serializer.py."""
+    return _FIELDS.get(version, BASE_FIELDS)
+
+
+def convert(value, version):
+    """
+    Upgrade or downgrade a value to `version` when it is read.
+
+    Fields the target version adds are filled with None, schema fields it
+    does not have are dropped, and ad-hoc fields outside every schema are kept.
+    """
+    if not isinstance(value, dict) or version not in _FIELDS:
+        return value
+    target = _FIELDS[version]
+    result = {field: value.get(field) for field in target}
+    for name, item in value.items():
+        if name not in _ALL_FIELDS:
+            result[name] = item
+    return result
@@ -0,0 +1,248 @@
+# === File: core/segment.py ===
+"""
+Immutable sorted segment files for the cold tier.
+
+    [entry]...[sparse index][bloom filter][footer]
+
+    entry        : [kind:1B][version:8B][key_len:4B][record_len:4B][key][record]
+    sparse index : [count:4B] ([key_len:4B][key][offset:8B])...
+    footer       : [index_offset:8B][bloom_offset:8B][entries:8B][max_version:8B][crc32:4B][magic:4B]
+
+Entries are sorted by key, newest version first, so a key's version chain
+is contiguous. `record` is an Encoder record (empty for a delete
+tombstone). Only every INDEX_INTERVAL-th entry is in the sparse index,
+which together with the Bloom filter is all that stays in memory.
+"""
+import bisect
+import heapq
+import logging
+import mmap
+import os
+import struct
+import zlib
+from core.bloom import BloomFilter, BloomError
+
+KIND_VALUE = 1
+KIND_TOMBSTONE = 2
+
+_ENTRY = struct.Struct("!BQII")
+_COUNT = struct.Struct("!I")
+_KEY_LEN = struct.Struct("!I")
+_OFFSET = struct.Struct("!Q")
+_FOOTER = struct.Struct("!QQQQI4s")
+_MAGIC = b"SEG1"
+
+INDEX_INTERVAL = 16
+
+
+class SegmentError(Exception):
+    """Raised when a segment file is truncated or corrupt."""
+    pass
+
+
+def write_segment(path, entries, expected_keys, bits_per_key=10, fsync=True):
+    """
+    Write a segment from (key, kind, version, record) entries already sorted
+    by key ascending and version descending.
+
+    Args:
+        expected_keys (int): Upper bound of distinct keys, used to size the Bloom filter.
+
+    Returns:
+        int: Number of entries written.
+    """
+    bloom = BloomFilter(max(1, expected_keys), bits_per_key)
+    sparse = []
+    count = 0
+    max_version = 0
+    previous = None
+    tmp_file = path + ".tmp"
+    with open(tmp_file, "wb", buffering=1 << 20) as f:
+        offset = 0
+        for key, kind, version, record in entries:
+            key_bytes = key.encode("utf-8")
+            if count % INDEX_INTERVAL == 0:
+                sparse.append((key_bytes, offset))
+            if key != previous:
+                bloom.add(key)
+                previous = key
+            max_version = max(max_version, version)
+            f.write(_ENTRY.pack(kind, version, len(key_bytes), len(record)))
+            f.write(key_bytes)
+            f.write(record)
+            offset += _ENTRY.size + len(key_bytes) + len(record)
+            count += 1
+        index = bytearray(_COUNT.pack(len(sparse)))
+        for key_bytes, entry_offset in sparse:
+            index += _KEY_LEN.pack(len(key_bytes)) + key_bytes + _OFFSET.pack(entry_offset)
+        bloom_bytes = bloom.to_bytes()
+        f.write(index)
+        f.write(bloom_bytes)
+        f.write(_FOOTER.pack(offset, offset + len(index), count, max_version, zlib.crc32(bytes(index) + bloom_bytes), _MAGIC))
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp_file, path)
+    return count
+
+
+class Segment:
+    def __init__(self, path, bits_per_key=10):
+        self.path = path
+        self.size = os.path.getsize(path)
+        if self.size < _FOOTER.size:
+            raise SegmentError(f"Truncated segment {path}")
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        index_offset, bloom_offset, self.count, self.max_version, crc, magic = _FOOTER.unpack_from(self._mmap, self.size - _FOOTER.size)
+        if magic != _MAGIC or not index_offset <= bloom_offset <= self.size - _FOOTER.size:
+            raise SegmentError(f"Corrupt segment footer {path}")
+        meta = self._mmap[index_offset:self.size - _FOOTER.size]
+        if zlib.crc32(meta) != crc:
+            raise SegmentError(f"Corrupt segment index {path}")
+        try:
+            self.bloom = BloomFilter.from_bytes(meta[bloom_offset - index_offset:], bits_per_key)
+        except BloomError as e:
+            raise SegmentError(f"{e}: {path}")
+        self._data_end = index_offset
+        self._keys = []
+        self._offsets = []
+        (n,) = _COUNT.unpack_from(meta, 0)
+        pos = _COUNT.size
+        for _ in range(n):
+            (key_len,) = _KEY_LEN.unpack_from(meta, pos)
+            pos += _KEY_LEN.size
+            self._keys.append(meta[pos:pos + key_len].decode("utf-8"))
+            pos += key_len
+            self._offsets.append(_OFFSET.unpack_from(meta, pos)[0])
+            pos += _OFFSET.size
+        self.negatives = 0
+        self.false_positives = 0
+
+    @property
+    def name(self):
+        return os.path.basename(self.path)
+
+    def resident_bytes(self):
+        """Perkiraan memori yang tetap tinggal: sparse index dan Bloom filter."""
+        return self.bloom.memory_bytes() + sum(len(key) + 8 for key in self._keys)
+
+    def _entries(self, offset=0):
+        """Yield (key, kind, version, record) from `offset` to the end of the entries."""
+        buf = self._mmap
+        end = self._data_end
+        while offset < end:
+            kind, version, key_len, record_len = _ENTRY.unpack_from(buf, offset)
+            start = offset + _ENTRY.size
+            key = buf[start:start + key_len].decode("utf-8")
+            record_start = start + key_len
+            offset = record_start + record_len
+            yield key, kind, version, memoryview(buf)[record_start:offset]
+
+    def _seek(self, key):
+        # Titik sparse terakhir yang key-nya < key: rantai versi `key` pasti dimulai setelahnya
+        i = bisect.bisect_left(self._keys, key) - 1
+        return self._offsets[i] if i >= 0 else 0
+
+    def entries(self, key):
+        """[(kind, version, record)] of `key`, newest first; empty if absent."""
+        if key not in self.bloom:
+            self.negatives += 1
+            return []
+        found = []
+        for entry_key, kind, version, record in self._entries(self._seek(key)):
+            if entry_key > key:
+                break
+            if entry_key == key:
+                found.append((kind, version, record))
+        if not found:
+            self.false_positives += 1
+        return found
+
+    def get(self, key, as_of=None):
+        """Newest (kind, version, record) of `key` with version <= as_of, or None."""
+        for kind, version, record in self.entries(key):
+            if as_of is None or version <= as_of:
+                return kind, version, record
+        return None
+
+    def iter_keys(self, start=None, end=None):
+        """Distinct keys with start <= key < end, in order."""
+        previous = None
+        for key, _, _, _ in self._entries(self._seek(start) if start is not None else 0):
+            if key == previous or (start is not None and key < start):
+                continue
+            if end is not None and key >= end:
+                return
+            previous = key
+            yield key
+
+    def iter_entries(self):
+        return self._entries(0)
+
+    def iter_latest(self):
+        """(key, kind, version) of the newest entry of every key, in key order."""
+        previous = None
+        for key, kind, version, _ in self._entries(0):
+            if key != previous:
+                previous = key
+                yield key, kind, version
+
+    def close(self):
+        try:
+            self._mmap.close()
+        except BufferError:
+            # Masih ada memoryview record yang dipakai pembaca, biarkan GC yang menutup
+            pass
+
+
+def merge_entries(segments, max_versions, cutoff=0, bottom=False):
+    """
+    K-way merge of segment entries (newest segment first) into one sorted stream.
+
+    Per key at most `max_versions` older versions are kept after the newest,
+    versions superseded before version `cutoff` are dropped, and when the
+    merge includes the oldest segment (`bottom`) tombstones that no longer
+    hide anything are dropped too.
+    """
+    streams = [((key, -version, rank, kind, record) for key, kind, version, record in segment.iter_entries())
+               for rank, segment in enumerate(segments)]
+    chain_key = None
+    chain = []
+    for key, neg_version, _, kind, record in heapq.merge(*streams):
+        if key != chain_key:
+            yield from _trim_chain(chain_key, chain, max_versions, cutoff, bottom)
+            chain_key, chain = key, []
+        if chain and chain[-1][1] == -neg_version:
+            # Versi sama di dua segmen (mis. flush ulang setelah crash): yang di segmen lebih baru menang
+            continue
+        chain.append((kind, -neg_version, record))
+    yield from _trim_chain(chain_key, chain, max_versions, cutoff, bottom)
+
+
+def _trim_chain(key, chain, max_versions, cutoff, bottom):
+    """chain: [(kind, version, record)] newest first."""
+    if not chain:
+        return
+    kept = chain[:1]
+    for i in range(1, min(len(chain), max_versions + 1)):
+        # Versi ke-i terbaca lewat as_of sampai versi yang lebih baru menggantikannya
+        if chain[i - 1][1] < cutoff:
+            break
+        kept.append(chain[i])
+    if bottom:
+        while kept and kept[-1][0] == KIND_TOMBSTONE:
+            kept.pop()
+    for kind, version, record in kept:
+        yield key, kind, version, record
+
+
+def load_segments(directory, names, bits_per_key=10):
+    """Open the listed segment files, skipping unreadable ones."""
+    segments = []
+    for name in names:
+        try:
+            segments.append(Segment(os.path.join(directory, name), bits_per_key))
+        except (SegmentError, OSError, ValueError, struct.error) as e:
+            logging.error(f"Skipping unreadable segment {name} in {directory}: {e}")
+    return segments
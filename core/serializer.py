@@ -0,0 +1,204 @@
+# === File: core/serializer.py ===
+"""
+Schema-driven binary serialization of record values.
+
+Fields listed for the record's schema version (see core/schemas.py) are
+written positionally, without their names:
+
+    [presence bitmap:varint][value of each present field]...[overflow count:varint]([name][value])...
+
+Fields outside the schema (e.g. columns added by change_data) go into the
+overflow map. Every value is tagged with its type; integers are zigzag
+varints, strings and containers are length-prefixed.
+"""
+import struct
+
+T_NONE = 0
+T_FALSE = 1
+T_TRUE = 2
+T_INT = 3
+T_FLOAT = 4
+T_STR = 5
+T_LIST = 6
+T_DICT = 7
+
+_DOUBLE = struct.Struct("!d")
+
+
+class SerializerError(Exception):
+    """Raised for values that cannot be serialized or bytes that cannot be parsed."""
+    pass
+
+
+def _varint(out, n):
+    while n > 0x7F:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _pack(out, value):
+    t = type(value)
+    if t is str:
+        data = value.encode("utf-8")
+        out.append(T_STR)
+        _varint(out, len(data))
+        out += data
+    elif t is int:
+        out.append(T_INT)
+        _varint(out, (value << 1) if value >= 0 else ((-value << 1) - 1))
+    elif value is None:
+        out.append(T_NONE)
+    elif t is bool:
+        out.append(T_TRUE if value else T_FALSE)
+    elif t is float:
+        out.append(T_FLOAT)
+        out += _DOUBLE.pack(value)
+    elif t is list or t is tuple:
+        out.append(T_LIST)
+        _varint(out, len(value))
+        for item in value:
+            _pack(out, item)
+    elif t is dict:
+        out.append(T_DICT)
+        _varint(out, len(value))
+        for name, item in value.items():
+            if type(name) is not str:
+                raise SerializerError(f"Non-string key {name!r}")
+            data = name.encode("utf-8")
+            _varint(out, len(data))
+            out += data
+            _pack(out, item)
+    else:
+        raise SerializerError(f"Unsupported type {t.__name__}")
+
+
+def pack_value(value, fields):
+    """
+    Serialize a dict value against an ordered field list.
+
+    Args:
+        value (dict): The value to serialize.
+        fields (list): Field names of the record's schema version.
+
+    Returns:
+        bytes: Serialized value.
+    """
+    if type(value) is not dict:
+        raise SerializerError("Only dict values are serialized by schema")
+    out = bytearray()
+    present = 0
+    body = bytearray()
+    for i, field in enumerate(fields):
+        if field in value:
+            present |= 1 << i
+            _pack(body, value[field])
+    _varint(out, present)
+    out += body
+    overflow = [(name, item) for name, item in value.items() if name not in fields]
+    _varint(out, len(overflow))
+    for name, item in overflow:
+        if type(name) is not str:
+            raise SerializerError(f"Non-string key {name!r}")
+        data = name.encode("utf-8")
+        _varint(out, len(data))
+        out += data
+        _pack(out, item)
+    return bytes(out)
+
+
+def _read_varint(data, pos):
+    b = data[pos]
+    if b < 0x80:
+        return b, pos + 1
+    n = b & 0x7F
+    shift = 7
+    while True:
+        pos += 1
+        b = data[pos]
+        n |= (b & 0x7F) << shift
+        if b < 0x80:
+            return n, pos + 1
+        shift += 7
+
+
+def _unpack(data, pos):
+    tag = data[pos]
+    pos += 1
+    if tag == T_STR:
+        n, pos = _read_varint(data, pos)
+        return data[pos:pos + n].decode("utf-8"), pos + n
+    if tag == T_INT:
+        n, pos = _read_varint(data, pos)
+        return (n >> 1) ^ -(n & 1), pos
+    if tag == T_NONE:
+        return None, pos
+    if tag == T_TRUE:
+        return True, pos
+    if tag == T_FALSE:
+        return False, pos
+    if tag == T_FLOAT:
+        return _DOUBLE.unpack_from(data, pos)[0], pos + 8
+    if tag == T_LIST:
+        count, pos = _read_varint(data, pos)
+        items = []
+        for _ in range(count):
+            item, pos = _unpack(data, pos)
+            items.append(item)
+        return items, pos
+    if tag == T_DICT:
+        count, pos = _read_varint(data, pos)
+        result = {}
+        for _ in range(count):
+            n, pos = _read_varint(data, pos)
+            name = data[pos:pos + n].decode("utf-8")
+            result[name], pos = _unpack(data, pos + n)
+        return result, pos
+    raise SerializerError(f"Unknown type tag {tag} at {pos - 1}")
+
+
+def _read_entries(data, pos, value, names):
+    """Read values into `value`; names[i] is the i-th field name, or None to read the name inline."""
+    for name in names:
+        if name is None:
+            n = data[pos]
+            if n < 0x80:
+                pos += 1
+            else:
+                n, pos = _read_varint(data, pos)
+            name = data[pos:pos + n].decode("utf-8")
+            pos += n
+        tag = data[pos]
+        # Jalur cepat untuk tipe paling umum (string dan int pendek)
+        if tag == T_STR and data[pos + 1] < 0x80:
+            end = pos + 2 + data[pos + 1]
+            value[name] = data[pos + 2:end].decode("utf-8")
+            pos = end
+        elif tag == T_INT and data[pos + 1] < 0x80:
+            n = data[pos + 1]
+            value[name] = (n >> 1) ^ -(n & 1)
+            pos += 2
+        else:
+            value[name], pos = _unpack(data, pos)
+    return pos
+
+
+def unpack_value(data, fields):
+    """Inverse of pack_value; `fields` must be the list the value was written with."""
+    data = bytes(data)
+    try:
+        present, pos = _read_varint(data, 0)
+        value = {}
+        if present:
+            names = [field for i, field in enumerate(fields) if present >> i & 1]
+            if present >> len(fields):
+                raise SerializerError("Presence bitmap has more fields than the schema")
+            pos = _read_entries(data, pos, value, names)
+        count, pos = _read_varint(data, pos)
+        if count:
+            pos = _read_entries(data, pos, value, [None] * count)
+    except (IndexError, UnicodeDecodeError, struct.error) as e:
+        raise SerializerError(f"Corrupt serialized value: {e}")
+    if pos != len(data):
+        raise SerializerError("Trailing bytes after serialized value")
+    return value
@@ -0,0 +1,172 @@
+# === File: core/server.py ===
+"""
+Asyncio TCP front-end for ShardManager.
+
+Run with:  python3 -m core.server --host 127.0.0.1 --port 7070
+
+Each connection may pipeline requests; they are executed concurrently in a
+thread pool (disk I/O is blocking) and answered with the request id, so
+responses can arrive out of order.
+"""
+import argparse
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from core import protocol as proto
+from core.protocol import Reader, ProtocolError
+
+
+class KVServer:
+    def __init__(self, store, host="127.0.0.1", port=7070, workers=16, max_inflight=256):
+        self.store = store
+        self.host = host
+        self.port = port
+        self.max_inflight = max_inflight
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="kv-io")
+        self.server = None
+
+    def _execute(self, op, payload):
+        """Decode one request, run it against the store and return (status, payload)."""
+        r = Reader(payload)
+        if op == proto.OP_PING:
+            return proto.STATUS_OK, b""
+
+        if op == proto.OP_GET:
+            value = self.store.get(r.key())
+            if value is None:
+                return proto.STATUS_NOT_FOUND, b""
+            return proto.STATUS_OK, proto.pack_value(value)
+
+        if op == proto.OP_PUT:
+            flags, schema_version = r.u8(), r.u8()
+            key, value = r.key(), r.value()
+            self.store.put(key, value, write_to_cold=bool(flags & proto.FLAG_WRITE_TO_COLD),
+                           async_replication=bool(flags & proto.FLAG_ASYNC), schema_version=schema_version)
+            return proto.STATUS_OK, b""
+
+        if op == proto.OP_DELETE:
+            deleted = self.store.delete_many([r.key()])
+            return (proto.STATUS_OK if deleted else proto.STATUS_NOT_FOUND), b""
+
+        if op == proto.OP_GET_MANY:
+            keys = [r.key() for _ in range(r.count())]
+            found = self.store.get_many(keys)
+            out = [proto.pack_count(len(found))]
+            for key, value in found.items():
+                out.append(proto.pack_key(key) + proto.pack_value(value))
+            return proto.STATUS_OK, b"".join(out)
+
+        if op == proto.OP_PUT_MANY:
+            flags, schema_version = r.u8(), r.u8()
+            items = [(r.key(), r.value()) for _ in range(r.count())]
+            written = self.store.put_many(items, write_to_cold=bool(flags & proto.FLAG_WRITE_TO_COLD),
+                                          async_replication=bool(flags & proto.FLAG_ASYNC),
+                                          schema_version=schema_version)
+            return proto.STATUS_OK, proto.pack_count(written)
+
+        if op == proto.OP_DELETE_MANY:
+            keys = [r.key() for _ in range(r.count())]
+            return proto.STATUS_OK, proto.pack_count(self.store.delete_many(keys))
+
+        if op == proto.OP_SCAN:
+            start, end, limit = r.optional_key(), r.optional_key(), r.count()
+            rows = list(self.store.scan(start, end, limit or None))
+            out = [proto.pack_count(len(rows))]
+            for key, value in rows:
+                out.append(proto.pack_key(key) + proto.pack_value(value))
+            return proto.STATUS_OK, b"".join(out)
+
+        if op == proto.OP_STATS:
+            return proto.STATUS_OK, proto.pack_value(self.store.stats())
+
+        raise ProtocolError(f"Unknown op {op}")
+
+    async def _respond(self, writer, req_id, op, payload, slots):
+        loop = asyncio.get_running_loop()
+        try:
+            status, body = await loop.run_in_executor(self.executor, self._execute, op, payload)
+        except Exception as e:
+            logging.warning(f"Request {req_id} (op {op}) failed: {e}")
+            status, body = proto.STATUS_ERROR, str(e).encode("utf-8")
+        finally:
+            slots.release()
+        if not writer.is_closing():
+            writer.write(proto.pack_frame(req_id, status, body))
+
+    async def _handle(self, reader, writer):
+        peer = writer.get_extra_info("peername")
+        slots = asyncio.Semaphore(self.max_inflight)
+        tasks = set()
+        try:
+            while True:
+                header = await reader.readexactly(proto.HEADER.size)
+                length, req_id, op = proto.HEADER.unpack(header)
+                if length < 5 or length > proto.MAX_FRAME:
+                    raise ProtocolError(f"Bad frame length {length}")
+                payload = await reader.readexactly(length - 5)
+                # Backpressure: batasi request in-flight per koneksi
+                await slots.acquire()
+                task = asyncio.create_task(self._respond(writer, req_id, op, payload, slots))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                if writer.transport.get_write_buffer_size() > 1 << 20:
+                    await writer.drain()
+        except asyncio.IncompleteReadError:
+            pass
+        except (ProtocolError, ConnectionError) as e:
+            logging.warning(f"Closing connection {peer}: {e}")
+        finally:
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            writer.close()
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        logging.info(f"KV server listening on {self.host}:{self.port}")
+        return self.server
+
+    async def serve_forever(self):
+        if self.server is None:
+            await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Key-value TCP server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7070)
+    parser.add_argument("--shards", type=int, default=2)
+    parser.add_argument("--replicas", type=int, default=2)
+    parser.add_argument("--data", default="data/cold_store")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--processes", type=int, default=0,
+                        help="Run shards in this many worker processes (0: all in the server process)")
+    parser.add_argument("--durability", choices=("none", "flush", "fsync", "group"), default="flush")
+    parser.add_argument("--group-commit-ms", type=float, default=5)
+    parser.add_argument("--read-policy", choices=("primary", "round_robin", "least_outstanding", "hedged"),
+                        default="primary")
+    parser.add_argument("--consistency", choices=("strong", "read_your_writes", "eventual"),
+                        default="read_your_writes")
+    parser.add_argument("--hedge-after-ms", type=float, default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    from core.shard_manager import ShardManager
+    store = ShardManager(num_shards=args.shards, replica_count=args.replicas, base_path=args.data,
+                         durability=args.durability, group_commit_ms=args.group_commit_ms,
+                         read_policy=args.read_policy, consistency=args.consistency,
+                         hedge_after_ms=args.hedge_after_ms, processes=args.processes)
+    server = KVServer(store, args.host, args.port, workers=args.workers)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,75 +1,727 @@
-import hashlib
+import heapq
+import itertools
+import json
 import logging
+import os
 import threading
-from core.storage import Storage
+import time
+from collections.abc import MutableMapping
+from functools import partial
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from core.storage import Storage, scan_cold_file, needs_rebuild, deferred_sync, next_version
+from core.replication import ReplicationWorker
+from core.encoder import train_dictionary
+from core import schemas
+from core.ring import HashRing
+from core.ordered_keys import prefix_end
+from core.merkle import MERKLE_DEPTH, LeafFilter, MerkleTree
+from core.read_policy import CONSISTENCY_LEVELS, READ_POLICIES, ReplicaLoad, order_replicas
+from core.metrics import Metrics
+
+MIGRATION_BATCH = 500
+# Ambang hedge sebelum histogram punya cukup sampel, dan batas bawahnya (biaya dispatch thread)
+HEDGE_DEFAULT_DELAY = 0.01
+HEDGE_MIN_DELAY = 0.001
+HEDGE_MIN_SAMPLES = 100
+
+
+class ShardMap(MutableMapping):
+    """
+    shard_id -> replicas. Shards registered with defer() are opened by
+    `opener` the first time they are looked up, so a store with many
+    shards starts without reading every replica's index.
+    """
+
+    def __init__(self, opener):
+        self._opened = {}
+        self._pending = set()
+        self._opener = opener
+        self._lock = threading.RLock()
+
+    def defer(self, shard_id):
+        self._pending.add(shard_id)
+
+    def opened(self):
+        """Shard yang sudah dibuka saja (tanpa membuka sisanya)."""
+        return dict(self._opened)
+
+    def __getitem__(self, shard_id):
+        replicas = self._opened.get(shard_id)
+        if replicas is None:
+            with self._lock:
+                if shard_id not in self._opened:
+                    if shard_id not in self._pending:
+                        raise KeyError(shard_id)
+                    # opener mendaftarkan state shard lalu mengisi self[shard_id]
+                    self._opener(shard_id)
+                replicas = self._opened[shard_id]
+        return replicas
+
+    def __setitem__(self, shard_id, replicas):
+        with self._lock:
+            self._opened[shard_id] = replicas
+            self._pending.discard(shard_id)
+
+    def __delitem__(self, shard_id):
+        with self._lock:
+            if shard_id in self._opened:
+                del self._opened[shard_id]
+            elif shard_id in self._pending:
+                self._pending.discard(shard_id)
+            else:
+                raise KeyError(shard_id)
+
+    def __contains__(self, shard_id):
+        return shard_id in self._opened or shard_id in self._pending
+
+    def __iter__(self):
+        return iter(sorted(set(self._opened) | self._pending))
+
+    def __len__(self):
+        return len(set(self._opened) | self._pending)
+
 
 class ShardManager:
-    def __init__(self, num_shards=2, replica_count=2):
-        self.num_shards = num_shards
+    def __init__(self, num_shards=2, replica_count=2, base_path="data/cold_store", vnodes=128,
+                 read_policy="primary", consistency="read_your_writes", hedge_after_ms=None, processes=0,
+                 lazy_open=True, **storage_options):
+        """
+        Args:
+            lazy_open (bool): Open a shard's replicas on its first access instead of at startup;
+                shards whose index must be rebuilt, or that take part in a pending
+                rebalance, are still opened here.
+            processes (int): Run the shards' replicas in this many worker processes
+                (core/shard_process.py), shard N in process N % processes, so shards use
+                separate cores; 0 keeps every replica in this process.
+            read_policy (str): Replica choice for reads, see core.read_policy.READ_POLICIES.
+            consistency (str): Default staleness allowed for reads, see core.read_policy.CONSISTENCY_LEVELS;
+                get/get_many can override it per call.
+            hedge_after_ms (float, optional): Fixed hedge threshold for the "hedged" policy; None uses
+                the p95 read latency of the replica tried first.
+        """
+        self.set_read_policy(read_policy, consistency, hedge_after_ms)
         self.replica_count = replica_count
-        self.shards = []
-        self.async_queue = []
-        self.async_thread = None
+        self.base_path = base_path
+        self.storage_options = storage_options
+        self.shards = ShardMap(self._open_shard)
+        # Write ke satu shard diserialisasi agar semua replika menerapkan urutan yang sama
+        self._shard_locks = {}
+        self.replication = {}
+        self._replication_seq = {}  # key -> seq async terakhir, untuk wait_replicated
+        self._migration = None  # (ring lama, key yang dihapus selama migrasi)
+        # Jam versi MVCC bersama: semua replika sebuah shard menerima versi yang sama untuk tiap write
+        self._last_version = 0
+        self._version_lock = threading.Lock()
+        # Per replika: baca yang berjalan + histogram latency, dipakai policy baca
+        self._read_loads = {}
+        self._read_turn = itertools.count()
+        # Per shard: jumlah operasi dan latency write/baca di level manager, lihat stats()
+        self._shard_metrics = {}
+        self._started = time.time()
+        self._anti_entropy = None  # Event penghenti job anti-entropy background
+        self._ring_file = os.path.join(base_path, "ring.json")
+        os.makedirs(base_path, exist_ok=True)
+        self._processes = []
+        if processes:
+            from core.shard_process import ShardProcess
+            self._processes = [ShardProcess(f"shard-process{i}") for i in range(processes)]
+
+        shard_ids, previous, legacy = self._load_ring(num_shards)
+        opening = sorted(set(shard_ids) | set(previous or ()))
+        # Proses shard membangun index masing-masing secara paralel
+        rebuilt = {} if self._processes else self._rebuild_indexes(opening)
+        if lazy_open and previous is None and not legacy:
+            # Hanya shard yang index-nya baru di-scan dibuka sekarang (hasil scan tidak disimpan)
+            rebuilt_shards = {shard_id for shard_id in opening
+                              if any(self._replica_path(shard_id, replica_id) in rebuilt
+                                     for replica_id in range(replica_count))}
+            for shard_id in opening:
+                if shard_id not in rebuilt_shards:
+                    self.shards.defer(shard_id)
+            opening = sorted(rebuilt_shards)
+        created = {shard_id: self._create_replicas(shard_id, rebuilt) for shard_id in opening}
+        for shard_id in opening:
+            self._open_shard(shard_id, created[shard_id].result())
+        self.ring = HashRing(shard_ids, vnodes)
+        self._executor = ThreadPoolExecutor(max_workers=max(4, len(shard_ids)), thread_name_prefix="shard")
+        # Terpisah dari _executor: get_many berjalan di _executor dan tidak boleh menunggu slotnya sendiri
+        self._read_executor = ThreadPoolExecutor(max_workers=max(8, 4 * replica_count), thread_name_prefix="read")
+
+        if previous is not None:
+            logging.info(f"Resuming interrupted rebalance from shards {previous}")
+            self._migrate(HashRing(previous, vnodes), self.ring, previous)
+        elif legacy:
+            # Data lama dipartisi dengan sha256 % N; pindahkan key yang pemiliknya berubah di ring
+            logging.info("Migrating legacy modulo-partitioned data onto the hash ring")
+            self._migrate(self.ring, self.ring, shard_ids)
+        self._save_ring()
+        logging.info(f"ShardManager initialized: {self.num_shards} shards, {replica_count} replicas")
+
+    @property
+    def num_shards(self):
+        return len(self.ring.shard_ids)
+
+    def _load_ring(self, num_shards):
+        if os.path.exists(self._ring_file):
+            with open(self._ring_file) as f:
+                meta = json.load(f)
+            return meta["shards"], meta.get("previous"), False
+        shard_ids = list(range(num_shards))
+        legacy = any(os.path.exists(os.path.join(self._replica_path(shard_id, 0), "data.bin"))
+                     for shard_id in shard_ids)
+        return shard_ids, None, legacy
+
+    def _save_ring(self, previous=None):
+        meta = {"shards": sorted(self.ring.shard_ids), "vnodes": self.ring.vnodes, "previous": previous}
+        tmp_file = self._ring_file + ".tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_file, self._ring_file)
+
+    def _replica_path(self, shard_id, replica_id):
+        return os.path.join(self.base_path, f"shard{shard_id}_rep{replica_id}")
+
+    def _rebuild_indexes(self, shard_ids):
+        """
+        Scan the data.bin of every replica that has no index, in parallel processes.
+
+        Returns:
+            dict: cold path -> scan_cold_file result, passed to Storage as rebuilt_index.
+        """
+        paths = [self._replica_path(shard_id, replica_id)
+                 for shard_id in shard_ids for replica_id in range(self.replica_count)]
+        paths = [path for path in paths if needs_rebuild(path)]
+        if not paths:
+            return {}
+        start = time.perf_counter()
+        cold_files = [os.path.join(path, "data.bin") for path in paths]
+        scan = partial(scan_cold_file, max_versions=self.storage_options.get("max_versions", 5))
+        if len(paths) == 1:
+            results = [scan(cold_files[0])]
+        else:
+            try:
+                from concurrent.futures import ProcessPoolExecutor
+                with ProcessPoolExecutor(max_workers=min(len(paths), os.cpu_count() or 1)) as pool:
+                    results = list(pool.map(scan, cold_files))
+            except (OSError, RuntimeError) as e:
+                # Mis. lingkungan tanpa dukungan multiprocessing: scan berurutan
+                logging.warning(f"Parallel index rebuild unavailable ({e}), scanning sequentially")
+                results = [scan(cold_file) for cold_file in cold_files]
+        logging.info(f"Rebuilt {len(paths)} indexes in {time.perf_counter() - start:.2f}s")
+        return dict(zip(paths, results))
 
-        for shard_id in range(num_shards):
-            shard = []
-            for replica_id in range(replica_count):
-                cold_path = f"data/cold_store/shard{shard_id}_rep{replica_id}"
-                storage = Storage(cold_path)
-                shard.append(storage)
-            self.shards.append(shard)
+    def _create_replicas(self, shard_id, rebuilt=None):
+        """Future berisi replika shard: Storage di proses ini, atau RemoteStorage di proses shard-nya."""
+        paths = [self._replica_path(shard_id, replica_id) for replica_id in range(self.replica_count)]
+        if self._processes:
+            return self._processes[shard_id % len(self._processes)].open(paths, self.storage_options)
+        future = Future()
+        future.set_result([Storage(path, rebuilt_index=(rebuilt or {}).get(path), **self.storage_options)
+                           for path in paths])
+        return future
 
-        self._start_async_replication()
-        logging.info(f"ShardManager initialized: {num_shards} shards, {replica_count} replicas")
+    def _open_shard(self, shard_id, replicas=None):
+        if replicas is None:
+            replicas = self._create_replicas(shard_id).result()
+        with self._version_lock:
+            self._last_version = max([self._last_version] + [replica.current_version() for replica in replicas])
+        self._shard_locks[shard_id] = threading.Lock()
+        self._read_loads[shard_id] = [ReplicaLoad() for _ in replicas]
+        self._shard_metrics.setdefault(shard_id, Metrics())
+        self.replication[shard_id] = ReplicationWorker(
+            shard_id, replicas[1:], self._shard_locks[shard_id], os.path.join(self.base_path, f"shard{shard_id}.replog"),
+            fsync=self.storage_options.get("durability") == "fsync")
+        self.shards[shard_id] = replicas
 
     def _get_shard_id(self, key):
-        return int(hashlib.sha256(key.encode()).hexdigest(), 16) % self.num_shards
+        return self.ring.get(key)
+
+    def _next_version(self):
+        with self._version_lock:
+            self._last_version = next_version(self._last_version)
+            return self._last_version
 
-    def _start_async_replication(self):
-        self.async_thread = threading.Thread(target=self._async_replication_worker, daemon=True)
-        self.async_thread.start()
+    def _apply_write(self, shard_id, keys, async_replication, method, *args, versioned=False):
+        """
+        Apply a Storage write method to every replica of a shard.
 
-    def _async_replication_worker(self):
-        while True:
-            if self.async_queue:
-                key, value, write_to_cold, shard_id, schema_version, extra_field = self.async_queue.pop(0)
-                for replica in self.shards[shard_id][1:]:
-                    replica.put(key, value, write_to_cold, schema_version, extra_field)
-                    logging.debug(f"Async replicated key {key} to shard{shard_id}")
+        The primary is written under the shard lock. Followers are written
+        directly when replication is idle; otherwise (or in async mode) the
+        write is appended to the shard's replication log behind the pending
+        ones so followers keep the primary's order, and sync callers wait for
+        the online followers to apply it.
+        Group-commit fsync waits happen after the shard lock is released.
+        With `versioned`, an MVCC version taken under the shard lock is
+        appended to `args`, so every replica stores the write at the same version.
+        """
+        replicas = self.shards[shard_id]
+        worker = self.replication[shard_id]
+        metrics = self._shard_metrics[shard_id]
+        start = time.perf_counter()
+        seq = None
+        with deferred_sync(), self._shard_locks[shard_id]:
+            if versioned:
+                args += (self._next_version(),)
+            result = getattr(replicas[0], method)(*args)
+            if async_replication or worker.pending():
+                seq = worker.enqueue(method, *args)
+                for key in keys:
+                    self._replication_seq[key] = seq
+            else:
+                # Follower yang gagal menerima write langsung menyusul dari log; tidak ditunggu
+                failed = worker.replicate(method, *args)
+                if failed is not None:
+                    for key in keys:
+                        self._replication_seq[key] = failed
+        if seq is not None and not async_replication:
+            worker.wait(seq)
+        metrics.observe(method, time.perf_counter() - start)
+        metrics.incr("keys_written", len(keys))
+        return result
 
     def put(self, key, value, write_to_cold=True, async_replication=False, schema_version=1, extra_field=None):
         shard_id = self._get_shard_id(key)
-        if async_replication:
-            self.shards[shard_id][0].put(key, value, write_to_cold, schema_version, extra_field)
-            self.async_queue.append((key, value, write_to_cold, shard_id, schema_version, extra_field))
-            logging.debug(f"Putting key {key} async on shard {shard_id}")
-        else:
-            for replica_id, replica in enumerate(self.shards[shard_id]):
-                replica.put(key, value, write_to_cold, schema_version, extra_field)
-                logging.debug(f"Put key {key} to shard {shard_id}, replica {replica_id}")
+        self._apply_write(shard_id, (key,), async_replication, "put",
+                          key, value, write_to_cold, schema_version, extra_field, versioned=True)
+        logging.debug("Put key %s to shard %s (async=%s)", key, shard_id, async_replication)
 
-    def get(self, key):
-        shard_id = self._get_shard_id(key)
-        for replica_id, replica in enumerate(self.shards[shard_id]):
+    def _group_by_shard(self, keys):
+        groups = {}
+        for key in keys:
+            groups.setdefault(self._get_shard_id(key), []).append(key)
+        return groups
+
+    def _run_per_shard(self, fn, groups):
+        """Jalankan fn(shard_id, group) untuk tiap shard secara paralel."""
+        futures = {shard_id: self._executor.submit(fn, shard_id, group) for shard_id, group in groups.items()}
+        return {shard_id: future.result() for shard_id, future in futures.items()}
+
+    def put_many(self, items, write_to_cold=True, async_replication=False, schema_version=1, extra_field=None):
+        items = list(items.items()) if isinstance(items, dict) else list(items)
+        groups = {}
+        for key, value in items:
+            groups.setdefault(self._get_shard_id(key), []).append((key, value))
+
+        def put_shard(shard_id, batch):
+            return self._apply_write(shard_id, [key for key, _ in batch], async_replication, "put_many",
+                                     batch, write_to_cold, schema_version, extra_field, versioned=True)
+
+        written = self._run_per_shard(put_shard, groups)
+        logging.debug("Put %d keys across %d shards", len(items), len(groups))
+        return sum(written.values())
+
+    def get_many(self, keys, consistency=None):
+        def get_shard(shard_id, group):
+            replicas, loads = self.shards[shard_id], self._read_loads[shard_id]
+            self._shard_metrics[shard_id].incr("keys_read", len(group))
+            for replica_id in self._read_order(shard_id, group, consistency):
+                try:
+                    return loads[replica_id].call(replicas[replica_id].get_many, group)
+                except Exception as e:
+                    logging.warning(f"Replica {replica_id} of shard {shard_id} failed get_many: {e}")
+            return {}
+
+        result = {}
+        for found in self._run_per_shard(get_shard, self._group_by_shard(keys)).values():
+            result.update(found)
+        if self._migration is not None:
+            for key in keys:
+                if key not in result:
+                    value = self._get_migrating(key)
+                    if value is not None:
+                        result[key] = value
+        return result
+
+    def delete_many(self, keys):
+        def delete_shard(shard_id, group):
+            return self._apply_write(shard_id, group, False, "delete_many", group, versioned=True)
+
+        migration = self._migration
+        if migration is not None:
+            migration[1].update(keys)
+            old_groups = {}
+            for key in keys:
+                old_id = migration[0].get(key)
+                if old_id != self._get_shard_id(key) and old_id in self.shards:
+                    old_groups.setdefault(old_id, []).append(key)
+            self._run_per_shard(delete_shard, old_groups)
+        return sum(self._run_per_shard(delete_shard, self._group_by_shard(keys)).values())
+
+    def _migrate(self, old_ring, new_ring, sources):
+        """
+        Stream keys from `sources` whose owner differs between old_ring and new_ring.
+
+        Routing switches to new_ring first; reads fall back to the old owner
+        until a key has moved. A key is only copied if the new owner has not
+        received a newer write or a delete for it in the meantime.
+
+        Returns:
+            int: Number of records moved.
+        """
+        self._migration = (old_ring, set())
+        self.ring = new_ring
+        self._save_ring(previous=sorted(old_ring.shard_ids))
+        moved = 0
+        try:
+            for source_id in sources:
+                primary = self.shards[source_id][0]
+                outgoing = {}
+                for key in primary.keys():
+                    target_id = new_ring.get(key)
+                    if target_id != source_id:
+                        outgoing.setdefault(target_id, []).append(key)
+                for target_id, keys in outgoing.items():
+                    for i in range(0, len(keys), MIGRATION_BATCH):
+                        moved += self._move_batch(source_id, target_id, keys[i:i + MIGRATION_BATCH])
+        finally:
+            self._migration = None
+        self._save_ring()
+        logging.info(f"Rebalance moved {moved} records from shards {sorted(sources)}")
+        return moved
+
+    def _move_batch(self, source_id, target_id, keys):
+        """Pindahkan seluruh rantai versi tiap key (terlama dulu) lalu buang dari shard asal."""
+        deleted = self._migration[1]
+        source = self.shards[source_id][0]
+        chains = {key: source.export_versions(key) for key in keys}
+        target = self.shards[target_id][0]
+        with self._shard_locks[target_id]:
+            moving = [key for key, chain in chains.items()
+                      if chain and not target.contains(key) and key not in deleted]
+        items = [item for key in moving for item in chains[key]]
+        self._apply_write(target_id, [], False, "load_cold", items)
+        self._apply_write(source_id, [], False, "purge_many", keys)
+        return len(moving)
+
+    def add_shard(self):
+        """Tambah shard baru ke ring dan pindahkan ~1/N data ke sana. Returns (shard_id, moved)."""
+        shard_id = max(self.shards, default=-1) + 1
+        self._open_shard(shard_id)
+        new_ring = self.ring.copy()
+        new_ring.add(shard_id)
+        moved = self._migrate(self.ring, new_ring, sorted(self.ring.shard_ids))
+        return shard_id, moved
+
+    def remove_shard(self, shard_id):
+        """Keluarkan shard dari ring; datanya disebar ke pemilik baru lalu replikanya dihapus."""
+        if shard_id not in self.ring.shard_ids or self.num_shards == 1:
+            raise ValueError(f"Cannot remove shard {shard_id}")
+        new_ring = self.ring.copy()
+        new_ring.remove(shard_id)
+        moved = self._migrate(self.ring, new_ring, [shard_id])
+        self.replication[shard_id].flush()
+        self.replication[shard_id].close(remove=True)
+        for replica in self.shards.pop(shard_id):
+            replica.clear()
+            replica.close()
             try:
-                value = replica.get(key)
-                if value is not None:
-                    logging.info(f"Retrieved key {key} from shard {shard_id}, replica {replica_id}")
-                    return value
+                os.rmdir(replica.cold_path)
+            except OSError:
+                pass
+        del self.replication[shard_id]
+        del self._shard_locks[shard_id]
+        del self._read_loads[shard_id]
+        del self._shard_metrics[shard_id]
+        return moved
+
+    def set_read_policy(self, read_policy=None, consistency=None, hedge_after_ms=None):
+        if read_policy is not None:
+            if read_policy not in READ_POLICIES:
+                raise ValueError(f"Unknown read policy: {read_policy}")
+            self.read_policy = read_policy
+        if consistency is not None:
+            if consistency not in CONSISTENCY_LEVELS:
+                raise ValueError(f"Unknown consistency level: {consistency}")
+            self.consistency = consistency
+        self.hedge_after_ms = hedge_after_ms
+
+    def _read_candidates(self, shard_id, keys, consistency):
+        """Replika yang boleh melayani baca `keys` tanpa melanggar consistency, primary dulu."""
+        replica_ids = list(range(len(self.shards[shard_id])))
+        worker = self.replication[shard_id]
+        if consistency == "eventual" or not worker.pending():
+            # Write sync sudah diterapkan ke semua follower sebelum kembali ke pemanggil
+            return replica_ids
+        if consistency == "strong":
+            return replica_ids[:1]
+        applied = worker.applied_seq
+        if any(self._replication_seq.get(key, 0) > applied for key in keys):
+            return replica_ids[:1]
+        return replica_ids
+
+    def _read_order(self, shard_id, keys, consistency=None, policy=None):
+        candidates = self._read_candidates(shard_id, keys, consistency or self.consistency)
+        return order_replicas(policy or self.read_policy, candidates, self._read_loads[shard_id],
+                              next(self._read_turn))
+
+    def _hedge_delay(self, load):
+        if self.hedge_after_ms is not None:
+            return self.hedge_after_ms / 1000
+        if load.latency.count < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY
+        return max(HEDGE_MIN_DELAY, load.latency.percentile(95))
+
+    def _get_from_shard(self, shard_id, key, as_of=None, consistency=None):
+        """Baca dari replika pilihan policy; replika berikutnya hanya dicoba jika yang ini error (atau lambat saat hedged), bukan saat miss."""
+        self.shards[shard_id]  # buka shard lebih dulu bila belum, metrik-nya didaftarkan saat dibuka
+        metrics = self._shard_metrics[shard_id]
+        start = time.perf_counter()
+        value = self._read_replicas(shard_id, key, as_of, consistency)
+        metrics.observe("get", time.perf_counter() - start)
+        metrics.incr("keys_read")
+        if value is None:
+            metrics.incr("misses")
+        return value
+
+    def _read_replicas(self, shard_id, key, as_of, consistency):
+        replicas, loads = self.shards[shard_id], self._read_loads[shard_id]
+        order = self._read_order(shard_id, (key,), consistency)
+        if self.read_policy == "hedged" and len(order) > 1:
+            return self._hedged_get(shard_id, order, key, as_of)
+        for replica_id in order:
+            try:
+                value = loads[replica_id].call(replicas[replica_id].get, key, as_of=as_of)
             except Exception as e:
                 logging.warning(f"Replica {replica_id} of shard {shard_id} failed get({key}): {e}")
-        logging.error(f"Key {key} not found in any replica of shard {shard_id}")
+                continue
+            if value is not None:
+                logging.debug("Retrieved key %s from shard %s, replica %s", key, shard_id, replica_id)
+            return value
         return None
 
+    def _hedged_get(self, shard_id, order, key, as_of):
+        """
+        Send the read to `order[0]`; each time no answer arrives within the
+        hedge delay (or a replica fails), send it to the next replica too.
+        The first successful answer wins, a miss included; slower duplicates
+        are left to finish in the background.
+        """
+        replicas, loads = self.shards[shard_id], self._read_loads[shard_id]
+
+        def read(replica_id):
+            return loads[replica_id].call(replicas[replica_id].get, key, as_of=as_of)
+
+        futures = {self._read_executor.submit(read, order[0]): order[0]}
+        remaining = list(order[1:])
+        while futures:
+            timeout = self._hedge_delay(loads[order[0]]) if remaining else None
+            done, _ = wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                replica_id = futures.pop(future)
+                try:
+                    value = future.result()
+                except Exception as e:
+                    logging.warning(f"Replica {replica_id} of shard {shard_id} failed get({key}): {e}")
+                    continue
+                if value is not None:
+                    logging.debug("Retrieved key %s from shard %s, replica %s", key, shard_id, replica_id)
+                return value
+            if remaining and (not done or not futures):
+                replica_id = remaining.pop(0)
+                futures[self._read_executor.submit(read, replica_id)] = replica_id
+        return None
+
+    def _get_migrating(self, key):
+        """Selama rebalance, key yang belum dipindah masih dibaca dari pemilik lamanya."""
+        migration = self._migration
+        if migration is None:
+            return None
+        old_ring, deleted = migration
+        old_id = old_ring.get(key)
+        if key in deleted or old_id == self._get_shard_id(key) or old_id not in self.shards:
+            return None
+        return self._get_from_shard(old_id, key)
+
+    def get(self, key, as_version=None, as_of=None, consistency=None):
+        """
+        Args:
+            as_version (int, optional): Convert the value to this schema version.
+            as_of (int, optional): Read the value as of this MVCC version (microseconds since the epoch).
+            consistency (str, optional): Override the manager's consistency level for this read.
+        """
+        shard_id = self._get_shard_id(key)
+        value = self._get_from_shard(shard_id, key, as_of, consistency)
+        if value is None:
+            value = self._get_migrating(key)
+        if value is None:
+            logging.debug("Key %s not found in shard %s", key, shard_id)
+        elif as_version is not None:
+            value = schemas.convert(value, as_version)
+        return value
+
+    def _scan_shard(self, shard_id, start, end, as_of=None):
+        """Stream one shard in key order, continuing on the next replica if one fails mid-scan."""
+        for replica_id, replica in enumerate(self.shards[shard_id]):
+            try:
+                for key, value in replica.scan(start, end, as_of=as_of):
+                    yield key, value
+                    start = key + "\0"
+                return
+            except Exception as e:
+                logging.warning(f"Replica {replica_id} of shard {shard_id} failed scan: {e}")
+
+    def scan(self, start=None, end=None, limit=None, as_of=None):
+        """
+        Stream sorted (key, value) pairs with start <= key < end across all shards.
+
+        Per-shard ordered scans are merged lazily, so only one page per shard
+        is in memory. During a rebalance a key may still exist on its old
+        owner; the copy from the current owner wins. With `as_of`, values are
+        read at that MVCC version.
+        """
+        migration = self._migration
+        streams = []
+        for shard_id in list(self.shards):
+            # (key, 0 jika shard ini pemilik key saat ini, value)
+            streams.append(((key, int(self._get_shard_id(key) != shard_id), value)
+                            for key, value in self._scan_shard(shard_id, start, end, as_of)))
+        emitted = 0
+        previous = None
+        for key, _, value in heapq.merge(*streams, key=lambda row: row[:2]):
+            if key == previous or (migration is not None and key in migration[1]):
+                continue
+            previous = key
+            yield key, value
+            emitted += 1
+            if limit is not None and emitted >= limit:
+                return
+
+    def scan_prefix(self, prefix, limit=None, as_of=None):
+        return self.scan(prefix, prefix_end(prefix), limit, as_of)
+
+    def snapshot(self, shard_id=None, start=None, end=None, as_of=None):
+        """
+        Point-in-time iterator over one shard (or all shards merged), pinned to
+        `as_of` (default: the latest version handed out), so writes made while
+        iterating are not seen.
+        """
+        if as_of is None:
+            # Buka dulu shard yang terlibat: versi terbarunya ikut menaikkan _last_version
+            for opened_id in ([shard_id] if shard_id is not None else list(self.shards)):
+                self.shards[opened_id]
+            with self._version_lock:
+                as_of = self._last_version
+        if shard_id is None:
+            return self.scan(start, end, as_of=as_of)
+        return self._scan_shard(shard_id, start, end, as_of)
+
+    def flush(self, timeout=None):
+        """Tunggu sampai semua write async sudah diterapkan ke seluruh replika."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for worker in self.replication.values():
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if not worker.flush(remaining):
+                return False
+        self._replication_seq.clear()
+        return True
+
+    def wait_replicated(self, key, timeout=None):
+        seq = self._replication_seq.get(key)
+        if seq is None:
+            return True
+        if not self.replication[self._get_shard_id(key)].wait(seq, timeout):
+            return False
+        if self._replication_seq.get(key) == seq:
+            self._replication_seq.pop(key, None)
+        return True
+
+    def replication_lag(self):
+        return {shard_id: worker.lag() for shard_id, worker in self.replication.items()}
+
     def day_change(self):
         flushed = {}
-        for shard_id, shard in enumerate(self.shards):
+        # Shard yang belum dibuka tidak punya data hot
+        for shard_id, shard in self.shards.opened().items():
             flushed[shard_id] = []
-            for replica in shard:
-                count = replica.day_change()
-                flushed[shard_id].append(count)
+            with self._shard_locks[shard_id]:
+                for replica in shard:
+                    count = replica.day_change()
+                    flushed[shard_id].append(count)
         return flushed
 
+    def bloom_stats(self):
+        # Seperti stats lain: hanya shard yang sudah dibuka, supaya lazy_open tetap berlaku
+        return {shard_id: [replica.bloom_stats() for replica in shard]
+                for shard_id, shard in self.shards.opened().items()}
+
+    def read_stats(self):
+        """Latency baca (ms) dan baca yang sedang berjalan per replika."""
+        return {shard_id: [load.stats() for load in loads] for shard_id, loads in self._read_loads.items()}
+
+    def stats(self):
+        """
+        Machine-readable metrics snapshot (JSON-serialisable).
+
+        Returns:
+            dict: "totals" (counters and latency of all replicas merged),
+            and per shard its manager-level operation counts and latency,
+            replication lag, read latency per replica and Storage.stats()
+            of every replica. Shards not opened yet (lazy_open) are reported
+            as {"opened": False} and are not opened by this call.
+        """
+        total = Metrics()
+        evictions = 0
+        shards = {}
+        opened = self.shards.opened()
+        for shard_id in self.shards:
+            replicas = opened.get(shard_id)
+            if replicas is None:
+                shards[shard_id] = {"opened": False}
+                continue
+            replica_stats = [replica.stats() for replica in replicas]
+            for replica in replicas:
+                total.merge(replica.metrics)
+            evictions += sum(stats["counters"]["hot_evictions"] for stats in replica_stats)
+            shards[shard_id] = {
+                "opened": True,
+                "ops": self._shard_metrics[shard_id].snapshot(),
+                "replication": self.replication[shard_id].lag(),
+                "reads": [load.stats() for load in self._read_loads[shard_id]],
+                "replicas": replica_stats,
+            }
+        totals = total.snapshot()
+        totals["counters"] = dict(sorted(dict(totals["counters"], hot_evictions=evictions).items()))
+        return {"uptime_seconds": time.time() - self._started, "totals": totals, "shards": shards}
+
+    def hot_stats(self):
+        return {shard_id: [replica.hot_stats() for replica in shard]
+                for shard_id, shard in self.shards.opened().items()}
+
+    def prune_versions(self, retention_seconds=None):
+        """Buang versi yang lewat retensi di replika yang sudah dibuka; ruangnya diambil kembali oleh compaction."""
+        return {shard_id: [replica.prune_versions(retention_seconds) for replica in shard]
+                for shard_id, shard in self.shards.opened().items()}
+
+    def compact(self):
+        results = {}
+        # Shard yang belum dibuka tidak ditulisi sejak start, jadi tidak dibuka hanya untuk compaction
+        for shard_id, shard in self.shards.opened().items():
+            results[shard_id] = [replica.compact() for replica in shard]
+        return results
+
+    def set_codec(self, codec, shard_ids=None, dict_size=16 * 1024, sample_size=2000):
+        """
+        Switch the value codec of new writes on the given shards (default: all).
+
+        For "zstd-dict" a dictionary is trained per shard on values sampled from
+        its primary and installed on every replica of that shard.
+
+        Returns:
+            dict: {shard_id: dictionary id or None}
+        """
+        result = {}
+        for shard_id in (shard_ids if shard_ids is not None else sorted(self.shards)):
+            replicas = self.shards[shard_id]
+            dictionary = None
+            if codec == "zstd-dict":
+                dictionary = train_dictionary(replicas[0].sample_values(sample_size), dict_size)
+            self.replication[shard_id].flush()
+            with self._shard_locks[shard_id]:
+                for replica in replicas:
+                    replica.set_codec(codec, dictionary)
+            result[shard_id] = dictionary.dict_id() if dictionary is not None else None
+        return result
+
     def check_replica_consistency(self, key):
         shard_id = self._get_shard_id(key)
         values = []
@@ -84,3 +736,110 @@ class ShardManager:
             return True
         logging.warning(f"Inconsistent replicas for {key} on shard {shard_id}: {values}")
         return False
+
+    def anti_entropy(self, shard_ids=None, repair=False, depth=MERKLE_DEPTH, batch_size=MIGRATION_BATCH):
+        """
+        Compare the replicas of each shard with Merkle trees over the ring hash
+        of their keys, list the keys that differ and optionally repair them.
+
+        Digests cover only each live key and its latest MVCC version, so a
+        tree is built from in-memory metadata and segment headers without
+        reading values; only leaves whose hashes differ are listed key by key.
+        Records without an MVCC version (legacy data) compare as equal.
+
+        Returns:
+            dict: {shard_id: {"divergent": [keys], "leaves": differing leaves, "repaired": writes applied}}
+        """
+        report = {}
+        for shard_id in (shard_ids if shard_ids is not None else sorted(self.shards)):
+            replicas = self.shards[shard_id]
+            # Write async yang masih antre bukan divergensi
+            self.replication[shard_id].flush(timeout=5)
+            trees = []
+            for replica_id, replica in enumerate(replicas):
+                try:
+                    trees.append(MerkleTree.build(replica.latest_versions().items(), depth))
+                except Exception as e:
+                    logging.warning(f"Replica {replica_id} of shard {shard_id} failed anti-entropy scan: {e}")
+                    trees.append(None)
+            healthy = [replica_id for replica_id, tree in enumerate(trees) if tree is not None]
+            leaves = set()
+            for replica_id in healthy[1:]:
+                leaves.update(trees[healthy[0]].diff(trees[replica_id]))
+            divergent = []
+            if leaves:
+                in_leaves = LeafFilter(depth, leaves)
+                maps = [replicas[replica_id].latest_versions(in_leaves) for replica_id in healthy]
+                divergent = sorted(key for key in set().union(*maps) if len({m.get(key) for m in maps}) > 1)
+            repaired = 0
+            if repair:
+                for i in range(0, len(divergent), batch_size):
+                    repaired += self._repair_keys(shard_id, divergent[i:i + batch_size])
+            if divergent:
+                logging.warning(f"Shard {shard_id}: {len(divergent)} divergent keys in {len(leaves)} ranges"
+                                + (f", {repaired} repairs applied" if repair else ""))
+            report[shard_id] = {"divergent": divergent, "leaves": len(leaves), "repaired": repaired}
+        return report
+
+    def _repair_keys(self, shard_id, keys):
+        """Samakan `keys` di semua replika ke state dengan versi MVCC terbesar (delete juga); seri dimenangkan replika pertama."""
+        replicas = self.shards[shard_id]
+        repaired = 0
+        with deferred_sync(), self._shard_locks[shard_id]:
+            for key in keys:
+                # Dibaca ulang di bawah shard lock: write yang masuk sejak scan sudah tidak dianggap divergensi
+                states = [replica.key_state(key) for replica in replicas]
+                winner = max(range(len(replicas)), key=lambda i: states[i][0] if states[i] is not None else -1)
+                best = states[winner]
+                if best is None:
+                    continue
+                version, deleted = best
+                item = None
+                if not deleted:
+                    item = replicas[winner].export_versions(key)[-1]
+                    if item[4] != version:
+                        continue
+                for replica, state in zip(replicas, states):
+                    if state == best or (deleted and (state is None or state[1])):
+                        continue
+                    if deleted:
+                        replica.delete(key, version)
+                    else:
+                        replica.put(key, item[1], True, item[2], item[3], version)
+                    repaired += 1
+        return repaired
+
+    def start_anti_entropy(self, interval=60.0, repair=True, depth=MERKLE_DEPTH):
+        """Jalankan anti_entropy di background tiap `interval` detik sampai stop_anti_entropy()."""
+        if self._anti_entropy is not None:
+            return
+        stop = threading.Event()
+
+        def run():
+            while not stop.wait(interval):
+                try:
+                    self.anti_entropy(repair=repair, depth=depth)
+                except Exception as e:
+                    logging.error(f"Anti-entropy run failed: {e}")
+
+        self._anti_entropy = stop
+        threading.Thread(target=run, name="anti-entropy", daemon=True).start()
+
+    def stop_anti_entropy(self):
+        if self._anti_entropy is not None:
+            self._anti_entropy.set()
+            self._anti_entropy = None
+
+    def close(self):
+        """Tunggu replikasi, tutup semua replika dan hentikan proses shard."""
+        self.stop_anti_entropy()
+        self.flush()
+        for worker in self.replication.values():
+            worker.close()
+        for replicas in self.shards.opened().values():
+            for replica in replicas:
+                replica.close()
+        for process in self._processes:
+            process.close()
+        self._executor.shutdown()
+        self._read_executor.shutdown()
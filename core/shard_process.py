@@ -0,0 +1,234 @@
+# === File: core/shard_process.py ===
+"""
+Shard worker processes for ShardManager(processes=N).
+
+Each ShardProcess is a child process that owns the Storage replicas of
+one or more shards, so encoding, compression and index work of different
+shards run on different cores instead of sharing one GIL. The manager
+talks to it through RemoteStorage proxies: every call becomes a
+(request id, handle, method, args, kwargs) request on a pipe and the
+caller blocks on a Future until the answer comes back. Requests issued
+while another thread is sending are flushed together as one pipe
+message, and the worker runs them on a thread pool so a slow call
+(compaction, flush) does not hold up reads.
+"""
+import itertools
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from core.ordered_keys import prefix_end
+from core.storage import Storage, StorageError
+
+# Jumlah key per halaman saat scan dialirkan lewat pipe
+PAGE_SIZE = 256
+
+
+def _page(storage, method, args, kwargs):
+    """Satu halaman hasil scan/scan_keys sebagai list (iterator tidak bisa dikirim lewat pipe)."""
+    return list(getattr(storage, method)(*args, **kwargs))
+
+
+def _serve(conn, threads, log_level):
+    """Loop proses worker: terima batch request, jalankan di thread pool, kirim jawaban satu per satu."""
+    logging.basicConfig(level=log_level, format="%(asctime)s - %(levelname)s - %(message)s")
+    storages = {}
+    handles = itertools.count(1)
+    send_lock = threading.Lock()
+    executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="shard-worker")
+
+    def dispatch(handle, method, args, kwargs):
+        if method == "_open":
+            paths, options = args
+            opened = []
+            for path in paths:
+                new_handle = next(handles)
+                storages[new_handle] = Storage(path, **options)
+                opened.append(new_handle)
+            return opened
+        storage = storages[handle]
+        if method == "_page":
+            return _page(storage, *args)
+        if method == "close":
+            del storages[handle]
+            return storage.close()
+        attr = getattr(storage, method)
+        result = attr(*args, **kwargs) if callable(attr) else attr
+        return bytes(result) if isinstance(result, memoryview) else result
+
+    def execute(req_id, handle, method, args, kwargs):
+        try:
+            response = (req_id, True, dispatch(handle, method, args, kwargs))
+        except Exception as e:
+            response = (req_id, False, e)
+        with send_lock:
+            try:
+                conn.send(response)
+            except Exception as e:
+                # Hasil atau exception tidak bisa di-pickle
+                conn.send((req_id, False, StorageError(f"{method} failed: {e!r}")))
+
+    while True:
+        try:
+            batch = conn.recv()
+        except EOFError:
+            break
+        if batch is None:
+            break
+        for request in batch:
+            executor.submit(execute, *request)
+    executor.shutdown(wait=True)
+    for storage in storages.values():
+        storage.close()
+
+
+class ShardProcess:
+    """Satu proses worker beserta pipe-nya; dipakai bersama oleh semua RemoteStorage di dalamnya."""
+
+    def __init__(self, name, threads=8):
+        ctx = multiprocessing.get_context("spawn")
+        self._conn, child = ctx.Pipe()
+        self.process = ctx.Process(target=_serve, args=(child, threads, logging.getLogger().level),
+                                   name=name, daemon=True)
+        self.process.start()
+        child.close()
+        self._ids = itertools.count(1)
+        self._futures = {}
+        self._outbox = []
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._error = None
+        self._receiver = threading.Thread(target=self._receive, name=f"{name}-recv", daemon=True)
+        self._receiver.start()
+
+    def submit(self, handle, method, *args, **kwargs):
+        future = Future()
+        with self._lock:
+            if self._error is not None:
+                raise self._error
+            req_id = next(self._ids)
+            self._futures[req_id] = future
+            self._outbox.append((req_id, handle, method, args, kwargs))
+        # Siapa pun yang memegang send lock mengirim semua request yang sudah menumpuk sekaligus
+        with self._send_lock:
+            with self._lock:
+                batch, self._outbox = self._outbox, []
+            if batch:
+                try:
+                    self._conn.send(batch)
+                except (OSError, ValueError) as e:
+                    self._fail(StorageError(f"Shard process {self.process.name} unreachable: {e}"))
+        return future
+
+    def call(self, handle, method, *args, **kwargs):
+        return self.submit(handle, method, *args, **kwargs).result()
+
+    def _receive(self):
+        while True:
+            try:
+                req_id, ok, result = self._conn.recv()
+            except (EOFError, OSError):
+                self._fail(StorageError(f"Shard process {self.process.name} exited"))
+                return
+            with self._lock:
+                future = self._futures.pop(req_id, None)
+            if future is None:
+                continue
+            if ok:
+                future.set_result(result)
+            else:
+                future.set_exception(result)
+
+    def _fail(self, error):
+        with self._lock:
+            if self._error is None:
+                self._error = error
+            futures, self._futures = self._futures, {}
+        for future in futures.values():
+            if not future.done():
+                future.set_exception(error)
+
+    def open(self, paths, storage_options):
+        """Buka Storage untuk `paths` di proses ini. Returns: Future berisi list RemoteStorage."""
+        future = Future()
+        opening = self.submit(None, "_open", list(paths), storage_options)
+
+        def done(result):
+            try:
+                future.set_result([RemoteStorage(self, handle, path)
+                                   for handle, path in zip(result.result(), paths)])
+            except Exception as e:
+                future.set_exception(e)
+
+        opening.add_done_callback(done)
+        return future
+
+    def close(self, timeout=10.0):
+        """Minta worker menutup semua Storage-nya lalu berhenti."""
+        with self._send_lock:
+            try:
+                self._conn.send(None)
+            except (OSError, ValueError):
+                pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+        self._conn.close()
+
+
+class RemoteStorage:
+    """
+    Proxy for a Storage living in a ShardProcess.
+
+    Storage methods are forwarded by name and return the same values;
+    scans are fetched page by page. Attributes such as `hot` or `index`
+    stay in the worker and are not available here.
+    """
+
+    def __init__(self, process, handle, cold_path):
+        self._process = process
+        self._handle = handle
+        self.cold_path = cold_path
+
+    def __getattr__(self, name):
+        if name.startswith("__") or not callable(getattr(Storage, name, None)):
+            raise AttributeError(f"{name} is not available on a storage in a shard process")
+
+        def method(*args, **kwargs):
+            return self._process.call(self._handle, name, *args, **kwargs)
+
+        method.__name__ = name
+        return method
+
+    @property
+    def metrics(self):
+        return self._process.call(self._handle, "metrics")
+
+    def scan_keys(self, start=None, end=None, limit=None, include_deleted=False, page_size=PAGE_SIZE):
+        emitted = 0
+        while limit is None or emitted < limit:
+            want = page_size if limit is None else min(page_size, limit - emitted)
+            page = self._process.call(self._handle, "_page", "scan_keys", (start, end, want, include_deleted), {})
+            yield from page
+            emitted += len(page)
+            if len(page) < want:
+                return
+            start = page[-1] + "\0"
+
+    def scan(self, start=None, end=None, limit=None, page_size=PAGE_SIZE, as_of=None):
+        emitted = 0
+        while limit is None or emitted < limit:
+            want = page_size if limit is None else min(page_size, limit - emitted)
+            page = self._process.call(self._handle, "_page", "scan", (start, end, want), {"as_of": as_of})
+            yield from page
+            emitted += len(page)
+            if len(page) < want:
+                return
+            start = page[-1][0] + "\0"
+
+    def scan_prefix(self, prefix, limit=None, as_of=None):
+        return self.scan(prefix, prefix_end(prefix), limit, as_of=as_of)
+
+    def snapshot(self, start=None, end=None, as_of=None):
+        return self.scan(start, end, as_of=as_of if as_of is not None else self.current_version())
@@ -1,162 +1,1824 @@
 import os
+import bisect
+import heapq
+import json
+import mmap
 import struct
-import psutil
 import pickle
 import logging
+import threading
 import time
-from collections import OrderedDict
-from core.encoder import Encoder, EncoderError
+from contextlib import contextmanager
+from itertools import islice
+from core.cache import HotCache
+from core.metrics import Metrics
+from core.encoder import Encoder, EncoderError, get_codec, load_dictionary
+from core.rwlock import RWLock
+from core.ordered_keys import OrderedKeys, prefix_end
+from core.bloom import BloomFilter, BloomError
+from core.index_file import IndexFile, IndexFileError, LogIndex, is_index_file, write_index
+from core.segment import KIND_TOMBSTONE, KIND_VALUE, Segment, load_segments, merge_entries, write_segment
+from core import schemas
+
+# Format entry index.log: [op:1B][offset:8B][length:4B][key_len:4B][key]
+_LOG_ENTRY = struct.Struct("!BQII")
+_LOG_SET = 1
+# offset = versi delete (tombstone masuk histori); 0 = hapus key beserta seluruh histori
+_LOG_DEL = 2
+# offset = batas versi retensi, length = jumlah versi lama yang disisakan
+_LOG_PRUNE = 3
 
 class StorageError(Exception):
     pass
 
+SCAN_CHUNK = 8 << 20
+
+def scan_cold_file(path, chunk_size=SCAN_CHUNK, max_versions=None):
+    """
+    Rebuild an index by scanning a data.bin in large buffered chunks.
+
+    Every schema version Encoder writes is understood; bytes that do not
+    form a valid record are skipped one at a time until the next valid
+    header. Later records for the same key override earlier ones; an
+    overridden versioned record joins the key's version chain.
+
+    Args:
+        max_versions (int, optional): Keep at most this many older versions per key.
+
+    Returns:
+        tuple: (index {key: (offset, length, version)}, valid_end, history
+        {key: [(offset, length, version), ...]}) where valid_end is the end
+        of the last complete record.
+    """
+    index = {}
+    history = {}
+    skipped = 0
+    valid_end = 0
+    with open(path, "rb") as f:
+        buf = b""
+        base = 0  # offset file dari buf[0]
+        pos = 0
+        eof = False
+        while True:
+            try:
+                parsed = Encoder.scan_record(buf, pos)
+            except EncoderError:
+                pos += 1
+                skipped += 1
+                continue
+            if parsed is not None:
+                key, length, version = parsed
+                old = index.get(key)
+                if old is not None and version is not None and old[2]:
+                    chain = history.setdefault(key, [])
+                    chain.append(old)
+                    if max_versions is not None and len(chain) > max_versions:
+                        del chain[0]
+                index[key] = (base + pos, length, version or 0)
+                pos += length
+                valid_end = base + pos
+                continue
+            if eof:
+                break
+            # Record terpotong di ujung chunk: geser sisa buffer dan baca chunk berikutnya
+            chunk = f.read(max(chunk_size, len(buf) - pos + 1))
+            if not chunk:
+                eof = True
+                if pos >= len(buf):
+                    break
+                continue
+            buf = buf[pos:] + chunk
+            base += pos
+            pos = 0
+    if skipped or valid_end < base + len(buf):
+        logging.warning(f"Scan of {path}: skipped {skipped} corrupt bytes, "
+                        f"{base + len(buf) - valid_end} trailing bytes after last record")
+    logging.info(f"Rebuilt index of {path}: {len(index)} keys")
+    return index, valid_end, history
+
+def next_version(last=0):
+    """Versi MVCC berikutnya: mikrodetik epoch, selalu lebih besar dari `last`."""
+    return max(time.time_ns() // 1000, last + 1)
+
+DURABILITY_MODES = ("none", "flush", "fsync", "group")
+
+# Dibaca sekali per proses: psutil (dan impornya) tidak perlu dibayar tiap replika yang dibuka
+_available_memory = None
+
+def available_memory():
+    global _available_memory
+    if _available_memory is None:
+        import psutil
+        _available_memory = psutil.virtual_memory().available
+    return _available_memory
+
+_deferred = threading.local()
+
+@contextmanager
+def deferred_sync():
+    """
+    Defer group-commit waits of Storage writes made in this block until it exits.
+
+    A caller holding its own lock (e.g. ShardManager's shard lock) can release
+    it before blocking on fsync, so concurrent writers share one fsync.
+    """
+    if getattr(_deferred, "pending", None) is not None:
+        yield
+        return
+    _deferred.pending = {}
+    try:
+        yield
+    finally:
+        pending, _deferred.pending = _deferred.pending, None
+    for storage, target in pending.items():
+        storage._wait_synced(target)
+
+def needs_rebuild(cold_storage_path):
+    """True if opening this directory as Storage would have to scan data.bin."""
+    join = lambda name: os.path.join(cold_storage_path, name)
+    return (os.path.exists(join("data.bin"))
+            and not any(os.path.exists(join(name)) for name in ("index.bin", "index.log", "index.bin.compact")))
+
 class Storage:
-    def __init__(self, cold_storage_path, max_memory_ratio=0.5, avg_item_size=1024):
-        self.hot = OrderedDict()
+    def __init__(self, cold_storage_path, max_memory_ratio=0.5, hot_budget=None, eviction_policy="lru",
+                 checkpoint_interval=10000, compact_threshold=0.5, compact_min_bytes=1 << 20,
+                 rebuilt_index=None, durability="flush", group_commit_ms=5, codec=None, max_versions=5,
+                 retention_seconds=None, bloom_bits_per_key=10, flush_keys=100_000, merge_fanout=4):
+        """
+        Args:
+            flush_keys (int, optional): Flush the log tier (data.bin) into a new sorted segment once it
+                indexes this many keys; None flushes only on flush_segment()/day_change().
+            merge_fanout (int): Number of similar-sized adjacent segments merged into one.
+            bloom_bits_per_key (int): Size of the Bloom filter over cold keys (10 ≈ 1% false positives).
+            max_versions (int): Older versions kept per key for as_of reads.
+            retention_seconds (float, optional): Also drop versions superseded longer ago than this
+                (see prune_versions); None keeps them until max_versions pushes them out.
+            codec (str, optional): Value codec for new records (see core.encoder.CODECS).
+                Defaults to the codec saved in codec.json, else "zlib".
+            durability (str): When appends reach disk —
+                "none"  : buffered in-process, flushed lazily;
+                "flush" : flushed to the OS after every write (survives a process crash);
+                "fsync" : fsync after every write;
+                "group" : writers wait for a background fsync issued every `group_commit_ms`,
+                          so concurrent writes share one fsync.
+        """
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"Unknown durability mode: {durability}")
         self.max_memory_ratio = max_memory_ratio
-        self.avg_item_size = avg_item_size
-        self.hot_limit = self._calculate_hot_limit()
+        self.hot_budget = hot_budget if hot_budget is not None else self._calculate_hot_budget()
+        self.hot = HotCache(self.hot_budget, eviction_policy)
         self.cold_path = cold_storage_path
         self.cold_file = os.path.join(cold_storage_path, "data.bin")
-        self.index = {}
+        self.index_file = os.path.join(cold_storage_path, "index.bin")
+        self.log_file = os.path.join(cold_storage_path, "index.log")
+        self.checkpoint_interval = checkpoint_interval
+        self.compact_threshold = compact_threshold
+        self.compact_min_bytes = compact_min_bytes
+        self.durability = durability
+        self.group_commit_ms = group_commit_ms
+        self.codec_file = os.path.join(cold_storage_path, "codec.json")
+        self.bloom_file = os.path.join(cold_storage_path, "bloom.bin")
+        self.bloom_bits_per_key = bloom_bits_per_key
+        # Semua key yang punya record cold (terbaru atau histori) atau nilai hot-only; bersama filter
+        # segmen, miss dijawab tanpa lock maupun disk
+        self.bloom = None
+        # Counter hit/miss, byte cold dan histogram latency operasi; lihat stats()
+        self.metrics = Metrics()
+        self.max_versions = max_versions
+        self.retention_seconds = retention_seconds
+        # Segmen terurut immutable di bawah data.bin, terbaru dulu; daftar resminya di MANIFEST
+        self.segment_dir = os.path.join(cold_storage_path, "segments")
+        self.manifest_file = os.path.join(self.segment_dir, "MANIFEST")
+        self.segments = ()
+        self.flush_keys = flush_keys
+        self.merge_fanout = merge_fanout
+        self._next_segment_id = 1
+        self._flush_lock = threading.Lock()
+        self._merge_lock = threading.Lock()
+        # key -> (offset, length, version) record terbaru (LogIndex: snapshot mmap + delta PackedIndex)
+        self.index = LogIndex(None, self._record_key)
+        # key -> [(offset, length, version), ...] versi lama, urut naik; tombstone delete = (None, 0, version)
+        self.history = {}
+        # Versi nilai hot yang belum ditulis ke cold (write_to_cold=False)
+        self._hot_versions = {}
+        self._last_version = 0
+        self._version_lock = threading.Lock()
+        # Semua key (cold, hot-only, dan yang masih punya histori) terurut, untuk scan range/prefix;
+        # dibangun saat scan pertama (lihat ordered), bukan saat replika dibuka
+        self._ordered = None
+        self._ordered_lock = threading.Lock()
+        self.live_bytes = 0
+        self._log_entries = 0
+        self._mmap = None
+        # Pembaca jalan paralel; penulis diserialisasi dan offset dialokasikan di bawah write lock
+        self._lock = RWLock()
+        self._compact_lock = threading.Lock()
+        self._mmap_lock = threading.Lock()
+        # Handle append persisten untuk data.bin dan index.log
+        self._data_fh = None
+        self._log_fh = None
+        self._read_fh = None  # pread record yang belum tercakup mmap (key PackedIndex saat snapshot)
+        self._fh_lock = threading.Lock()
+        # Group commit: write ke-N sudah di-fsync jika _synced_seq >= N
+        self._written_seq = 0
+        self._synced_seq = 0
+        self._sync_cond = threading.Condition()
+        self._closed = False
         os.makedirs(cold_storage_path, exist_ok=True)
+        self._load_codec(codec)
+        self._recover_compaction()
+        self._data_end = os.path.getsize(self.cold_file) if os.path.exists(self.cold_file) else 0
+        self._load_segments()
+        self.bloom = self._load_bloom()
         if not self._load_index():
-            self._build_index()
-        logging.info(f"Storage initialized: {self.cold_path}, hot limit: {self.hot_limit}")
+            # rebuilt_index: hasil scan_cold_file yang sudah dihitung di luar (mis. paralel oleh ShardManager)
+            self._build_index(rebuilt_index)
+            self._recount()
+        if self.bloom is None:
+            self._rebuild_bloom()
+            self._save_bloom()
+        if durability == "group":
+            threading.Thread(target=self._group_commit_loop, name=f"group-commit-{cold_storage_path}",
+                             daemon=True).start()
+        logging.info(f"Storage initialized: {self.cold_path}, hot budget: {self.hot_budget} bytes")
+
+    def _load_codec(self, codec):
+        """Read codec.json and every trained zstd dictionary kept next to data.bin."""
+        saved = {}
+        if os.path.exists(self.codec_file):
+            with open(self.codec_file) as f:
+                saved = json.load(f)
+        self.dictionaries = {}
+        for name in os.listdir(self.cold_path):
+            if name.startswith("zstd-") and name.endswith(".dict"):
+                try:
+                    with open(os.path.join(self.cold_path, name), "rb") as f:
+                        dictionary = load_dictionary(f.read())
+                except EncoderError as e:
+                    logging.warning(f"Cannot load {name} in {self.cold_path}: {e}")
+                    continue
+                self.dictionaries[dictionary.dict_id()] = dictionary
+        self.codec = codec or saved.get("codec", "zlib")
+        self.dictionary = self.dictionaries.get(saved.get("dictionary"))
+        try:
+            get_codec(self.codec)
+        except EncoderError as e:
+            raise ValueError(str(e))
+        if self.codec == "zstd-dict" and self.dictionary is None:
+            raise ValueError(f"{self.cold_path} has no trained dictionary for zstd-dict")
+
+    def set_codec(self, codec, dictionary=None):
+        """
+        Switch the codec used for new records; existing records keep theirs.
+
+        Args:
+            codec (str): Registered codec name.
+            dictionary (optional): Trained zstd dictionary (required for "zstd-dict").
+        """
+        try:
+            get_codec(codec)
+        except EncoderError as e:
+            raise ValueError(str(e))
+        if codec == "zstd-dict" and dictionary is None:
+            raise ValueError("zstd-dict needs a trained dictionary")
+        with self._lock.write():
+            if dictionary is not None:
+                dict_id = dictionary.dict_id()
+                dict_file = os.path.join(self.cold_path, f"zstd-{dict_id}.dict")
+                if not os.path.exists(dict_file):
+                    with open(dict_file + ".tmp", "wb") as f:
+                        f.write(dictionary.as_bytes())
+                    os.replace(dict_file + ".tmp", dict_file)
+                self.dictionaries[dict_id] = dictionary
+            self.codec = codec
+            self.dictionary = dictionary
+            tmp_file = self.codec_file + ".tmp"
+            with open(tmp_file, "w") as f:
+                json.dump({"codec": codec, "dictionary": dictionary.dict_id() if dictionary is not None else None}, f)
+            os.replace(tmp_file, self.codec_file)
+        logging.info(f"Codec of {self.cold_path} set to {codec}")
 
-    def _calculate_hot_limit(self):
-        available_memory = psutil.virtual_memory().available
-        max_memory = available_memory * self.max_memory_ratio
-        return max(10, int(max_memory // self.avg_item_size))
+    def sample_values(self, limit=2000):
+        """Decode up to `limit` cold values as (value, schema_version), e.g. to train a dictionary."""
+        keys = self.scan_keys(limit=limit)
+        samples = []
+        for key in keys:
+            record = self.get_raw(key)
+            if record is not None:
+                samples.append((record[1], record[2]))
+        return samples
+
+    def _calculate_hot_budget(self):
+        return max(1 << 20, int(available_memory() * self.max_memory_ratio))
+
+    def _spill(self, evicted):
+        """Entry hot yang dibuang dan belum ada di cold harus ditulis ke cold, dengan versinya."""
+        return [(key, value, 1, None, self._hot_versions.pop(key, None)) for key, value, dirty in evicted if dirty]
+
+    def _next_version(self):
+        """Versi MVCC untuk write berikutnya, dialokasikan tanpa write lock."""
+        with self._version_lock:
+            self._last_version = next_version(self._last_version)
+            return self._last_version
+
+    def _observe_version(self, version):
+        """Versi dari luar (mis. ShardManager atau replay) tidak boleh dilewati oleh versi lokal berikutnya."""
+        if version > self._last_version:
+            with self._version_lock:
+                self._last_version = max(self._last_version, version)
+
+    def _recount(self):
+        self.live_bytes = (sum(entry[1] for entry in self.index.values())
+                           + sum(entry[1] for chain in self.history.values() for entry in chain))
+        self._ordered = None
+        versions = [entry[2] for entry in self.index.values()]
+        versions.extend(chain[-1][2] for chain in self.history.values())
+        versions.extend(segment.max_version for segment in self.segments)
+        self._last_version = max(versions, default=0)
+
+    @property
+    def ordered(self):
+        """OrderedKeys of every data.bin, history and hot key, built on first use."""
+        ordered = self._ordered
+        if ordered is None:
+            # Dipanggil di bawah read lock (penulis tidak jalan); lock ini hanya mencegah dua pembaca membangun
+            with self._ordered_lock:
+                if self._ordered is None:
+                    self._ordered = OrderedKeys(set(self.index).union(self.history, self.hot.keys()))
+                ordered = self._ordered
+        return ordered
+
+    def _ordered_add(self, key):
+        if self._ordered is not None:
+            self._ordered.add(key)
+
+    def _ordered_discard(self, key):
+        if self._ordered is not None:
+            self._ordered.discard(key)
 
     def _load_index(self):
-        index_file = os.path.join(self.cold_path, "index.bin")
-        if os.path.exists(index_file):
-            with open(index_file, "rb") as f:
-                self.index = pickle.load(f)
-            logging.info(f"Loaded index from {index_file}")
-            return True
-        return False
+        """
+        Open index.bin and replay index.log on top of it.
+
+        A binary snapshot (core/index_file.py) is memory-mapped rather than
+        loaded, and its header supplies live_bytes and the newest version.
+        An old pickled index.bin is loaded once and rewritten as binary.
+        """
+        if not os.path.exists(self.index_file) and not os.path.exists(self.log_file):
+            return False
+        logged_end = 0
+        binary = False
+        if os.path.exists(self.index_file):
+            if is_index_file(self.index_file):
+                try:
+                    base = IndexFile(self.index_file)
+                except IndexFileError as e:
+                    logging.warning(f"Rebuilding index of {self.cold_path}: {e}")
+                    for path in (self.index_file, self.log_file):
+                        if os.path.exists(path):
+                            os.remove(path)
+                    return False
+                self.index = LogIndex(base, self._record_key)
+                self.history = base.history()
+                logged_end = base.data_end
+                # Replay di bawah memperbarui keduanya secara inkremental
+                self.live_bytes = base.live_bytes
+                self._last_version = max([base.max_version] + [segment.max_version for segment in self.segments])
+                binary = True
+            else:
+                with open(self.index_file, "rb") as f:
+                    snapshot = pickle.load(f)
+                if isinstance(snapshot, tuple):
+                    self.index, logged_end = snapshot[:2]
+                    if len(snapshot) > 2:
+                        self.history = snapshot[2]
+                else:
+                    # Format lama: dict saja, akhir data yang tercatat tidak diketahui
+                    self.index, logged_end = snapshot, None
+            logging.info(f"Loaded index from {self.index_file}")
+        if not binary and self._upgrade_legacy_index():
+            logging.info(f"Upgraded legacy index entries of {self.cold_path} to (offset, length, version)")
+        replayed_end = self._replay_log()
+        if logged_end is not None:
+            self._truncate_torn_tail(max(logged_end, replayed_end))
+        if not binary:
+            # Index pickle (atau hanya index.log): tulis ulang sebagai snapshot biner
+            self._adopt_legacy_history()
+            self._save_index()
+            self._recount()
+        return True
+
+    def _truncate_torn_tail(self, logged_end):
+        """
+        Reconcile data.bin with the end of the last logged append.
+
+        Bytes past it belong to appends whose index entry never made it to
+        disk (the write did not complete), so they are cut off without
+        scanning. If data.bin is shorter (unsynced data lost), entries
+        pointing past its end are dropped.
+        """
+        if self._data_end > logged_end:
+            logging.warning(f"Truncating {self._data_end - logged_end} unlogged bytes from {self.cold_file}")
+            with open(self.cold_file, "r+b") as f:
+                f.truncate(logged_end)
+            self._data_end = logged_end
+        elif self._data_end < logged_end:
+            lost = [key for key, (offset, length, _) in self.index.items() if offset + length > self._data_end]
+            for key in lost:
+                del self.index[key]
+            for key, chain in list(self.history.items()):
+                chain[:] = [entry for entry in chain if entry[0] is None or entry[0] + entry[1] <= self._data_end]
+                if not chain:
+                    del self.history[key]
+            logging.warning(f"{self.cold_file} ends before its index; dropped {len(lost)} lost records")
+            self._save_index()
+
+    def _upgrade_legacy_index(self):
+        """Index lama hanya menyimpan offset atau (offset, length); lengkapi dengan panjang dan versi dari header record."""
+        upgraded = False
+        for key, entry in list(self.index.items()):
+            if isinstance(entry, tuple) and len(entry) == 3:
+                continue
+            upgraded = True
+            offset = entry if isinstance(entry, int) else entry[0]
+            try:
+                buf = self._cold_buffer(offset + 1)
+                length = entry[1] if isinstance(entry, tuple) else Encoder.record_size(buf, offset)
+                self.index[key] = (offset, length, Encoder.record_version(buf, offset) or 0)
+            except (EncoderError, StorageError, OSError, ValueError, struct.error) as e:
+                logging.warning(f"Dropping unreadable index entry {key}@{entry}: {e}")
+                del self.index[key]
+        return upgraded
+
+    def _adopt_legacy_history(self):
+        """Ubah key histori format lama `key::hist<ms>` menjadi rantai versi milik key aslinya."""
+        legacy = [key for key in self.index if "::hist" in key]
+        if not legacy:
+            return False
+        for hist_key in legacy:
+            key, _, stamp = hist_key.partition("::hist")
+            offset, length, _ = self.index.pop(hist_key)
+            version = int(stamp) * 1000 if stamp.isdigit() else 0
+            self.history.setdefault(key, []).append((offset, length, version))
+        for key in {hist_key.partition("::hist")[0] for hist_key in legacy}:
+            chain = self.history[key]
+            chain.sort(key=lambda entry: entry[2])
+            latest = self.index.get(key)
+            if latest is None:
+                chain.append((None, 0, chain[-1][2] + 1))
+            elif latest[2] <= chain[-1][2]:
+                # Record terbaru format lama tidak berversi: letakkan setelah histori terakhirnya
+                self.index[key] = (latest[0], latest[1], chain[-1][2] + 1)
+            self._trim_history(key)
+        logging.info(f"Converted {len(legacy)} legacy history keys of {self.cold_path} into version chains")
+        return True
+
+    def _record_version(self, offset, length):
+        """Versi dari header record di data.bin (0 jika tidak berversi atau tidak terbaca)."""
+        if offset + length > self._data_end:
+            return 0
+        try:
+            return Encoder.record_version(self._cold_buffer(offset + length), offset) or 0
+        except (EncoderError, StorageError, OSError, ValueError, struct.error):
+            return 0
+
+    def _record_key(self, offset, length):
+        """Byte key dari record di data.bin, untuk menulis key PackedIndex ke snapshot (None jika tidak terbaca)."""
+        buf = self._mmap
+        try:
+            if buf is not None and offset + length <= len(buf):
+                return Encoder.record_key(buf, offset)
+        except ValueError:
+            pass  # mmap baru saja ditutup oleh remap pembaca lain, ulangi di bawah lock
+        except (EncoderError, struct.error):
+            return None
+        # Record sesudah akhir mmap (baru ditulis): pread saja, remap dibiarkan untuk pembaca nilai
+        try:
+            return Encoder.record_key(self._pread(offset, length), 0)
+        except (EncoderError, OSError, ValueError, struct.error):
+            return None
+
+    def _replay_log(self):
+        """Apply index.log entries written since the last index.bin checkpoint."""
+        if not os.path.exists(self.log_file):
+            return 0
+        with open(self.log_file, "rb") as f:
+            data = f.read()
+        pos = 0
+        entries = 0
+        replayed_end = 0
+        while pos + _LOG_ENTRY.size <= len(data):
+            op, offset, length, key_len = _LOG_ENTRY.unpack_from(data, pos)
+            end = pos + _LOG_ENTRY.size + key_len
+            if end > len(data) or op not in (_LOG_SET, _LOG_DEL, _LOG_PRUNE):
+                break
+            key = data[pos + _LOG_ENTRY.size:end].decode("utf-8")
+            if op == _LOG_SET:
+                self._set_entry(key, (offset, length, self._record_version(offset, length)))
+                replayed_end = max(replayed_end, offset + length)
+            elif op == _LOG_DEL:
+                self._drop_entry(key, offset or None)
+            else:
+                self._trim_history(key, length, offset)
+            pos = end
+            entries += 1
+        if pos < len(data):
+            # Entry terakhir terpotong (crash saat append), buang ekornya
+            logging.warning(f"Truncating torn tail of {self.log_file} at {pos}")
+            with open(self.log_file, "r+b") as f:
+                f.truncate(pos)
+        self._log_entries = entries
+        logging.info(f"Replayed {entries} index log entries from {self.log_file}")
+        return replayed_end
+
+    def _append_log(self, entries):
+        """Append (op, key, offset, length) deltas to index.log, checkpointing when it grows too large."""
+        buf = bytearray()
+        for op, key, offset, length in entries:
+            key_bytes = key.encode("utf-8")
+            buf += _LOG_ENTRY.pack(op, offset, length, len(key_bytes))
+            buf += key_bytes
+        log = self._log_handle()
+        log.write(buf)
+        if self.durability != "none":
+            log.flush()
+        if self.durability == "fsync":
+            self._sync_files()
+        with self._sync_cond:
+            self._written_seq += 1
+            self._sync_cond.notify_all()
+        self._log_entries += len(entries)
+        # Checkpoint setelah log sebanding dengan ukuran index, biaya amortisasi tetap O(1) per write
+        if self._log_entries >= max(self.checkpoint_interval, len(self.index)):
+            self._save_index()
+
+    def _load_bloom(self):
+        """bloom.bin selalu ditulis sebelum index.bin, jadi isinya mencakup semua key snapshot; sisanya dari replay log."""
+        if not os.path.exists(self.bloom_file):
+            return None
+        try:
+            return BloomFilter.load(self.bloom_file, self.bloom_bits_per_key)
+        except (BloomError, OSError) as e:
+            logging.warning(f"Rebuilding bloom filter of {self.cold_path}: {e}")
+            return None
+
+    def _rebuild_bloom(self):
+        self.bloom = BloomFilter.build(set(self.index).union(self.history, self._hot_versions),
+                                       self.bloom_bits_per_key)
+
+    def _bloom_add(self, key):
+        bloom = self.bloom
+        if bloom is not None:
+            bloom.add(key)
+            if bloom.count > bloom.capacity:
+                # Filter penuh: bangun ulang dua kali lebih besar, biaya amortisasi O(1) per key
+                self._rebuild_bloom()
+
+    def _save_bloom(self):
+        if self.bloom is not None:
+            self.bloom.save(self.bloom_file, fsync=self.durability in ("fsync", "group"))
+
+    def bloom_stats(self):
+        """Ukuran filter (data.bin + semua segmen), perkiraan FPR, dan FPR terukur dari lookup key yang tidak ada."""
+        bloom = self.bloom
+        segments = self.segments
+        negatives = self.metrics.counter("bloom_negatives") + sum(segment.negatives for segment in segments)
+        false_positives = (self.metrics.counter("bloom_false_positives")
+                           + sum(segment.false_positives for segment in segments))
+        misses = negatives + false_positives
+        return {
+            "keys": bloom.count + sum(segment.bloom.count for segment in segments),
+            "capacity": bloom.capacity,
+            "memory_bytes": bloom.memory_bytes() + sum(segment.bloom.memory_bytes() for segment in segments),
+            "hashes": bloom.num_hashes,
+            "expected_fpr": bloom.expected_fpr(),
+            "negatives": negatives,
+            "false_positives": false_positives,
+            "measured_fpr": false_positives / misses if misses else 0.0,
+        }
 
     def _save_index(self):
-        index_file = os.path.join(self.cold_path, "index.bin")
-        with open(index_file, "wb") as f:
-            pickle.dump(self.index, f)
-        logging.debug(f"Saved index to {index_file}")
+        start = time.perf_counter()
+        self._save_bloom()
+        tmp_file = self.index_file + ".tmp"
+        self._write_snapshot(tmp_file, self.index, self._data_end, self.history)
+        os.replace(tmp_file, self.index_file)
+        self._reset_log()
+        # Entry kembali dibaca dari mmap; mmap lama ditutup GC setelah pembaca terakhir selesai
+        self.index = LogIndex(IndexFile(self.index_file), self._record_key)
+        self.metrics.observe("index_save", time.perf_counter() - start)
+        logging.debug(f"Saved index checkpoint to {self.index_file}")
+
+    def _write_snapshot(self, path, index, data_end, history):
+        """Binary snapshot (core/index_file.py); data_end lets recovery cut torn tails without scanning."""
+        write_index(path, index, data_end, history, fsync=self.durability in ("fsync", "group"))
 
-    def _build_index(self):
+    def _reset_log(self):
+        if self._log_fh is not None:
+            self._log_fh.truncate(0)
+        else:
+            with open(self.log_file, "wb"):
+                pass
+        self._log_entries = 0
+
+    def _build_index(self, scanned=None):
         if not os.path.exists(self.cold_file):
             return
-        self.index.clear()
-        with open(self.cold_file, "rb") as f:
-            while True:
-                offset = f.tell()
-                version_data = f.read(1)
-                if not version_data:
-                    break
-                try:
-                    schema_version = struct.unpack("!B", version_data)[0]
-                    if schema_version == 1:
-                        key_len = struct.unpack("!I", f.read(4))[0]
-                        key = f.read(key_len).decode("utf-8")
-                        value_len = struct.unpack("!I", f.read(4))[0]
-                        f.seek(value_len, os.SEEK_CUR)
-                    elif schema_version == 2:
-                        key_len, value_len, extra_len = struct.unpack("!III", f.read(12))
-                        key = f.read(key_len).decode("utf-8")
-                        f.seek(value_len + extra_len, os.SEEK_CUR)
-                    else:
-                        f.seek(offset + 1)
-                        continue
-                    self.index[key] = offset
-                except Exception:
-                    f.seek(offset + 1)
-                    continue
+        if scanned is None:
+            scanned = scan_cold_file(self.cold_file, max_versions=self.max_versions)
+        self.index, valid_end, self.history = scanned
+        self._rebuild_bloom()
+        if valid_end < self._data_end:
+            # Ekor setelah record valid terakhir adalah append yang terpotong
+            with open(self.cold_file, "r+b") as f:
+                f.truncate(valid_end)
+            self._data_end = valid_end
+        self._adopt_legacy_history()
         self._save_index()
 
-    def _write_cold(self, key, value, schema_version=1, extra_field=None):
-        record = Encoder.encode(key, value, schema_version, extra_field)
-        offset = os.path.getsize(self.cold_file) if os.path.exists(self.cold_file) else 0
-        with open(self.cold_file, "ab") as f:
-            f.write(record)
-            f.flush()
-        self.index[key] = offset
-        self._save_index()
+    def _data_handle(self):
+        if self._data_fh is None:
+            self._data_fh = open(self.cold_file, "ab")
+        return self._data_fh
+
+    def _log_handle(self):
+        if self._log_fh is None:
+            self._log_fh = open(self.log_file, "ab")
+        return self._log_fh
+
+    def _sync_files(self):
+        with self._fh_lock:
+            for fh in (self._data_fh, self._log_fh):
+                if fh is not None:
+                    fh.flush()
+                    os.fsync(fh.fileno())
+
+    def _pread(self, offset, length):
+        with self._fh_lock:
+            if self._data_fh is not None:
+                # Mode "none": append mungkin masih di buffer proses
+                self._data_fh.flush()
+            if self._read_fh is None:
+                self._read_fh = open(self.cold_file, "rb")
+            return os.pread(self._read_fh.fileno(), length, offset)
+
+    def _close_handles(self):
+        with self._fh_lock:
+            for fh in (self._data_fh, self._log_fh, self._read_fh):
+                if fh is not None:
+                    fh.close()
+            self._data_fh = self._log_fh = self._read_fh = None
+
+    def _group_commit_loop(self):
+        """fsync data.bin and index.log at most once per group_commit_ms for all writes made since the last sync."""
+        last_sync = 0.0
+        while True:
+            with self._sync_cond:
+                self._sync_cond.wait_for(lambda: self._closed or self._written_seq > self._synced_seq)
+                if self._closed:
+                    return
+            # Write pertama setelah idle langsung di-fsync; di bawah beban, write dikumpulkan per jendela
+            delay = last_sync + self.group_commit_ms / 1000 - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            last_sync = time.monotonic()
+            with self._sync_cond:
+                target = self._written_seq
+            try:
+                self._sync_files()
+            except (OSError, ValueError) as e:
+                # Handle ditutup/diganti compaction di tengah jalan; coba lagi di jendela berikutnya
+                logging.warning(f"Group commit of {self.cold_path} failed: {e}")
+                continue
+            with self._sync_cond:
+                self._synced_seq = max(self._synced_seq, target)
+                self._sync_cond.notify_all()
+
+    def _wait_synced(self, target):
+        with self._sync_cond:
+            self._sync_cond.wait_for(lambda: self._synced_seq >= target or self._closed)
+
+    def _commit(self):
+        """
+        In group mode, block until every write made so far is fsynced.
+
+        Must be called after the write lock is released; inside deferred_sync()
+        the wait is postponed to the end of that block.
+        """
+        if self.durability != "group":
+            return
+        with self._sync_cond:
+            target = self._written_seq
+        pending = getattr(_deferred, "pending", None)
+        if pending is not None:
+            pending[self] = max(pending.get(self, 0), target)
+        else:
+            self._wait_synced(target)
+
+    def close(self):
+        """Flush and fsync outstanding appends and release file handles."""
+        with self._lock.write():
+            self._sync_files()
+            self._close_handles()
+            with self._mmap_lock:
+                self._close_mmap()
+        with self._sync_cond:
+            self._synced_seq = self._written_seq
+            self._closed = True
+            self._sync_cond.notify_all()
+
+    def _write_cold(self, key, value, schema_version=1, extra_field=None, version=None):
+        self._write_cold_many([(key, value, schema_version, extra_field, version)])
+
+    def _write_cold_many(self, items):
+        """
+        Encode (key, value, schema_version, extra_field[, version]) items and append them with a single write.
+
+        Items without a version get a fresh one; the record a key had before
+        becomes the newest entry of its version chain.
+        """
+        if not items:
+            return
+        codec, dictionary = self.codec, self.dictionary
+        items = [(key, value, schema_version, extra_field,
+                  rest[0] if rest and rest[0] is not None else self._next_version())
+                 for key, value, schema_version, extra_field, *rest in items]
+        records = [Encoder.encode(key, value, schema_version, extra_field, codec=codec, dictionary=dictionary,
+                                  version=version)
+                   for key, value, schema_version, extra_field, version in items]
+        blob = b"".join(records)
+        with self._lock.write():
+            offset = self._data_end
+            data = self._data_handle()
+            data.write(blob)
+            if self.durability != "none":
+                data.flush()
+            entries = []
+            for (key, _, _, _, version), record in zip(items, records):
+                self._set_entry(key, (offset, len(record), version))
+                entries.append((_LOG_SET, key, offset, len(record)))
+                offset += len(record)
+            self._data_end = offset
+            self._append_log(entries)
+        self.metrics.incr("cold_bytes_written", len(blob))
+        self._maybe_compact()
+        self._maybe_flush()
+
+    def _set_entry(self, key, entry):
+        old = self.index.get(key)
+        self.live_bytes += entry[1]
+        self._observe_version(entry[2])
+        if old is not None and entry[2] < old[2]:
+            # Kalah balapan dengan write berversi lebih baru: langsung jadi histori
+            bisect.insort(self.history.setdefault(key, []), entry, key=lambda e: e[2])
+            self._trim_history(key)
+            return
+        self.index[key] = entry
+        if old is None:
+            self._ordered_add(key)
+            self._bloom_add(key)
+        elif old[2] and old[2] != entry[2]:
+            # Record lama berversi tetap hidup sebagai versi histori
+            self.history.setdefault(key, []).append(old)
+            self._trim_history(key)
+        else:
+            self.live_bytes -= old[1]
+
+    def _drop_entry(self, key, version=None):
+        """
+        Remove the latest record of `key`.
+
+        With a version it moves into the version chain followed by a
+        tombstone, so as_of reads before the delete still see it; without
+        one the key is purged together with its history. A key that only
+        lives in segments gets a tombstone that hides it there.
+        """
+        old = self.index.pop(key, None)
+        deleted = old is not None
+        if version is None:
+            if old is not None:
+                self.live_bytes -= old[1]
+            for entry in self.history.pop(key, ()):
+                self.live_bytes -= entry[1]
+        elif old is not None:
+            chain = self.history.setdefault(key, [])
+            chain.append(old)
+            chain.append((None, 0, version))
+            self._observe_version(version)
+            self._trim_history(key)
+        elif key not in self.history and self._segment_live(key):
+            self.history[key] = [(None, 0, version)]
+            self._observe_version(version)
+            self._ordered_add(key)
+            self._bloom_add(key)
+            deleted = True
+        if key not in self.hot and key not in self.history:
+            self._ordered_discard(key)
+        return deleted
+
+    def _trim_history(self, key, keep=None, cutoff=0):
+        """
+        Drop versions of `key` beyond the newest `keep` (default max_versions)
+        and versions superseded before version `cutoff`; caller holds the write lock.
+
+        Returns:
+            int: Number of chain entries removed.
+        """
+        chain = self.history.get(key)
+        if not chain:
+            return 0
+        keep = self.max_versions if keep is None else keep
+        drop = max(0, len(chain) - keep)
+        latest = self._hot_versions.get(key)
+        if latest is None:
+            entry = self.index.get(key)
+            latest = entry[2] if entry is not None else None
+        if latest is None:
+            # Key sudah dihapus: tombstone terakhir berlaku sampai versinya sendiri
+            latest = chain[-1][2] if chain[-1][0] is None else float("inf")
+        # Versi ke-i masih terbaca lewat as_of sampai versi sesudahnya menggantikannya
+        while drop < len(chain) and (chain[drop + 1][2] if drop + 1 < len(chain) else latest) < cutoff:
+            drop += 1
+        while drop < len(chain) and chain[drop][0] is None:
+            drop += 1
+        if drop == len(chain) and key not in self.index and self._segment_live(key):
+            # Tombstone terakhir masih menutupi nilai di segmen
+            drop -= 1
+        for entry in chain[:drop]:
+            self.live_bytes -= entry[1]
+        del chain[:drop]
+        if not chain:
+            del self.history[key]
+            if key not in self.index and key not in self.hot:
+                self._ordered_discard(key)
+        return drop
+
+    def _cold_buffer(self, end):
+        """Return the persistent mmap of data.bin, remapping when it does not yet cover `end`."""
+        if self._mmap is None or end > len(self._mmap):
+            if self._data_fh is not None:
+                # Mode "none": append mungkin masih di buffer proses
+                self._data_fh.flush()
+            self._close_mmap()
+            with open(self.cold_file, "rb") as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            if end > len(self._mmap):
+                raise StorageError(f"Record at {end} beyond end of {self.cold_file}")
+        return self._mmap
+
+    def _close_mmap(self):
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # Masih ada memoryview yang dipakai pembaca lain, biarkan GC yang menutup
+                pass
+            self._mmap = None
+
+    def _read_record(self, key):
+        with self._lock.read():
+            return self._read_entry(self.index[key])
+
+    def _read_entry(self, entry):
+        """Slice one record out of the mmap; caller must hold the lock (read or write)."""
+        offset, length = entry[0], entry[1]
+        with self._mmap_lock:
+            # View dibuat di bawah lock: pembaca lain yang me-remap tidak bisa menutup mmap yang sedang diekspor
+            view = memoryview(self._cold_buffer(offset + length))[offset:offset + length]
+        self.metrics.incr("cold_bytes_read", length)
+        return view
+
+    def _read_entries(self, entries):
+        """_read_entry for many entries with one mmap lock and one counter update; caller must hold the lock."""
+        if not entries:
+            return []
+        end = max(entry[0] + entry[1] for entry in entries)
+        with self._mmap_lock:
+            view = memoryview(self._cold_buffer(end))
+        self.metrics.incr("cold_bytes_read", sum(entry[1] for entry in entries))
+        return [view[entry[0]:entry[0] + entry[1]] for entry in entries]
+
+    def garbage_ratio(self):
+        if self._data_end == 0:
+            return 0.0
+        return max(0.0, 1 - self.live_bytes / self._data_end)
+
+    def _maybe_compact(self):
+        if self._compact_lock.locked() or self.compact_threshold is None:
+            return
+        if self._data_end >= self.compact_min_bytes and self.garbage_ratio() >= self.compact_threshold:
+            threading.Thread(target=self.compact, daemon=True).start()
 
-    def put(self, key, value, write_to_cold=True, schema_version=1, extra_field=None):
+    def _recover_compaction(self):
+        """Selesaikan atau batalkan compaction yang terputus crash."""
+        new_data = self.cold_file + ".compact"
+        new_index = self.index_file + ".compact"
+        if os.path.exists(new_data):
+            # Crash sebelum swap data.bin: segmen lama masih valid
+            os.remove(new_data)
+            if os.path.exists(new_index):
+                os.remove(new_index)
+        elif os.path.exists(new_index):
+            # data.bin sudah diganti, index baru belum dipasang
+            os.replace(new_index, self.index_file)
+            if os.path.exists(self.log_file):
+                os.remove(self.log_file)
+
+    def compact(self):
+        """
+        Rewrite live records into a fresh file and swap it in for data.bin.
+
+        Versions past retention are pruned first. Live records (latest and
+        retained versions) are copied without holding the lock, so reads and
+        writes keep going; only the tail appended meanwhile is copied during
+        the swap pause.
+
+        Returns:
+            dict: reclaimed_bytes, pause_ms, duration_ms, live_records (None if skipped).
+        """
+        if not self._compact_lock.acquire(blocking=False):
+            return None
+        with self._lock.write():
+            self._prune_expired()
+            snapshot = {(entry[0], entry[1]) for entry in self.index.values()}
+            snapshot.update((entry[0], entry[1]) for chain in self.history.values() for entry in chain
+                            if entry[0] is not None)
+            snapshot_end = self._data_end
+            if self._data_fh is not None:
+                self._data_fh.flush()
+        if snapshot_end == 0:
+            self._compact_lock.release()
+            return None
+        new_data = self.cold_file + ".compact"
+        new_index_file = self.index_file + ".compact"
+        started = time.perf_counter()
         try:
-            if key in self.hot:
-                old_value = self.hot[key]
-                hist_key = f"{key}::hist{int(time.time() * 1000)}"
-                self._write_cold(hist_key, old_value, schema_version, extra_field)
-                self.clean_old_versions(key)
-            if len(self.hot) >= self.hot_limit:
-                evicted_key = next(iter(self.hot))
-                evicted_value = self.hot.pop(evicted_key)
-                self._write_cold(evicted_key, evicted_value)
-            self.hot[key] = value
-            if write_to_cold:
-                self._write_cold(key, value, schema_version, extra_field)
-            logging.info(f"Put key {key}")
+            moved = {}
+            with open(self.cold_file, "rb") as src, open(new_data, "wb") as dst:
+                with mmap.mmap(src.fileno(), snapshot_end, access=mmap.ACCESS_READ) as buf:
+                    for offset, length in sorted(snapshot):
+                        moved[offset] = dst.tell()
+                        dst.write(buf[offset:offset + length])
+
+                with self._lock.write():
+                    pause_start = time.perf_counter()
+                    # Salin ekor yang ditulis selama compaction berjalan
+                    tail_base = dst.tell()
+                    if self._data_fh is not None:
+                        self._data_fh.flush()
+                    src.seek(snapshot_end)
+                    dst.write(src.read())
+                    old_size = src.tell()
+                    new_size = dst.tell()
+                    dst.flush()
+                    os.fsync(dst.fileno())
+
+                    def relocate(entry):
+                        offset = entry[0]
+                        if offset is None:
+                            return entry
+                        if offset >= snapshot_end:
+                            return (offset - snapshot_end + tail_base,) + entry[1:]
+                        return (moved[offset],) + entry[1:]
+
+                    remapped = {key: relocate(entry) for key, entry in self.index.items()}
+                    history = {key: [relocate(entry) for entry in chain] for key, chain in self.history.items()}
+
+                    self._write_snapshot(new_index_file, remapped, new_size, history)
+                    # Filter baru hanya berisi key yang masih hidup, key terhapus tidak lagi jadi false positive
+                    self.bloom = BloomFilter.build(set(remapped).union(history, self._hot_versions),
+                                                   self.bloom_bits_per_key)
+                    self._save_bloom()
+                    with self._mmap_lock:
+                        self._close_mmap()
+                    self._close_handles()
+                    os.replace(new_data, self.cold_file)
+                    os.replace(new_index_file, self.index_file)
+                    self._reset_log()
+                    self.index = LogIndex(IndexFile(self.index_file), self._record_key)
+                    self.history = history
+                    self.live_bytes = (sum(entry[1] for entry in remapped.values())
+                                       + sum(entry[1] for chain in history.values() for entry in chain))
+                    self._data_end = new_size
+                    pause_ms = (time.perf_counter() - pause_start) * 1000
         except Exception as e:
-            raise StorageError(f"Failed to put {key}: {e}")
+            for path in (new_data, new_index_file):
+                if os.path.exists(path):
+                    os.remove(path)
+            raise StorageError(f"Compaction of {self.cold_path} failed: {e}")
+        finally:
+            self._compact_lock.release()
 
-    def get(self, key):
-        if key in self.hot:
-            self.hot.move_to_end(key)
-            return self.hot[key]
-        if key in self.index:
-            with open(self.cold_file, "rb") as f:
-                f.seek(self.index[key])
-                _, value, _, _ = Encoder.decode(f.read())
-                self.hot[key] = value
-                return value
+        stats = {
+            "reclaimed_bytes": old_size - new_size,
+            "pause_ms": pause_ms,
+            "duration_ms": (time.perf_counter() - started) * 1000,
+            "live_records": len(remapped),
+        }
+        self.metrics.observe("compaction_pause", pause_ms / 1000)
+        self.metrics.incr("compaction_reclaimed_bytes", stats["reclaimed_bytes"])
+        logging.info(f"Compacted {self.cold_path}: reclaimed {stats['reclaimed_bytes']} bytes, pause {pause_ms:.2f} ms")
+        return stats
+
+    def _load_segments(self):
+        """Buka segmen yang terdaftar di MANIFEST; file lain (flush/merge yang terputus crash) dibuang."""
+        if not os.path.isdir(self.segment_dir):
+            return
+        names = []
+        if os.path.exists(self.manifest_file):
+            with open(self.manifest_file) as f:
+                names = json.load(f)
+        ids = [0]
+        for name in os.listdir(self.segment_dir):
+            if name.startswith("seg-"):
+                ids.append(int(name[4:12]))
+            if name != "MANIFEST" and name not in names:
+                os.remove(os.path.join(self.segment_dir, name))
+        self._next_segment_id = max(ids) + 1
+        self.segments = tuple(load_segments(self.segment_dir, names, self.bloom_bits_per_key))
+
+    def _save_manifest(self):
+        tmp_file = self.manifest_file + ".tmp"
+        with open(tmp_file, "w") as f:
+            json.dump([segment.name for segment in self.segments], f)
+            if self.durability in ("fsync", "group"):
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_file, self.manifest_file)
+
+    def _new_segment_path(self):
+        os.makedirs(self.segment_dir, exist_ok=True)
+        with self._version_lock:
+            segment_id = self._next_segment_id
+            self._next_segment_id += 1
+        return os.path.join(self.segment_dir, f"seg-{segment_id:08d}.sst")
+
+    def _segment_lookup(self, key, as_of=None):
+        """(kind, version, record) terbaru dari segmen (terbaru dulu), atau None."""
+        for segment in self.segments:
+            found = segment.get(key, as_of)
+            if found is not None:
+                return found
         return None
 
-    def get_raw(self, key):
-        if key in self.hot:
-            return key, self.hot[key], 1, None
-        if key in self.index:
-            with open(self.cold_file, "rb") as f:
-                f.seek(self.index[key])
-                return Encoder.decode(f.read())
+    def _segment_live(self, key):
+        found = self._segment_lookup(key) if self.segments else None
+        return found is not None and found[0] == KIND_VALUE
+
+    def _segment_value(self, key, as_of=None):
+        found = self._segment_lookup(key, as_of) if self.segments else None
+        if found is None or found[0] == KIND_TOMBSTONE:
+            return None
+        return Encoder.decode(found[2], self.dictionaries)[1]
+
+    def _maybe_flush(self):
+        if self.flush_keys is None or self._flush_lock.locked():
+            return
+        if len(self.index) >= self.flush_keys:
+            threading.Thread(target=self.flush_segment, daemon=True).start()
+
+    def flush_segment(self):
+        """
+        Move everything indexed from data.bin (latest records, version chains
+        and tombstones) into a new immutable sorted segment.
+
+        The segment is written without holding the lock; records written
+        meanwhile stay in data.bin. data.bin is then compacted down to them.
+
+        Returns:
+            dict: segment, entries, duration_ms (None if there was nothing to flush).
+        """
+        with self._flush_lock:
+            with self._compact_lock:
+                # Compaction tidak boleh menukar data.bin selagi dibaca di sini
+                with self._lock.read():
+                    index = dict(self.index.items())
+                    history = {key: list(chain) for key, chain in self.history.items()}
+                    data_end = self._data_end
+                    if self._data_fh is not None:
+                        self._data_fh.flush()
+                if not index and not history:
+                    return None
+                started = time.perf_counter()
+                keys = sorted(set(index).union(history))
+                path = self._new_segment_path()
+                with open(self.cold_file, "rb") as f:
+                    buf = mmap.mmap(f.fileno(), data_end, access=mmap.ACCESS_READ) if data_end else b""
+
+                    def entries():
+                        for key in keys:
+                            chain = history.get(key, [])
+                            if key in index:
+                                chain = chain + [index[key]]
+                            for offset, length, version in reversed(chain):
+                                if offset is None:
+                                    yield key, KIND_TOMBSTONE, version, b""
+                                else:
+                                    yield key, KIND_VALUE, version, buf[offset:offset + length]
+
+                    try:
+                        count = write_segment(path, entries(), len(keys), self.bloom_bits_per_key,
+                                              fsync=self.durability != "none")
+                    finally:
+                        if data_end:
+                            buf.close()
+                segment = Segment(path, self.bloom_bits_per_key)
+                with self._lock.write():
+                    self.segments = (segment,) + self.segments
+                    self._save_manifest()
+                    for key in keys:
+                        flushed = set(history.get(key, ()))
+                        if key in index:
+                            flushed.add(index[key])
+                        if self.index.get(key) in flushed:
+                            self.live_bytes -= self.index.pop(key)[1]
+                        chain = self.history.get(key)
+                        if chain:
+                            remaining = [entry for entry in chain if entry not in flushed]
+                            self.live_bytes -= sum(entry[1] for entry in chain if entry in flushed)
+                            if remaining:
+                                chain[:] = remaining
+                            else:
+                                del self.history[key]
+                        if key not in self.index and key not in self.history and key not in self.hot:
+                            self._ordered_discard(key)
+                    # Filter data.bin cukup untuk key yang tersisa; key segmen punya filter sendiri
+                    self._rebuild_bloom()
+                    self._save_index()
+        stats = {"segment": segment.name, "entries": count, "duration_ms": (time.perf_counter() - started) * 1000}
+        self.metrics.observe("segment_flush", stats["duration_ms"] / 1000)
+        logging.info(f"Flushed {count} entries of {self.cold_path} into {segment.name}")
+        self.compact()
+        self._maybe_merge()
+        return stats
+
+    def _pick_merge(self, segments):
+        """Jendela [i, j) segmen bersebelahan yang digabung, atau None."""
+        fanout = self.merge_fanout
+        if len(segments) < max(2, fanout):
+            return None
+        sizes = [segment.size for segment in segments]
+        for i in range(len(segments) - fanout + 1):
+            window = sizes[i:i + fanout]
+            # Size-tiered: hanya segmen berukuran mirip, agar tiap entry ditulis ulang O(log N) kali
+            if max(window) <= 4 * max(1, min(window)):
+                return i, i + fanout
+        if len(segments) >= 2 * fanout:
+            return len(segments) - fanout, len(segments)
         return None
 
-    def get_all_versions(self, key):
-        result = {}
+    def _maybe_merge(self):
+        if self._merge_lock.locked() or self._pick_merge(self.segments) is None:
+            return
+        threading.Thread(target=self._merge_loop, daemon=True).start()
 
-        # Tambahkan 'latest' dari hot kalau ada
-        if key in self.hot:
-            result['latest'] = self.hot[key]
-        elif key in self.index:
-            result['latest'] = self.get(key)
+    def _merge_loop(self):
+        while self.merge_segments() is not None:
+            pass
 
-        # Tambahkan histori dari cold
-        prefix = f"{key}::hist"
-        for hist_key in sorted(k for k in self.index if k.startswith(prefix)):
-            with open(self.cold_file, "rb") as f:
-                f.seek(self.index[hist_key])
-                _, value, _, _ = Encoder.decode(f.read())
-                result[hist_key] = value
+    def merge_segments(self, full=False):
+        """
+        Merge adjacent segments into one: `merge_fanout` neighbours of similar
+        size, or all of them with full=True.
+
+        max_versions and retention are applied while merging; tombstones are
+        dropped once the merge reaches the oldest segment.
+
+        Returns:
+            dict: merged, entries, duration_ms (None if nothing was merged).
+        """
+        with self._merge_lock:
+            segments = self.segments
+            window = (0, len(segments)) if full else self._pick_merge(segments)
+            if window is None or window[1] - window[0] < 2:
+                return None
+            started = time.perf_counter()
+            inputs = segments[window[0]:window[1]]
+            cutoff = 0
+            if self.retention_seconds is not None:
+                cutoff = int((time.time() - self.retention_seconds) * 1_000_000)
+            path = self._new_segment_path()
+            count = write_segment(path, merge_entries(inputs, self.max_versions, cutoff, window[1] == len(segments)),
+                                  sum(segment.bloom.count for segment in inputs), self.bloom_bits_per_key,
+                                  fsync=self.durability != "none")
+            merged = [Segment(path, self.bloom_bits_per_key)] if count else []
+            with self._lock.write():
+                # Flush hanya menambah di depan, jadi jendela ini masih bersebelahan
+                current = list(self.segments)
+                start = current.index(inputs[0])
+                current[start:start + len(inputs)] = merged
+                self.segments = tuple(current)
+                self._save_manifest()
+            if not count:
+                os.remove(path)
+            for segment in inputs:
+                os.remove(segment.path)
+        stats = {"merged": len(inputs), "entries": count, "duration_ms": (time.perf_counter() - started) * 1000}
+        self.metrics.observe("segment_merge", stats["duration_ms"] / 1000)
+        logging.info(f"Merged {len(inputs)} segments of {self.cold_path} into {count} entries")
+        return stats
+
+    def segment_stats(self):
+        """Jumlah segmen, ukuran di disk, entry, dan memori yang tetap tinggal (sparse index + Bloom filter)."""
+        segments = self.segments
+        return {
+            "segments": len(segments),
+            "bytes": sum(segment.size for segment in segments),
+            "entries": sum(segment.count for segment in segments),
+            "resident_bytes": sum(segment.resident_bytes() for segment in segments),
+            "log_keys": len(self.index),
+        }
+
+    def _stage_put(self, cold, key, value, write_to_cold, schema_version, extra_field, version):
+        """Kumpulkan record cold untuk satu put ke `cold`; caller memegang write lock."""
+        if self.hot.is_dirty(key):
+            # Nilai hot-only sebelumnya tetap tercatat sebagai versi histori
+            cold.append((key, self.hot[key], 1, None, self._hot_versions.pop(key, None)))
+        if not write_to_cold and key not in self.bloom:
+            # Nilai hot-only juga harus lolos filter, kalau tidak _lookup menganggapnya miss
+            self._bloom_add(key)
+        cold.extend(self._spill(self.hot.put(key, value, dirty=not write_to_cold)))
+        self._ordered_add(key)
+        if write_to_cold:
+            cold.append((key, value, schema_version, extra_field, version))
+        else:
+            self._hot_versions[key] = version
+
+    def put(self, key, value, write_to_cold=True, schema_version=1, extra_field=None, version=None):
+        """
+        Args:
+            version (int, optional): MVCC version of the write; ShardManager passes the same
+                one to every replica. Defaults to a fresh version.
+        """
+        start = time.perf_counter()
+        try:
+            with self._lock.write():
+                cold = []
+                self._stage_put(cold, key, value, write_to_cold, schema_version, extra_field,
+                                version if version is not None else self._next_version())
+                self._write_cold_many(cold)
+            self._commit()
+            self.metrics.observe("put", time.perf_counter() - start)
+            self.metrics.incr("keys_written")
+            logging.debug("Put key %s", key)
+        except Exception as e:
+            raise StorageError(f"Failed to put {key}: {e}")
+
+    def put_many(self, items, write_to_cold=True, schema_version=1, extra_field=None, version=None):
+        """
+        Store many key-value pairs with one buffered cold append and one index log write.
+
+        Args:
+            items (dict | list): Mapping or (key, value) pairs.
+            version (int, optional): MVCC version shared by the whole batch.
+
+        Returns:
+            int: Number of keys stored.
+        """
+        items = list(items.items()) if isinstance(items, dict) else list(items)
+        start = time.perf_counter()
+        try:
+            with self._lock.write():
+                cold = []
+                for key, value in items:
+                    self._stage_put(cold, key, value, write_to_cold, schema_version, extra_field,
+                                    version if version is not None else self._next_version())
+                self._write_cold_many(cold)
+            self._commit()
+            self.metrics.observe("put_many", time.perf_counter() - start)
+            self.metrics.incr("keys_written", len(items))
+            logging.debug("Put %d keys", len(items))
+            return len(items)
+        except Exception as e:
+            raise StorageError(f"Failed to put batch of {len(items)} keys: {e}")
+
+    def get(self, key, as_version=None, as_of=None):
+        """
+        Args:
+            as_version (int, optional): Upgrade/downgrade the value to this schema version on read.
+            as_of (int, optional): Read the value the key had at this MVCC version
+                (microseconds since the epoch) instead of the latest one.
+        """
+        start = time.perf_counter()
+        value = self._lookup(key, as_of)
+        self.metrics.observe("get", time.perf_counter() - start)
+        if value is not None and as_version is not None:
+            return schemas.convert(value, as_version)
+        return value
 
+    def _lookup(self, key, as_of=None):
+        """
+        Filter Bloom, lalu hot, data.bin dan segmen; tiap jawaban dihitung sebagai hot/cold/segment hit
+        atau miss. Key yang ditolak filter data.bin dan semua filter segmen langsung dijawab None.
+        """
+        if as_of is not None:
+            value = self._get_as_of(key, as_of)
+            self.metrics.incr("as_of_hits" if value is not None else "misses")
+            return value
+        # Hash key dihitung sekali untuk filter data.bin dan semua filter segmen
+        hashes = BloomFilter.key_hashes(key)
+        in_log = self.bloom.contains_hashes(hashes)
+        if not in_log:
+            # Segmen dibaca sesudah filter: flush_segment memasang segmen baru sebelum filter dibangun ulang
+            segments = self.segments
+            for segment in segments:
+                if segment.bloom.contains_hashes(hashes):
+                    break
+            else:
+                self.metrics.incr("bloom_negatives", 1 + len(segments))
+                self.metrics.incr("misses")
+                return None
+        value = self.hot.get(key)
+        if value is not None:
+            self.metrics.incr("hot_hits")
+            return value
+        entry = None
+        if not in_log:
+            self.metrics.incr("bloom_negatives")
+        else:
+            with self._lock.read():
+                entry = self.index.get(key)
+                if entry is None:
+                    if key in self.history:
+                        # Dihapus di data.bin, tombstone menutupi segmen
+                        self.metrics.incr("misses")
+                        return None
+                    self.metrics.incr("bloom_false_positives")
+                else:
+                    record = self._read_entry(entry)
+        if entry is not None:
+            _, value, _, _ = Encoder.decode(record, self.dictionaries)
+            self.metrics.incr("cold_hits")
+        else:
+            value = self._segment_value(key)
+            if value is None:
+                self.metrics.incr("misses")
+                return None
+            self.metrics.incr("segment_hits")
+        self._promote(key, value, entry)
+        return value
+
+    def _get_as_of(self, key, as_of):
+        """Nilai dengan versi terbesar <= as_of; None jika key belum ada atau sudah dihapus saat itu."""
+        with self._lock.read():
+            version = self._hot_versions.get(key)
+            if version is not None and version <= as_of and key in self.hot:
+                return self.hot[key]
+            entry = None
+            if key in self.bloom:
+                entry = self.index.get(key)
+                if entry is None or entry[2] > as_of:
+                    entry = None
+                    for old in reversed(self.history.get(key, ())):
+                        if old[2] <= as_of:
+                            entry = old
+                            break
+            if entry is not None:
+                if entry[0] is None:
+                    return None
+                record = self._read_entry(entry)
+        if entry is None:
+            # Tidak ada versi <= as_of di data.bin: cari di segmen
+            return self._segment_value(key, as_of)
+        return Encoder.decode(record, self.dictionaries)[1]
+
+    def _promote(self, key, value, entry):
+        """Masukkan hasil baca cold ke hot, dilewati jika ada penulis aktif agar pembaca tidak menunggu."""
+        self._promote_many([(key, value, entry)])
+
+    def _promote_many(self, items):
+        """_promote untuk banyak (key, value, entry) dengan satu kali ambil write lock."""
+        if not items or not self._lock.acquire_write(blocking=False):
+            return
+        try:
+            spilled = []
+            for key, value, entry in items:
+                # Jangan promosikan nilai basi jika key ditulis ulang sejak dibaca
+                if key not in self.hot and self.index.get(key) == entry and (entry is not None or key not in self.history):
+                    spilled.extend(self._spill(self.hot.put(key, value, dirty=False)))
+            self._write_cold_many(spilled)
+        finally:
+            self._lock.release_write()
+
+    def get_many(self, keys):
+        """
+        Return {key: value} for the keys found in this replica.
+
+        Like get() per key, but the batch is resolved in one pass: the Bloom
+        filters drop absent keys, hot hits come from one hot-tier call, and
+        the remaining keys are looked up under a single read lock with their
+        data.bin records read in offset order. Decoding, segment reads and
+        promotion happen after the lock is released, and metrics are
+        updated once per batch.
+        """
+        start = time.perf_counter()
+        bloom = self.bloom
+        segments = self.segments
+        keys = list(dict.fromkeys(keys))
+        candidates = []
+        negatives = 0
+        for key in keys:
+            hashes = BloomFilter.key_hashes(key)
+            in_log = bloom.contains_hashes(hashes)
+            if in_log or any(segment.bloom.contains_hashes(hashes) for segment in segments):
+                candidates.append((key, in_log))
+            else:
+                negatives += 1 + len(segments)
+        misses = len(keys) - len(candidates)
+        result = self.hot.get_many([key for key, _ in candidates])
+        hot_hits = len(result)
+        false_positives = 0
+        cold = []
+        segment_keys = []
+        with self._lock.read():
+            for key, in_log in candidates:
+                if key in result:
+                    continue
+                if not in_log:
+                    negatives += 1
+                    segment_keys.append(key)
+                    continue
+                entry = self.index.get(key)
+                if entry is not None:
+                    cold.append((entry, key))
+                elif key in self.history:
+                    # Dihapus di data.bin, tombstone menutupi segmen
+                    misses += 1
+                else:
+                    false_positives += 1
+                    segment_keys.append(key)
+            # Urut offset: record dibaca berurutan dari mmap
+            cold.sort(key=lambda item: item[0][0])
+            records = self._read_entries([entry for entry, _ in cold])
+        promote = []
+        for (entry, key), record in zip(cold, records):
+            value = Encoder.decode(record, self.dictionaries)[1]
+            result[key] = value
+            promote.append((key, value, entry))
+        segment_hits = 0
+        for key in segment_keys:
+            value = self._segment_value(key)
+            if value is None:
+                misses += 1
+                continue
+            result[key] = value
+            segment_hits += 1
+            promote.append((key, value, None))
+        self._promote_many(promote)
+        for name, amount in (("hot_hits", hot_hits), ("cold_hits", len(cold)), ("segment_hits", segment_hits),
+                             ("misses", misses), ("bloom_negatives", negatives),
+                             ("bloom_false_positives", false_positives)):
+            if amount:
+                self.metrics.incr(name, amount)
+        self.metrics.observe("get_many", time.perf_counter() - start)
+        return result
+
+    def keys(self):
+        """Semua key aktif (hot, data.bin & segmen)."""
+        return set(self.scan_keys())
+
+    def contains(self, key):
+        """True jika key punya nilai hidup di tier mana pun."""
+        # Di bawah read lock seperti _lookup: LogIndex membaca key dari mmap index.bin,
+        # yang bisa sedang ditukar oleh compaction
+        with self._lock.read():
+            if key in self.hot or key in self.index:
+                return True
+            if key in self.history:
+                return False
+        return self._segment_live(key)
+
+    def scan_keys(self, start=None, end=None, limit=None, include_deleted=False, page_size=256):
+        """
+        Sorted keys with start <= key < end, at most `limit`; include_deleted
+        adds keys that only have history or tombstones.
+
+        Keys of data.bin/hot and of every segment are merged a page at a time,
+        so the read lock is only held while a page of in-memory keys is taken.
+        """
+        keys = []
+        while limit is None or len(keys) < limit:
+            with self._lock.read():
+                log_keys = self.ordered.range(start, end, page_size)
+            streams = [log_keys] + [islice(segment.iter_keys(start, end), page_size) for segment in self.segments]
+            page = []
+            for key in heapq.merge(*streams):
+                if not page or page[-1] != key:
+                    page.append(key)
+                    if len(page) == page_size:
+                        break
+            for key in page:
+                if include_deleted or self.contains(key):
+                    keys.append(key)
+                    if len(keys) == limit:
+                        return keys
+            if len(page) < page_size:
+                return keys
+            # Lanjut setelah key terakhir halaman ini
+            start = page[-1] + "\0"
+        return keys
+
+    def scan(self, start=None, end=None, limit=None, page_size=256, as_of=None):
+        """
+        Stream (key, value) pairs with start <= key < end in key order.
+
+        Keys are fetched a page at a time under the read lock, so the
+        iterator never holds the lock while the caller consumes it. With
+        `as_of`, values are read at that MVCC version.
+        """
+        remaining = limit
+        while remaining is None or remaining > 0:
+            page = self.scan_keys(start, end, page_size if remaining is None else min(page_size, remaining),
+                                  include_deleted=as_of is not None)
+            if not page:
+                return
+            for key in page:
+                value = self.get(key, as_of=as_of)
+                if value is not None:
+                    yield key, value
+                    if remaining is not None:
+                        remaining -= 1
+            # Lanjut setelah key terakhir halaman ini
+            start = page[-1] + "\0"
+
+    def scan_prefix(self, prefix, limit=None, as_of=None):
+        return self.scan(prefix, prefix_end(prefix), limit, as_of=as_of)
+
+    def current_version(self):
+        """Versi MVCC terakhir yang dialokasikan atau diterapkan di storage ini."""
+        return self._last_version
+
+    def snapshot(self, start=None, end=None, as_of=None):
+        """
+        Point-in-time iterator over (key, value) pairs, pinned to `as_of`
+        (default: the current version) so writes made while iterating are
+        not seen. Versions pruned by max_versions/retention meanwhile are
+        skipped.
+        """
+        return self.scan(start, end, as_of=as_of if as_of is not None else self._last_version)
+
+    def versions(self, key):
+        """[(version, value)] of `key` oldest first, latest last; a delete shows as (version, None)."""
+        with self._lock.read():
+            entries = list(self.history.get(key, ()))
+            if key in self.index:
+                entries.append(self.index[key])
+            records = [(entry[2], self._read_entry(entry) if entry[0] is not None else None) for entry in entries]
+            hot_version = self._hot_versions.get(key)
+            hot = (hot_version, self.hot[key]) if hot_version is not None and key in self.hot else None
+        records = self._segment_records(key) + records
+        result = [(version, Encoder.decode(record, self.dictionaries)[1] if record is not None else None)
+                  for version, record in records]
+        if hot is not None:
+            result.append(hot)
+        return result
+
+    def export_versions(self, key):
+        """Versi hidup `key` sebagai item load_cold (key, value, schema_version, extra_field, version), terlama dulu."""
+        with self._lock.read():
+            entries = [entry for entry in self.history.get(key, ()) if entry[0] is not None]
+            if key in self.index:
+                entries.append(self.index[key])
+            records = [(entry[2], self._read_entry(entry)) for entry in entries]
+            hot_version = self._hot_versions.get(key)
+            hot = self.hot[key] if hot_version is not None and key in self.hot else None
+        records = [(version, record) for version, record in self._segment_records(key) if record is not None] + records
+        items = []
+        for version, record in records:
+            _, value, schema_version, extra_field = Encoder.decode(record, self.dictionaries)
+            items.append((key, value, schema_version, extra_field, version))
+        if hot is not None:
+            items.append((key, hot, 1, None, hot_version))
+        return items
+
+    def _segment_records(self, key):
+        """[(version, record|None)] of `key` in segments, oldest first, older than anything in data.bin."""
+        if not self.segments:
+            return []
+        with self._lock.read():
+            chain = list(self.history.get(key, ()))
+            if key in self.index:
+                chain.append(self.index[key])
+        floor = chain[0][2] if chain else float("inf")
+        found = {}
+        # Segmen terbaru dulu: versi yang sama di segmen lebih lama diabaikan
+        for segment in self.segments:
+            for kind, version, record in segment.entries(key):
+                if version < floor:
+                    found.setdefault(version, record if kind == KIND_VALUE else None)
+        return sorted(found.items(), key=lambda item: item[0])
+
+    def key_state(self, key):
+        """(version, deleted) of the newest state of `key` across tiers, or None if it never existed."""
+        with self._lock.read():
+            version = self._hot_versions.get(key)
+            if version is not None and key in self.hot:
+                return version, False
+            entry = self.index.get(key)
+            if entry is not None:
+                return entry[2], False
+            chain = self.history.get(key)
+            if chain:
+                # Tanpa entry index, rantai histori selalu diakhiri tombstone
+                return chain[-1][2], True
+        found = self._segment_lookup(key) if self.segments else None
+        if found is None:
+            return None
+        return found[1], found[0] == KIND_TOMBSTONE
+
+    def latest_versions(self, key_filter=None):
+        """
+        {key: version} of every live key, taken from in-memory metadata and
+        segment entry headers only (values are never decoded).
+
+        Args:
+            key_filter (callable, optional): Only keys for which it returns True.
+        """
+        keep = key_filter or (lambda key: True)
+        with self._lock.read():
+            # None = terhapus; tier yang lebih baru menutupi yang lebih lama
+            state = {key: None for key in self.history if key not in self.index and keep(key)}
+            state.update((key, entry[2]) for key, entry in self.index.items() if keep(key))
+            state.update((key, version) for key, version in self._hot_versions.items()
+                         if key in self.hot and keep(key))
+            segments = self.segments
+        for segment in segments:
+            for key, kind, version in segment.iter_latest():
+                if key not in state and keep(key):
+                    state[key] = version if kind == KIND_VALUE else None
+        return {key: version for key, version in state.items() if version is not None}
+
+    def load_cold(self, items):
+        """Tulis record (key, value, schema_version, extra_field[, version]) langsung ke cold, mis. saat rebalance."""
+        self._write_cold_many(items)
+        self._commit()
+        return len(items)
+
+    def get_raw(self, key):
+        value = self.hot.get(key)
+        if value is not None:
+            return key, value, 1, None
+        with self._lock.read():
+            entry = self.index.get(key)
+            if entry is None:
+                if key in self.history:
+                    return None
+                found = self._segment_lookup(key)
+                if found is None or found[0] == KIND_TOMBSTONE:
+                    return None
+                record = found[2]
+            else:
+                record = self._read_entry(entry)
+        return Encoder.decode(record, self.dictionaries)
+
+    def get_all_versions(self, key):
+        """{'latest': nilai sekarang, version: nilai lama, ...}; delete tercatat sebagai None."""
+        versions = self.versions(key)
+        result = {}
+        if versions and self.contains(key):
+            result['latest'] = versions.pop()[1]
+        result.update(versions)
         return result
 
     def clean_old_versions(self, key, max_versions=5):
-        prefix = f"{key}::hist"
-        versions = [k for k in self.index if k.startswith(prefix)]
-        if len(versions) > max_versions:
-            versions.sort()
-            to_remove = versions[:-max_versions]
-            for old in to_remove:
-                if old in self.index:
-                    del self.index[old]
-            self._save_index()
-            logging.info(f"Cleaned {len(to_remove)} old versions of '{key}'")
+        with self._lock.write():
+            removed = self._trim_history(key, max_versions)
+            if removed:
+                self._append_log([(_LOG_PRUNE, key, 0, max_versions)])
+        if removed:
+            logging.info(f"Cleaned {removed} old versions of '{key}'")
+            self._maybe_compact()
+        return removed
+
+    def _prune_expired(self, retention_seconds=None):
+        if retention_seconds is None:
+            retention_seconds = self.retention_seconds
+        if retention_seconds is None:
+            return 0
+        cutoff = time.time_ns() // 1000 - int(retention_seconds * 1_000_000)
+        return sum(self._trim_history(key, cutoff=cutoff) for key in list(self.history))
+
+    def prune_versions(self, retention_seconds=None):
+        """
+        Drop versions superseded more than `retention_seconds` ago (default: the
+        storage's retention_seconds) and checkpoint the index. Their bytes become
+        garbage, so the next compaction reclaims them.
+
+        Returns:
+            int: Number of versions dropped.
+        """
+        with self._lock.write():
+            dropped = self._prune_expired(retention_seconds)
+            if dropped:
+                self._save_index()
+        if dropped:
+            logging.info(f"Pruned {dropped} expired versions from {self.cold_path}")
+            self._maybe_compact()
+        return dropped
+
+    def delete(self, key, version=None):
+        """Delete `key` at MVCC `version` (default: a fresh one); older versions stay readable via as_of."""
+        with self._lock.write():
+            self.hot.pop(key, None)
+            self._hot_versions.pop(key, None)
+            version = version if version is not None else self._next_version()
+            if not self._drop_entry(key, version):
+                return False
+            self._append_log([(_LOG_DEL, key, version, 0)])
+        self._commit()
+        self._maybe_compact()
+        return True
+
+    def delete_many(self, keys, version=None):
+        deleted = 0
+        with self._lock.write():
+            entries = []
+            version = version if version is not None else self._next_version()
+            for key in keys:
+                self.hot.pop(key, None)
+                self._hot_versions.pop(key, None)
+                if self._drop_entry(key, version):
+                    entries.append((_LOG_DEL, key, version, 0))
+                    deleted += 1
+            if entries:
+                self._append_log(entries)
+        self._commit()
+        self._maybe_compact()
+        return deleted
+
+    def purge_many(self, keys):
+        """Hapus key beserta seluruh rantai versinya, mis. setelah dipindah ke shard lain."""
+        with self._lock.write():
+            entries = []
+            for key in keys:
+                self.hot.pop(key, None)
+                self._hot_versions.pop(key, None)
+                if key in self.index or key in self.history:
+                    entries.append((_LOG_DEL, key, 0, 0))
+                self._drop_entry(key)
+                if self._segment_live(key):
+                    # Segmen immutable: key yang masih ada di sana ditutup tombstone
+                    version = self._next_version()
+                    self._drop_entry(key, version)
+                    entries.append((_LOG_DEL, key, version, 0))
+            if entries:
+                self._append_log(entries)
+        self._commit()
+        self._maybe_compact()
+        return len(entries)
+
+    def clear(self):
+        with self._lock.write():
+            with self._mmap_lock:
+                self._close_mmap()
+            self._close_handles()
+            self.hot.clear()
+            self.index.clear()
+            self.history.clear()
+            self._hot_versions.clear()
+            self._ordered = OrderedKeys()
+            self.live_bytes = 0
+            self._data_end = 0
+            self.bloom = BloomFilter(bits_per_key=self.bloom_bits_per_key)
+            for path in (self.cold_file, self.index_file, self.log_file, self.bloom_file):
+                if os.path.exists(path):
+                    os.remove(path)
+            self._log_entries = 0
+            for segment in self.segments:
+                segment.close()
+                os.remove(segment.path)
+            self.segments = ()
+            if os.path.exists(self.manifest_file):
+                os.remove(self.manifest_file)
+
+    def hot_stats(self):
+        return self.hot.stats()
+
+    def stats(self):
+        """
+        Machine-readable snapshot of this replica: operation counters and
+        latency histograms plus hot tier, cold file and Bloom filter gauges.
+        """
+        snapshot = self.metrics.snapshot()
+        hot = self.hot.stats()
+        snapshot["counters"] = dict(sorted(dict(snapshot["counters"], hot_evictions=hot["evictions"]).items()))
+        snapshot["gauges"] = {
+            "hot_keys": hot["entries"],
+            "hot_bytes": hot["bytes"],
+            "cold_keys": len(self.index),
+            "cold_file_bytes": self._data_end,
+            "garbage_ratio": self.garbage_ratio(),
+            "segments": len(self.segments),
+        }
+        return snapshot
 
     def day_change(self):
-        flushed = 0
-        for key in list(self.hot.keys()):
-            value = self.hot.pop(key)
-            self._write_cold(key, value)
-            flushed += 1
+        with self._lock.write():
+            flushed = len(self.hot)
+            items = [(key, value, 1, None, self._hot_versions.pop(key, None))
+                     for key, value in self.hot.items() if self.hot.is_dirty(key)]
+            self.hot.clear()
+            self._write_cold_many(items)
+        self._commit()
+        self.flush_segment()
         return flushed
@@ -1,12 +1,11 @@
-import os
 import json
 import logging
 import binascii
-import struct
-import zlib
+from datetime import datetime
 from core.shard_manager import ShardManager
 from core.schemas import schemas
-from core.encoder import Encoder
+from core.encoder import Encoder, EncoderError, CODECS, CODEC_FLAG, SCHEMA_VALUE_FLAG, codec_by_id
+from core.read_policy import READ_POLICIES, CONSISTENCY_LEVELS
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
@@ -25,22 +24,44 @@ def parse_value(s):
 def format_value(value):
     return json.dumps(value, indent=2)
 
+def format_version(version):
+    """Versi MVCC (mikrodetik epoch) sebagai waktu lokal."""
+    if not isinstance(version, int) or version <= 0:
+        return str(version)
+    return datetime.fromtimestamp(version / 1e6).strftime("%Y-%m-%d %H:%M:%S.%f")
+
+def parse_version(s):
+    """Terima versi mentah (mikrodetik epoch) atau waktu 'YYYY-MM-DD HH:MM[:SS]'."""
+    s = s.strip()
+    if s.isdigit():
+        return int(s)
+    return int(datetime.fromisoformat(s).timestamp() * 1e6)
+
 def display_help():
     print("""
 === Perintah ===
 put              : Simpan key-value.
 get              : Ambil nilai berdasarkan key.
 get_all          : Tampilkan semua versi histori dari key tertentu.
+get_as_of        : Ambil nilai key pada waktu/versi tertentu.
 list_all         : Tampilkan semua key dan value dari hot & cold storage.
 check_key        : Cek lokasi dan keberadaan key.
-check_consistency: Periksa konsistensi data antar replika.
+check_consistency: Periksa konsistensi data antar replika (satu key, atau `all` untuk semua shard via Merkle tree).
+repair           : Perbaiki key yang berbeda antar replika (versi MVCC terbaru menang).
 list_partitions  : Tampilkan jumlah data di tiap shard dan replica.
 which_shard      : Tampilkan shard tempat key disimpan.
+scan             : Tampilkan key terurut berdasarkan prefix atau rentang (gabungan semua shard).
+add_shard        : Tambah shard baru ke hash ring (rebalance online).
+remove_shard     : Keluarkan shard dari hash ring, datanya dipindah.
 change_data      : Ubah data versi tertentu (ubah tipe/hapus kolom).
 show_schema      : Tampilkan semua versi skema yang didukung.
-perf             : Evaluasi performa (latency & throughput + fault tolerance).
+perf             : Benchmark singkat bergaya YCSB (workload c, b, a; p50/p99/p999 + throughput).
 clear            : Hapus semua data atau berdasarkan key.
 day_change       : Pindahkan semua data hot ke cold.
+compact          : Tulis ulang data cold, buang record usang dari data.bin.
+set_codec        : Pilih codec value (raw/zlib/lz4/zstd/zstd-dict) untuk write baru per shard.
+read_policy      : Pilih policy baca replika & consistency, tampilkan latency baca per replika.
+stats            : Tampilkan metrik (hit/miss, byte cold, latency, lag replikasi per shard), teks atau JSON.
 test_schema      : Uji simulasi evolusi skema (tambah/hapus kolom).
 show_encoding    : Tampilkan format biner dan encoding hex untuk key tertentu.
 help             : Panduan ini.
@@ -48,6 +69,43 @@ exit             : Keluar.
 ================
 """)
 
+def print_anti_entropy(report):
+    total = 0
+    for sid, res in report.items():
+        total += len(res["divergent"])
+        line = f"Shard {sid}: {len(res['divergent'])} key berbeda di {res['leaves']} rentang hash"
+        if res["repaired"]:
+            line += f", {res['repaired']} perbaikan diterapkan"
+        print(line)
+        for key in res["divergent"][:20]:
+            print(f"  {key}")
+    print("✓ Semua replika konsisten" if total == 0 else f"✗ {total} key tidak konsisten")
+
+def format_latency(name, lat):
+    return (f"  {name:<18} n={lat['count']:<8} p50 {lat['p50_ms']:.3f} ms, p99 {lat['p99_ms']:.3f} ms, "
+            f"max {lat['max_ms']:.3f} ms")
+
+def print_stats(stats):
+    counters = stats["totals"]["counters"]
+    reads = sum(counters.get(name, 0) for name in ("hot_hits", "cold_hits", "segment_hits", "as_of_hits", "misses"))
+    print(f"Uptime {stats['uptime_seconds']:.0f} s, total semua replika:")
+    for name, value in counters.items():
+        print(f"  {name:<26} {value}")
+    if reads:
+        print(f"  {'hot hit ratio':<26} {counters.get('hot_hits', 0) / reads:.3f}")
+    for name, lat in stats["totals"]["latency"].items():
+        print(format_latency(name, lat))
+    for sid, shard in stats["shards"].items():
+        if not shard["opened"]:
+            print(f"Shard {sid}: belum dibuka"); continue
+        lag = shard["replication"]
+        ops = shard["ops"]
+        print(f"Shard {sid}: {ops['counters'].get('keys_written', 0)} key ditulis, "
+              f"{ops['counters'].get('keys_read', 0)} key dibaca ({ops['counters'].get('misses', 0)} miss), "
+              f"lag replikasi {lag['depth']} write ({lag['oldest_pending_age']:.2f} s)")
+        for name, lat in ops["latency"].items():
+            print(format_latency(name, lat))
+
 def main():
     store = ShardManager(num_shards=2, replica_count=2)
     display_help()
@@ -84,13 +142,6 @@ def main():
             value = {"name": name, "age": age}
             value.update(extra_fields)
 
-            sid = store._get_shard_id(key)
-            for replica in store.shards[sid]:
-                if key in replica.hot:
-                    old_value = replica.hot[key]
-                    hist_key = f"{key}::hist"
-                    replica._write_cold(hist_key, old_value, schema_version=version, extra_field=None)
-
             store.put(key, value, write_to_cold=False, schema_version=version, extra_field=None)
             print(f"✓ Data '{key}' disimpan")
 
@@ -101,6 +152,18 @@ def main():
             v = store.get(key)
             print(f"✓ Value:\n{format_value(v)}" if v else f"✗ '{key}' tidak ditemukan")
 
+        elif cmd == "get_as_of":
+            key = input("Key: ").strip()
+            if not is_valid_key(key):
+                print("✗ Key tidak valid"); continue
+            try:
+                as_of = parse_version(input("Waktu (YYYY-MM-DD HH:MM:SS) atau versi: "))
+            except ValueError:
+                print("✗ Waktu tidak valid"); continue
+            v = store.get(key, as_of=as_of)
+            print(f"✓ Value per {format_version(as_of)}:\n{format_value(v)}" if v
+                  else f"✗ '{key}' belum ada atau sudah dihapus pada waktu itu")
+
         elif cmd == "get_all":
             key = input("Key: ").strip()
             if not is_valid_key(key): continue
@@ -110,23 +173,20 @@ def main():
                 print("Versi terbaru:\n", format_value(res.get("latest", {})))
                 print("Histori:")
                 for k, v in res.items():
-                    if k != "latest": print(f"{k} → {json.dumps(v)}")
+                    if k != "latest": print(f"{format_version(k)} → {json.dumps(v) if v is not None else '(dihapus)'}")
 
         elif cmd == "change_data":
             key = input("Key: ").strip()
             sid = store._get_shard_id(key)
             replica = store.shards[sid][0]
 
-            versions = replica.get_all_versions(key)
-            if key in replica.hot:
-                versions['HOT'] = replica.hot[key]
-
+            versions = {k: v for k, v in replica.get_all_versions(key).items() if v is not None}
             if not versions:
                 print("✗ Tidak ditemukan versi manapun"); continue
 
             all_keys = list(versions.keys())
             for i, k in enumerate(all_keys):
-                print(f"{i+1}. {k}: {json.dumps(versions[k], indent=2)}")
+                print(f"{i+1}. {format_version(k)}: {json.dumps(versions[k], indent=2)}")
 
             try:
                 idx = int(input("Pilih versi (nomor): ").strip()) - 1
@@ -160,47 +220,136 @@ def main():
             key = input("Key: ").strip()
             sid = store._get_shard_id(key)
             hot = any(key in r.hot for r in store.shards[sid])
-            cold = any(key in r.index for r in store.shards[sid])
-            hist = [k for k in store.shards[sid][0].index if k.startswith(f"{key}::")]
+            cold = any(key in r.index or (key not in r.history and r._segment_live(key)) for r in store.shards[sid])
+            hist = store.shards[sid][0].versions(key)[:-1] if hot or cold else store.shards[sid][0].versions(key)
             print(f"Key:{key},Shard:{sid},HOT:{hot},COLD:{cold},Histori:{len(hist)}")
-            if hist: print("  " + "\n  ".join(hist))
+            for version, v in hist:
+                print(f"  {format_version(version)}" + (" (dihapus)" if v is None else ""))
+
+        elif cmd == "scan":
+            prefix = input("Prefix (kosong = rentang): ").strip()
+            limit = input("Limit (kosong = 20): ").strip()
+            limit = int(limit) if limit.isdigit() else 20
+            if prefix:
+                rows = store.scan_prefix(prefix, limit)
+            else:
+                start = input("Dari key (kosong = awal): ").strip() or None
+                end = input("Sampai sebelum key (kosong = akhir): ").strip() or None
+                rows = store.scan(start, end, limit)
+            count = 0
+            for k, v in rows:
+                print(f"  {k}: {json.dumps(v)}")
+                count += 1
+            print(f"✓ {count} key")
 
         elif cmd == "check_consistency":
-            key = input("Key: ").strip()
+            key = input("Key (all = semua shard): ").strip()
+            if key.lower() == "all":
+                print_anti_entropy(store.anti_entropy())
+                continue
             ok = store.check_replica_consistency(key)
             print("✓ Konsisten" if ok else "✗ Tidak konsisten")
 
+        elif cmd in ("check_consistency all", "repair"):
+            print_anti_entropy(store.anti_entropy(repair=cmd == "repair"))
+
         elif cmd == "which_shard":
             key = input("Key: ").strip()
             sid = store._get_shard_id(key)
             print(f"✓ Key '{key}' masuk ke shard {sid}")
 
+        elif cmd == "add_shard":
+            sid, moved = store.add_shard()
+            print(f"✓ Shard {sid} ditambahkan, {moved} record dipindah")
+
+        elif cmd == "remove_shard":
+            try:
+                sid = int(input("Shard id: ").strip())
+                moved = store.remove_shard(sid)
+            except ValueError as e:
+                print(f"✗ {e}"); continue
+            print(f"✓ Shard {sid} dihapus, {moved} record dipindah")
+
         elif cmd == "list_all":
             print("=== Data di HOT storage ===")
-            for i, shard in enumerate(store.shards):
+            for i, shard in store.shards.items():
                 for j, replica in enumerate(shard):
                     print(f"[Shard {i} Replica {j}]")
                     for k, v in replica.hot.items():
                         print(f"  {k}: {v}")
             print("\n=== Data di COLD storage (index) ===")
-            for i, shard in enumerate(store.shards):
+            for i, shard in store.shards.items():
                 for j, replica in enumerate(shard):
                     print(f"[Shard {i} Replica {j}]")
-                    for k, v in replica.index.items():
-                        if "::" not in k:
-                            print(f"  {k}: {v}")
+                    for k, (offset, length, version) in replica.index.items():
+                        print(f"  {k}: offset={offset}, len={length}, versi={format_version(version)}")
 
         elif cmd == "list_partitions":
-            for i, shard in enumerate(store.shards):
+            for i, shard in store.shards.items():
                 for j, replica in enumerate(shard):
                     h, c = len(replica.hot), len(replica.index)
-                    print(f"Shard {i} Replica {j}: HOT={h}, COLD={c}")
+                    st = replica.hot_stats()
+                    bl = replica.bloom_stats()
+                    sg = replica.segment_stats()
+                    rd = store.read_stats()[i][j]
+                    print(f"Shard {i} Replica {j}: HOT={h} ({st['bytes']}/{st['budget_bytes']} byte), COLD={c}, "
+                          f"segmen={sg['segments']} ({sg['entries']} entry, {sg['bytes']} byte), "
+                          f"hit={st['hits']}, miss={st['misses']}, evict={st['evictions']}, "
+                          f"bloom={bl['memory_bytes']} byte (FPR {bl['measured_fpr']:.4f}/{bl['expected_fpr']:.4f}), "
+                          f"baca={rd['count']}" + (f" (p50 {rd['p50_ms']:.3f} ms, p99 {rd['p99_ms']:.3f} ms)" if rd['count'] else ""))
 
         elif cmd == "day_change":
             res = store.day_change()
             total = sum(sum(v) for v in res.values())
             print(f"✓ Day change: {total} data dipindah")
 
+        elif cmd == "compact":
+            res = store.compact()
+            total = 0
+            for sid, stats in res.items():
+                for rid, st in enumerate(stats):
+                    if st is None:
+                        print(f"Shard {sid} Replica {rid}: dilewati"); continue
+                    total += st["reclaimed_bytes"]
+                    print(f"Shard {sid} Replica {rid}: {st['reclaimed_bytes']} byte dibebaskan, "
+                          f"pause {st['pause_ms']:.2f} ms, {st['live_records']} record hidup")
+            print(f"✓ Compaction selesai: {total} byte dibebaskan")
+
+        elif cmd == "set_codec":
+            codec = input(f"Codec ({', '.join(CODECS)}): ").strip()
+            raw = input("Shard id (kosong = semua): ").strip()
+            try:
+                res = store.set_codec(codec, [int(raw)] if raw else None)
+            except (ValueError, KeyError, EncoderError) as e:
+                print(f"✗ {e}"); continue
+            for sid, dict_id in res.items():
+                print(f"✓ Shard {sid}: codec {codec}" + (f", dictionary {dict_id}" if dict_id else ""))
+
+        elif cmd == "read_policy":
+            print(f"Sekarang: policy={store.read_policy}, consistency={store.consistency}, "
+                  f"hedge={store.hedge_after_ms if store.hedge_after_ms is not None else 'p95'} ms")
+            policy = input(f"Policy ({', '.join(READ_POLICIES)}, kosong = tetap): ").strip() or None
+            consistency = input(f"Consistency ({', '.join(CONSISTENCY_LEVELS)}, kosong = tetap): ").strip() or None
+            raw = input("Ambang hedge ms (kosong = p95 latency): ").strip()
+            try:
+                store.set_read_policy(policy, consistency, float(raw) if raw else None)
+            except ValueError as e:
+                print(f"✗ {e}"); continue
+            for sid, loads in store.read_stats().items():
+                for rid, rd in enumerate(loads):
+                    if rd["count"]:
+                        print(f"Shard {sid} Replica {rid}: {rd['count']} baca, mean {rd['mean_ms']:.3f} ms, "
+                              f"p50 {rd['p50_ms']:.3f} ms, p95 {rd['p95_ms']:.3f} ms, p99 {rd['p99_ms']:.3f} ms")
+            print(f"✓ policy={store.read_policy}, consistency={store.consistency}")
+
+        elif cmd == "stats":
+            fmt = input("Format (teks/json, kosong = teks): ").strip().lower()
+            stats = store.stats()
+            if fmt == "json":
+                print(json.dumps(stats, indent=2))
+            else:
+                print_stats(stats)
+
         elif cmd == "perf":
             from core.measure import measure_performance
             measure_performance(store)
@@ -219,18 +368,14 @@ def main():
         elif cmd == "clear":
             sub = input("all atau key? ").strip()
             if sub == "all":
-                for shard in store.shards:
+                for shard in store.shards.values():
                     for r in shard:
-                        r.hot.clear()
-                        if os.path.exists(r.cold_file): os.remove(r.cold_file)
-                        idx = os.path.join(r.cold_path, "index.bin")
-                        if os.path.exists(idx): os.remove(idx)
+                        r.clear()
                 print("✓ Semua data dihapus")
             else:
                 key = sub
                 sid = store._get_shard_id(key)
-                for r in store.shards[sid]:
-                    r.hot.pop(key, None); r.index.pop(key, None)
+                store.delete_many([key])
                 print(f"✓ '{key}' dihapus dari shard {sid}")
 
         elif cmd == "show_schema":
@@ -245,24 +390,35 @@ def main():
             sid = store._get_shard_id(key)
             for replica in store.shards[sid]:
                 if key in replica.index:
-                    with open(replica.cold_file, "rb") as f:
-                        f.seek(replica.index[key])
-                        data = f.read(100)
-                        hex_output = binascii.hexlify(data).decode("utf-8")
-                        print(f"✓ Format Biner (Schema v1): [schema:1B][key_len:4B][value_len:4B][key][value_compressed]")
-                        print(f"✓ Output Encoding (hex): {hex_output}")
-                        key_len = struct.unpack('!I', data[1:5])[0]
-                        value_len = struct.unpack('!I', data[5:9])[0]
-                        print(f"✓ Penjelasan: 01 (schema v1), {key_len} (key_len), {value_len} (value_len), diikuti key dan value terkompresi")
-                        break
+                    data = bytes(replica._read_record(key))
+                    label = "hex"
                 elif key in replica.hot:
-                    value = replica.hot[key]
-                    encoded = Encoder.encode(key, value)
-                    hex_output = binascii.hexlify(encoded).decode("utf-8")
+                    data = Encoder.encode(key, replica.hot[key])
+                    label = "simulasi hex"
+                elif key not in replica.history and replica._segment_live(key):
+                    data = bytes(replica._segment_lookup(key)[2])
+                    label = "hex (segmen)"
+                else:
+                    continue
+                version, checksummed, header_len, key_len, value_len, extra_len, codec_id, mvcc = Encoder.parse_header(data)
+                codec = codec_by_id(codec_id)
+                if checksummed and data[0] & CODEC_FLAG:
+                    serialization = "biner per skema" if data[0] & SCHEMA_VALUE_FLAG else "JSON"
+                    print(f"✓ Format Biner (Schema v{version}, CRC, codec {codec.name if codec else codec_id}, value {serialization}): "
+                          f"[{data[0] & 0xF0:#04x}|schema:1B][crc32:4B][codec:1B]" + ("[version:8B]" if mvcc is not None else "")
+                          + "[key_len:4B][value_len:4B][extra_len:4B][key][value][extra]")
+                    if mvcc is not None:
+                        print(f"✓ Versi MVCC: {mvcc} ({format_version(mvcc)})")
+                elif checksummed:
+                    print(f"✓ Format Biner (Schema v{version}, CRC): [0x80|schema:1B][crc32:4B][key_len:4B][value_len:4B][extra_len:4B][key][value_compressed][extra]")
+                elif version == 1:
                     print(f"✓ Format Biner (Schema v1): [schema:1B][key_len:4B][value_len:4B][key][value_compressed]")
-                    print(f"✓ Output Encoding (simulasi hex): {hex_output}")
-                    print(f"✓ Penjelasan: 01 (schema v1), {len(key.encode('utf-8'))} (key_len), {len(zlib.compress(json.dumps(value).encode('utf-8')))} (value_len), diikuti key dan value terkompresi")
-                    break
+                else:
+                    print(f"✓ Format Biner (Schema v{version}): [schema:1B][key_len:4B][value_len:4B][extra_len:4B][key][value_compressed][extra]")
+                print(f"✓ Output Encoding ({label}): {binascii.hexlify(data[:100]).decode('utf-8')}")
+                print(f"✓ Penjelasan: {data[0]:02x} (schema v{version}), {key_len} (key_len), {value_len} (value_len), "
+                      f"{extra_len} (extra_len), header {header_len} byte, diikuti key dan value terkompresi")
+                break
             else:
                 print(f"✗ '{key}' tidak ditemukan")
 